@@ -0,0 +1,81 @@
+import html
+import random
+from datetime import datetime, timezone
+
+# Fixture sizes (review cards per page) used by the parse benchmark
+FIXTURE_SIZES = (100, 1000, 5000)
+
+# Timestamp of review 0; every following review is a bit older, so reviews come newest first
+NEWEST_REVIEW_TS = int(datetime(2025, 1, 31, tzinfo=timezone.utc).timestamp())
+REVIEW_SPACING_SECONDS = 1800
+
+WORDS = (
+    "app great crash update login slow battery fast love hate ads premium sync offline "
+    "feature bug screen dark mode notification works fine useless excellent support"
+).split()
+
+
+def _sentence(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high))).capitalize() + "."
+
+
+def review_array(app_id: str, index: int) -> list:
+    """
+    Returns review `index` of `app_id` in the array layout of the reviews RPC (see review_rpc.decode_review).
+    The same index always yields the same review.
+    """
+    rng = random.Random(f"{app_id}:{index}")
+    reviewed_ts = NEWEST_REVIEW_TS - index * REVIEW_SPACING_SECONDS
+    reply = None
+    if rng.random() < 0.3:
+        reply = [None, _sentence(rng, 8, 30), [reviewed_ts + 3600]]
+    return [
+        f"gp:{app_id}:{index}",
+        [f"User {rng.randint(1, 10 ** 6)}"],
+        rng.randint(1, 5),
+        None,
+        " ".join(_sentence(rng, 5, 25) for _ in range(rng.randint(1, 4))),
+        [reviewed_ts],
+        rng.choice((0, 0, 0, 1, 2, 5, 17, 1234)),
+        reply,
+    ]
+
+
+def _format_date(ts: int) -> str:
+    day = datetime.fromtimestamp(ts, tz=timezone.utc)
+    return f"{day:%B} {day.day}, {day.year}"
+
+
+def review_card_html(review: list) -> str:
+    """
+    Renders a review array as the card markup of the reviews dialog, with every element html6 reads.
+    """
+    _, (username,), score, _, content, (reviewed_ts,), thumbs_up_count, reply = review
+    helpful = ""
+    if thumbs_up_count:
+        helpful = f'<div jscontroller="wW2D8b">{thumbs_up_count:,} people found this review helpful</div>'
+    replied = ""
+    if reply:
+        replied = f'<div class="ocpBU"><div class="ras4vb"><div>{html.escape(reply[1])}</div></div></div>'
+    return (
+        '<div class="RHo1pe"><header class="c1bOId">'
+        f'<div class="X5PpBb">{html.escape(username)}</div>'
+        f'<div class="iXRFPc" role="img" aria-label="Rated {score} stars out of five stars"></div>'
+        f'<span class="bp9Aid">{_format_date(reviewed_ts)}</span>'
+        f'</header><div class="h3YV2d">{html.escape(content)}</div>{helpful}{replied}</div>'
+    )
+
+
+def review_page_html(app_id: str, count: int) -> str:
+    """
+    Returns a reviews page with `count` cards, like the output of play9.scrape_play_store_html.
+    """
+    cards = "".join(review_card_html(review_array(app_id, i)) for i in range(count))
+    return f'<html><body><div role="dialog"><div class="odk6He">{cards}</div></div></body></html>'
+
+
+def fixture_pages(sizes=FIXTURE_SIZES, app_id: str = "com.bench.fixture") -> dict:
+    """
+    Returns {size: page HTML} for every fixture size.
+    """
+    return {size: review_page_html(app_id, size) for size in sizes}
@@ -0,0 +1,235 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from benchmarks.fixtures import review_array
+from review_rpc import REVIEWS_RPC_ID, SORT_NEWEST
+
+# Reviews per RPC page when the request does not say
+DEFAULT_PAGE_SIZE = 40
+
+# App page with the controls play9 clicks. The dialog loads reviews through the same RPC the
+# real page uses (so network capture works) and fetches the next page on every wheel event.
+# Like the real page, changing the sort keeps the old cards until the new first page arrives.
+APP_PAGE = """<!doctype html>
+<html><head><title>Mock Play Store</title></head>
+<body>
+<h1 id="app"></h1>
+<button id="see-all">See all reviews</button>
+<div role="dialog" id="dialog" style="display:none">
+  <button id="sort">Most relevant</button>
+  <div id="sort-menu" style="display:none"><span role="menuitem" id="newest">Newest</span></div>
+  <div class="odk6He" id="reviews"></div>
+</div>
+<script>
+const appId = new URLSearchParams(location.search).get("id");
+document.getElementById("app").textContent = appId;
+const list = document.getElementById("reviews");
+let sort = 1, token = null, loading = false, done = false, generation = 0, replace = false;
+
+function escape(text) {
+  const div = document.createElement("div");
+  div.textContent = text;
+  return div.innerHTML;
+}
+
+function card(r) {
+  const date = new Date(r[5][0] * 1000).toLocaleDateString("en-US", {year: "numeric", month: "long", day: "numeric"});
+  const helpful = r[6] ? `<div jscontroller="wW2D8b">${r[6].toLocaleString("en-US")} people found this review helpful</div>` : "";
+  const reply = r[7] ? `<div class="ocpBU"><div class="ras4vb"><div>${escape(r[7][1])}</div></div></div>` : "";
+  return `<div class="RHo1pe"><header class="c1bOId"><div class="X5PpBb">${escape(r[1][0])}</div>`
+    + `<div class="iXRFPc" role="img" aria-label="Rated ${r[2]} stars out of five stars"></div>`
+    + `<span class="bp9Aid">${date}</span></header><div class="h3YV2d">${escape(r[4])}</div>${helpful}${reply}</div>`;
+}
+
+async function loadPage() {
+  if (loading || done) return;
+  loading = true;
+  const current = generation;
+  const params = [null, null, [2, sort, [__PAGE_SIZE__, null, token], null, []], [appId, 7]];
+  const body = "f.req=" + encodeURIComponent(JSON.stringify([[["__RPC_ID__", JSON.stringify(params), null, "generic"]]]));
+  try {
+    const response = await fetch("/_/PlayStoreUi/data/batchexecute?rpcids=__RPC_ID__", {
+      method: "POST", body, headers: {"Content-Type": "application/x-www-form-urlencoded;charset=UTF-8"},
+    });
+    const text = await response.text();
+    if (current !== generation) return;
+    const envelope = JSON.parse(text.slice(text.indexOf("[")));
+    const payload = JSON.parse(envelope[0][2]);
+    if (replace) {
+      list.innerHTML = "";
+      replace = false;
+    }
+    list.insertAdjacentHTML("beforeend", payload[0].map(card).join(""));
+    token = payload[1][1];
+    done = !token;
+  } finally {
+    loading = false;
+  }
+}
+
+function reset(newSort) {
+  generation++;
+  sort = newSort; token = null; done = false; loading = false; replace = true;
+  loadPage();
+}
+
+document.getElementById("see-all").onclick = () => {
+  document.getElementById("dialog").style.display = "block";
+  reset(1);
+};
+document.getElementById("sort").onclick = () => { document.getElementById("sort-menu").style.display = "block"; };
+document.getElementById("newest").onclick = () => {
+  document.getElementById("sort-menu").style.display = "none";
+  reset(__SORT_NEWEST__);
+};
+window.addEventListener("wheel", () => loadPage());
+</script>
+</body></html>
+"""
+
+
+def rpc_response(app_id: str, offset: int, count: int, total: int, stars: int = None, sort: int = SORT_NEWEST) -> str:
+    """
+    Returns a batchexecute response body holding reviews `offset` to `offset + count` of `app_id`,
+    counting only reviews rated `stars` if given. The continuation token is the offset of the next page.
+    Reviews are newest first for SORT_NEWEST and oldest first for any other `sort`, so reading the
+    wrong sort shows.
+    """
+    indexes = range(total) if sort == SORT_NEWEST else range(total - 1, -1, -1)
+    if stars:
+        matching = [review for review in (review_array(app_id, index) for index in indexes) if review[2] == stars]
+        available = len(matching)
+        reviews = matching[offset:offset + count]
+    else:
+        available = total
+        reviews = [review_array(app_id, index) for index in indexes[offset:offset + count]]
+    end = offset + len(reviews)
+    token = str(end) if end < available else None
+    payload = json.dumps([reviews, [None, token], None])
+    envelope = json.dumps([["wrb.fr", REVIEWS_RPC_ID, payload, None, None, None, "generic"]])
+    return f")]}}'\n\n{len(envelope)}\n{envelope}\n"
+
+
+class MockPlayStoreHandler(BaseHTTPRequestHandler):
+    server_version = "MockPlayStore/1.0"
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output readable
+
+    def _send(self, status: int, body: str, content_type: str):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client stopped reading, e.g. a cancelled benchmark stream
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != "/store/apps/details":
+            self._send(404, "Not found", "text/plain")
+            return
+        page = (
+            APP_PAGE.replace("__RPC_ID__", REVIEWS_RPC_ID)
+            .replace("__SORT_NEWEST__", str(SORT_NEWEST))
+            .replace("__PAGE_SIZE__", str(self.server.page_size))
+        )
+        self._send(200, page, "text/html; charset=utf-8")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/_/PlayStoreUi/data/batchexecute":
+            self._send(404, "Not found", "text/plain")
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        try:
+            calls = json.loads(parse_qs(body)["f.req"][0])[0]
+            params = json.loads(next(call[1] for call in calls if call[0] == REVIEWS_RPC_ID))
+            app_id = params[3][0]
+            sort = params[2][1]
+            count, _, token = params[2][2]
+            star_filter = params[2][4] if len(params[2]) > 4 else None
+            stars = star_filter[1] if isinstance(star_filter, list) and len(star_filter) > 1 else None
+        except (KeyError, IndexError, StopIteration, TypeError, ValueError):
+            self._send(400, "Bad request", "text/plain")
+            return
+
+        self.server.rpc_calls += 1
+        if self.server.rpc_calls <= self.server.failing_calls:
+            self._send(503, "Service unavailable", "text/plain")
+            return
+        if self.server.rpc_delay:
+            time.sleep(self.server.rpc_delay)
+        offset = int(token) if token else 0
+        body = rpc_response(app_id, offset, count or self.server.page_size, self.server.total_reviews, stars, sort)
+        self._send(200, body, "application/json; charset=utf-8")
+
+
+class MockPlayStore:
+    """
+    Local stand-in for the Play Store serving an app page with an infinite-scroll reviews dialog
+    and the reviews RPC, both backed by the same synthetic reviews. Every app has `total_reviews`
+    reviews; `rpc_delay` seconds are added to each RPC to mimic network latency, and the first
+    `failing_calls` RPCs are answered with a 503 to exercise retries.
+    Point PLAY_STORE_URL at `url` before importing play9 or http_scraper.
+    """
+
+    def __init__(self, total_reviews: int = 1000, page_size: int = DEFAULT_PAGE_SIZE, rpc_delay: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0, failing_calls: int = 0):
+        self._server = ThreadingHTTPServer((host, port), MockPlayStoreHandler)
+        self._server.daemon_threads = True
+        self._server.total_reviews = total_reviews
+        self._server.page_size = page_size
+        self._server.rpc_delay = rpc_delay
+        self._server.rpc_calls = 0
+        self._server.failing_calls = failing_calls
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def rpc_calls(self) -> int:
+        return self._server.rpc_calls
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-play-store", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the mock Play Store until interrupted.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--reviews", type=int, default=1000, help="Reviews per app")
+    parser.add_argument("--rpc-delay", type=float, default=0.0, help="Seconds added to every reviews RPC")
+    args = parser.parse_args()
+
+    server = MockPlayStore(total_reviews=args.reviews, rpc_delay=args.rpc_delay, port=args.port).start()
+    print(f"Mock Play Store listening on {server.url} (set PLAY_STORE_URL={server.url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
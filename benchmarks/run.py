@@ -0,0 +1,383 @@
+"""
+Offline benchmark suite. Runs every stage against local stand-ins only: HTML fixtures for the
+parser, MockPlayStore for the HTTP and browser scrapers and a local Postgres for inserts.
+
+    python -m benchmarks.run                         # every stage that can run here
+    python -m benchmarks.run --stages parse,http     # a subset
+    python -m benchmarks.run --save-baseline         # store the results as the new baseline
+    python -m benchmarks.run --compare               # fail if throughput regressed vs. the baseline
+
+Database stages need BENCH_DB_URL, a throwaway database: the `reviews` and `scrape_jobs`
+tables are created in it if missing and the benchmark app's rows are deleted afterwards.
+The browser stages need Playwright's Chromium.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from uuid import uuid4
+
+from benchmarks.fixtures import FIXTURE_SIZES, fixture_pages
+from benchmarks.mock_play_store import MockPlayStore
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+
+STAGES = ("parse", "normalize", "http", "insert", "browser", "end_to_end")
+
+# Throughput may drop this much below the baseline before --compare fails
+DEFAULT_TOLERANCE = 0.2
+
+BENCH_APP_ID = "com.bench.app"
+
+# Minimal versions of the tables the service expects to exist
+BENCH_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS reviews (
+        review_id TEXT PRIMARY KEY,
+        app_id TEXT NOT NULL,
+        user_name VARCHAR(255),
+        content TEXT,
+        score INTEGER,
+        thumbs_up_count INTEGER,
+        reviewed_at TIMESTAMP,
+        reply_content TEXT,
+        replied_at TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS scrape_jobs (
+        job_id TEXT PRIMARY KEY,
+        app_id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        started_at TIMESTAMPTZ,
+        created_at TIMESTAMPTZ,
+        completed_at TIMESTAMPTZ,
+        total_reviews INTEGER,
+        error_message TEXT
+    )
+    ''',
+]
+
+
+def summarize(items: int, seconds: float, latencies: list, unit: str) -> dict:
+    """
+    Returns the throughput of `items` processed in `seconds` and the p50/p95/max of `latencies`
+    (seconds per operation), in milliseconds.
+    """
+    result = {
+        "items": items,
+        "seconds": round(seconds, 4),
+        "throughput": round(items / seconds, 1) if seconds > 0 else None,
+        "unit": unit,
+    }
+    if latencies:
+        ordered = sorted(latencies)
+        result["p50_ms"] = round(statistics.median(ordered) * 1000, 3)
+        result["p95_ms"] = round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3)
+        result["max_ms"] = round(ordered[-1] * 1000, 3)
+    return result
+
+
+def bench_parse(args) -> dict:
+    from html6 import available_backends, parse_reviews
+
+    results = {}
+    for size, html in fixture_pages(args.sizes).items():
+        megabytes = len(html.encode("utf-8")) / (1024 * 1024)
+        for backend in available_backends():
+            parse_reviews(html, backend)  # Warm up
+            latencies = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                reviews = parse_reviews(html, backend)
+                latencies.append(time.perf_counter() - start)
+            assert len(reviews) == size, f"{backend} parsed {len(reviews)} of {size} reviews"
+            result = summarize(size * args.repeat, sum(latencies), latencies, "reviews/s")
+            result["mb_per_second"] = round(megabytes * args.repeat / sum(latencies), 2)
+            results[f"parse.{backend}.{size}"] = result
+    return results
+
+
+def bench_normalize(args) -> dict:
+    from html6 import parse_reviews
+    from review_rows import normalize_reviews
+
+    results = {}
+    for size, html in fixture_pages(args.sizes).items():
+        reviews = parse_reviews(html)
+        latencies = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            normalize_reviews(BENCH_APP_ID, reviews)
+            latencies.append(time.perf_counter() - start)
+        results[f"normalize.{size}"] = summarize(size * args.repeat, sum(latencies), latencies, "reviews/s")
+    return results
+
+
+async def bench_http(args, server) -> dict:
+    from http_scraper import HttpReviewFetcher
+
+    fetcher = HttpReviewFetcher(base_url=server.url)
+    try:
+        latencies = []
+        total = 0
+        start = time.perf_counter()
+        last = start
+        async for reviews in fetcher.stream_reviews(BENCH_APP_ID, max_reviews=args.reviews, batch_size=args.batch_size):
+            now = time.perf_counter()
+            latencies.append(now - last)
+            last = now
+            total += len(reviews)
+        return {"http.stream": summarize(total, time.perf_counter() - start, latencies, "reviews/s")}
+    finally:
+        await fetcher.close()
+
+
+async def prepare_database(db_url: str):
+    import asyncpg
+
+    conn = await asyncpg.connect(db_url)
+    try:
+        for statement in BENCH_SCHEMA:
+            await conn.execute(statement)
+        await conn.execute("DELETE FROM reviews WHERE app_id = $1", BENCH_APP_ID)
+        await conn.execute("DELETE FROM scrape_jobs WHERE app_id = $1", BENCH_APP_ID)
+        if await conn.fetchval("SELECT to_regclass('app_scrape_state') IS NOT NULL"):
+            await conn.execute("DELETE FROM app_scrape_state WHERE app_id = $1", BENCH_APP_ID)
+        if await conn.fetchval("SELECT to_regclass('review_daily_stats') IS NOT NULL"):
+            await conn.execute("DELETE FROM review_daily_stats WHERE app_id = $1", BENCH_APP_ID)
+    finally:
+        await conn.close()
+
+
+async def bench_insert(args) -> dict:
+    from review_rows import parse_review_rows
+    from benchmarks.fixtures import review_page_html
+    from scraping_task import insert_rows_into_db
+
+    rows = parse_review_rows(BENCH_APP_ID, review_page_html(BENCH_APP_ID, args.reviews))
+    batches = [rows[i:i + args.batch_size] for i in range(0, len(rows), args.batch_size)]
+
+    results = {}
+    # First pass inserts new rows, the second one updates every row in place
+    for label in ("insert.new", "insert.upsert"):
+        latencies = []
+        for batch in batches:
+            start = time.perf_counter()
+            await insert_rows_into_db(BENCH_APP_ID, batch)
+            latencies.append(time.perf_counter() - start)
+        results[label] = summarize(len(rows), sum(latencies), latencies, "rows/s")
+    return results
+
+
+async def bench_browser(args) -> dict:
+    from play9 import stream_play_store_reviews
+    from page_profile import PageProfile
+
+    results = {}
+    for extraction in ("cards", "network"):
+        stats = {}
+        latencies = []
+        total = 0
+        start = time.perf_counter()
+        last = start
+        batches = stream_play_store_reviews(
+            BENCH_APP_ID, max_seconds=args.max_seconds, batch_size=args.batch_size,
+            profile=PageProfile.from_env(), extraction=extraction, stats=stats, target_reviews=args.reviews,
+        )
+        async for batch in batches:
+            now = time.perf_counter()
+            latencies.append(now - last)
+            last = now
+            total += len(batch)
+        result = summarize(total, time.perf_counter() - start, latencies, "reviews/s")
+        result["scroll_iterations"] = stats.get("scroll_iterations", 0)
+        result["stop_reason"] = stats.get("stop_reason")
+        result["stage_seconds"] = {stage: round(seconds, 3) for stage, seconds in stats.get("stage_seconds", {}).items()}
+        results[f"browser.{extraction}"] = result
+    return results
+
+
+async def bench_end_to_end(args, backends) -> dict:
+    import scraping_task
+    from database import get_status_pool
+    from http_scraper import HttpReviewFetcher
+
+    fetcher = HttpReviewFetcher(base_url=os.environ["PLAY_STORE_URL"])
+    pool = await get_status_pool()
+    results = {}
+    try:
+        for backend in backends:
+            job_id = str(uuid4())
+            async with pool.acquire() as conn:
+                now = datetime.now(timezone.utc)
+                await conn.execute('''
+                    INSERT INTO scrape_jobs (job_id, app_id, status, started_at, created_at)
+                    VALUES ($1, $2, $3, $4, $5)
+                ''', job_id, BENCH_APP_ID, "pending", now, now)
+
+            start = time.perf_counter()
+            await scraping_task.scrape_reviews_task(
+                {"http_fetcher": fetcher}, BENCH_APP_ID, job_id, backend=backend, target_reviews=args.reviews
+            )
+            seconds = time.perf_counter() - start
+
+            async with pool.acquire() as conn:
+                job = await conn.fetchrow(
+                    "SELECT status, total_reviews, error_message, stage_timings, stop_reason FROM scrape_jobs WHERE job_id = $1",
+                    job_id,
+                )
+            if job["status"] != "completed":
+                raise RuntimeError(f"End-to-end {backend} job failed: {job['error_message']}")
+            result = summarize(job["total_reviews"] or 0, seconds, [], "reviews/s")
+            result["stage_seconds"] = json.loads(job["stage_timings"] or "{}")
+            result["stop_reason"] = job["stop_reason"]
+            results[f"end_to_end.{backend}"] = result
+    finally:
+        await fetcher.close()
+    return results
+
+
+def browser_available() -> bool:
+    try:
+        from playwright.sync_api import sync_playwright
+        with sync_playwright() as playwright:
+            return Path(playwright.chromium.executable_path).exists()
+    except Exception:
+        return False
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns a line per benchmark whose throughput fell more than `tolerance` below the baseline.
+    """
+    regressions = []
+    for name, old in baseline.get("results", {}).items():
+        new = results.get(name)
+        if not new or not old.get("throughput") or not new.get("throughput"):
+            continue
+        ratio = new["throughput"] / old["throughput"]
+        marker = ""
+        if ratio < 1 - tolerance:
+            regressions.append(f"{name}: {new['throughput']} {new['unit']} vs. baseline {old['throughput']}")
+            marker = "  REGRESSION"
+        print(f"  {name:<32} {ratio:6.2f}x baseline{marker}")
+    return regressions
+
+
+def print_results(results: dict):
+    for name, result in results.items():
+        latency = f"  p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms" if "p50_ms" in result else ""
+        print(f"  {name:<32} {result['throughput']:>12} {result['unit']}{latency}")
+        if result.get("stage_seconds"):
+            print(f"  {'':<32} stages: {result['stage_seconds']}")
+
+
+async def run(args) -> dict:
+    results = {}
+    db_url = os.getenv("BENCH_DB_URL")
+
+    with MockPlayStore(total_reviews=args.reviews, rpc_delay=args.rpc_delay) as server:
+        # Every module reading these settings is imported lazily, after they are set
+        os.environ["PLAY_STORE_URL"] = server.url
+        os.environ["DB_URL"] = db_url or "postgresql://unused"
+        os.environ["ALLOWED_HOSTS"] = ""  # The mock server is not a Play Store host
+
+        skipped = []
+        for stage in args.stages:
+            if stage in ("insert", "end_to_end") and not db_url:
+                skipped.append(f"{stage} (BENCH_DB_URL not set)")
+                continue
+            if stage == "browser" and not browser_available():
+                skipped.append(f"{stage} (Chromium not installed)")
+                continue
+
+            print(f"Running {stage}...")
+            if stage == "parse":
+                results.update(bench_parse(args))
+            elif stage == "normalize":
+                results.update(bench_normalize(args))
+            elif stage == "http":
+                results.update(await bench_http(args, server))
+            elif stage == "insert":
+                await prepare_database(db_url)
+                results.update(await bench_insert(args))
+            elif stage == "browser":
+                results.update(await bench_browser(args))
+            elif stage == "end_to_end":
+                await prepare_database(db_url)
+                backends = ["http"] + (["browser"] if browser_available() else [])
+                results.update(await bench_end_to_end(args, backends))
+
+        if db_url and any(stage in ("insert", "end_to_end") for stage in args.stages):
+            from database import close_db
+            await prepare_database(db_url)  # Leave no benchmark rows behind
+            await close_db()
+
+    for stage in skipped:
+        print(f"Skipped {stage}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline performance benchmarks.")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma separated subset of {', '.join(STAGES)}")
+    parser.add_argument("--sizes", default=",".join(map(str, FIXTURE_SIZES)), help="Fixture sizes in review cards")
+    parser.add_argument("--repeat", type=int, default=5, help="Parses per fixture and backend")
+    parser.add_argument("--reviews", type=int, default=2000, help="Reviews per app on the mock server")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--rpc-delay", type=float, default=0.0, help="Seconds added to every mock reviews RPC")
+    parser.add_argument("--max-seconds", type=float, default=300, help="Time budget of each browser scrape")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="Exit with status 1 on a throughput regression")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    args.stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+    args.sizes = tuple(int(size) for size in args.sizes.split(","))
+
+    results = asyncio.run(run(args))
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {"reviews": args.reviews, "batch_size": args.batch_size, "repeat": args.repeat,
+                     "rpc_delay": args.rpc_delay},
+        "results": results,
+    }
+
+    print("Results:")
+    print_results(results)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+
+    if args.compare:
+        baseline_path = Path(args.baseline)
+        if not baseline_path.exists():
+            print(f"No baseline at {baseline_path}; run with --save-baseline first")
+            sys.exit(1)
+        print(f"Compared with {baseline_path}:")
+        regressions = compare(results, json.loads(baseline_path.read_text()), args.tolerance)
+        if regressions:
+            print("Throughput regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
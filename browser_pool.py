@@ -0,0 +1,178 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from uuid import uuid4
+
+import psutil
+from playwright.async_api import async_playwright
+
+logger = logging.getLogger(__name__)
+
+
+class PooledBrowser:
+    """
+    A launched Chromium instance plus the bookkeeping the pool needs to decide when to recycle it.
+    """
+
+    def __init__(self, browser, marker: str):
+        self.browser = browser
+        self.marker = marker  # Unique command-line switch used to find the process tree
+        self.jobs = 0
+
+
+def _process_tree_rss_mb(marker: str) -> float:
+    """
+    Returns the resident memory (in MB) of the Chromium process tree tagged with `marker`.
+    """
+    tagged = {}
+    for proc in psutil.process_iter(["pid", "ppid", "cmdline"]):
+        cmdline = proc.info.get("cmdline") or []
+        if any(marker in arg for arg in cmdline):
+            tagged[proc.info["pid"]] = proc
+
+    # Only start from the top-most tagged processes so children are not counted twice
+    roots = [proc for proc in tagged.values() if proc.info["ppid"] not in tagged]
+
+    seen = set()
+    total = 0
+    for root in roots:
+        try:
+            tree = [root] + root.children(recursive=True)
+        except psutil.Error:
+            continue
+        for proc in tree:
+            if proc.pid in seen:
+                continue
+            seen.add(proc.pid)
+            try:
+                total += proc.memory_info().rss
+            except psutil.Error:
+                pass  # Process exited while we were walking the tree
+
+    return total / (1024 * 1024)
+
+
+class BrowserPool:
+    """
+    Keeps a fixed number of headless Chromium browsers alive for the lifetime of the worker.
+    Each job checks out one browser and gets a fresh, isolated BrowserContext on it.
+    Browsers are relaunched after `max_jobs_per_browser` jobs or once their process tree
+    grows past `max_rss_mb`.
+    """
+
+    def __init__(self, size: int = 2, max_jobs_per_browser: int = 50, max_rss_mb: int = 1024, **launch_options):
+        if size < 1:
+            raise ValueError("Browser pool size must be at least 1")
+        self.size = size
+        self.max_jobs_per_browser = max_jobs_per_browser
+        self.max_rss_mb = max_rss_mb
+        self.launch_options = {"headless": True, **launch_options}
+
+        self._playwright = None
+        self._idle = None
+        self._markers = set()  # Markers of every launched browser, idle or checked out
+        self.recycled = 0
+
+    async def start(self):
+        """
+        Starts Playwright and launches `size` browsers.
+        """
+        self._playwright = await async_playwright().start()
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            self._idle.put_nowait(await self._launch())
+        logger.info(f"Browser pool started with {self.size} browser(s)")
+
+    async def close(self):
+        """
+        Closes every idle browser and stops Playwright.
+        """
+        if self._idle is not None:
+            while not self._idle.empty():
+                await self._close_browser(self._idle.get_nowait())
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        logger.info("Browser pool closed")
+
+    @property
+    def available(self) -> int:
+        return self._idle.qsize() if self._idle is not None else 0
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "available": self.available,
+            "in_use": self.size - self.available,
+            "recycled": self.recycled,
+        }
+
+    def rss_mb(self) -> float:
+        """
+        Returns the resident memory (in MB) of every browser of the pool. Blocks while scanning
+        the process table, so call it from a thread in async code.
+        """
+        return sum(_process_tree_rss_mb(marker) for marker in list(self._markers))
+
+    @asynccontextmanager
+    async def context(self, **context_options):
+        """
+        Checks out a browser and yields a new BrowserContext on it.
+        The context is closed and the browser returned to the pool (or recycled) on exit.
+        """
+        if self._idle is None:
+            raise RuntimeError("Browser pool has not been started")
+
+        pooled = await self._idle.get()
+        context = None
+        try:
+            if not pooled.browser.is_connected():
+                logger.warning("Pooled browser disconnected, relaunching")
+                pooled = await self._replace(pooled)
+            context = await pooled.browser.new_context(**context_options)
+            yield context
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception as e:
+                    logger.warning(f"Error closing browser context: {e}")
+            pooled.jobs += 1
+            try:
+                pooled = await self._maybe_recycle(pooled)
+            except Exception as e:
+                # Keep the slot; the next checkout relaunches it if it is unusable
+                logger.error(f"Error recycling browser: {e}")
+            self._idle.put_nowait(pooled)
+
+    async def _launch(self) -> PooledBrowser:
+        marker = uuid4().hex
+        args = list(self.launch_options.get("args", [])) + [f"--browser-pool-id={marker}"]
+        browser = await self._playwright.chromium.launch(**{**self.launch_options, "args": args})
+        self._markers.add(marker)
+        return PooledBrowser(browser, marker)
+
+    async def _close_browser(self, pooled: PooledBrowser):
+        self._markers.discard(pooled.marker)
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            logger.warning(f"Error closing browser: {e}")
+
+    async def _replace(self, pooled: PooledBrowser) -> PooledBrowser:
+        await self._close_browser(pooled)
+        self.recycled += 1
+        return await self._launch()
+
+    async def _maybe_recycle(self, pooled: PooledBrowser) -> PooledBrowser:
+        if self.max_jobs_per_browser and pooled.jobs >= self.max_jobs_per_browser:
+            logger.info(f"Recycling browser after {pooled.jobs} jobs")
+            return await self._replace(pooled)
+
+        if self.max_rss_mb:
+            rss_mb = await asyncio.to_thread(_process_tree_rss_mb, pooled.marker)
+            if rss_mb > self.max_rss_mb:
+                logger.info(f"Recycling browser at {rss_mb:.0f} MB RSS (limit {self.max_rss_mb} MB)")
+                return await self._replace(pooled)
+
+        return pooled
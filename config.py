@@ -1,7 +1,4 @@
 
-import psycopg2
-import os
-
 from dotenv import load_dotenv
 import os
 from pathlib import Path
@@ -17,6 +14,5 @@ class Settings:
         self.DATABASE_URL = os.environ.get('DB_URL')
         if not self.DATABASE_URL:
             raise ValueError("DATABASE_URL environment variable is not set")
-        print(f"Raw DATABASE_URL: {self.DATABASE_URL}")  # Debug print
 
 settings = Settings()
\ No newline at end of file
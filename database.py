@@ -1,35 +1,329 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from functools import partial
+from time import perf_counter
+
 import asyncpg
 from config import settings
+from metrics import DB_POOL_CONNECTIONS, DB_POOL_WAIT_SECONDS, DB_QUERY_SECONDS
+from review_rows import NO_REPLY_CONTENT
+
+logger = logging.getLogger(__name__)
+
+# Connections per pool role, as (min, max): "review" reads and writes reviews, "status" updates scrape_jobs.
+# Every web and worker process opens its own pools, so keep these small on a shared database.
+POOL_SIZES = {
+    "review": (int(os.getenv("DB_REVIEW_POOL_MIN_SIZE", "1")), int(os.getenv("DB_REVIEW_POOL_MAX_SIZE", "5"))),
+    "status": (int(os.getenv("DB_STATUS_POOL_MIN_SIZE", "1")), int(os.getenv("DB_STATUS_POOL_MAX_SIZE", "2"))),
+}
+DB_MAX_QUERIES = int(os.getenv("DB_MAX_QUERIES", "50000"))  # Replace a connection after this many queries
+DB_MAX_INACTIVE_SECONDS = float(os.getenv("DB_MAX_INACTIVE_SECONDS", "300"))  # Close connections idle this long
+DB_CONNECTION_MAX_AGE = float(os.getenv("DB_CONNECTION_MAX_AGE", "1800"))  # Replace connections this old, 0 to disable
+
+pools = {}
+_init_lock = asyncio.Lock()
+
+# Hot queries, run as prepared statements kept on each connection (see run_prepared)
+STATEMENTS = {
+    "create_job": '''
+        INSERT INTO scrape_jobs (job_id, app_id, status, started_at, created_at)
+        VALUES ($1, $2, $3, $4, $4)
+    ''',
+    "update_job_status": '''
+        UPDATE scrape_jobs
+        SET status = $1,
+            error_message = $2,
+            total_reviews = COALESCE($3, total_reviews),
+            completed_at = $4,
+            stage_timings = COALESCE($6::jsonb, stage_timings),
+            stop_reason = COALESCE($7, stop_reason)
+        WHERE job_id = $5
+    ''',
+    "get_job": '''
+        SELECT job_id, status, started_at, completed_at,
+               total_reviews, error_message, stage_timings, stop_reason
+        FROM scrape_jobs
+        WHERE job_id = $1
+    ''',
+    "get_high_water_mark": '''
+        SELECT newest_review_id, newest_reviewed_at
+        FROM app_scrape_state
+        WHERE app_id = $1
+    ''',
+    "update_high_water_mark": '''
+        INSERT INTO app_scrape_state (app_id, newest_review_id, newest_reviewed_at, updated_at)
+        VALUES ($1, $2, $3, now())
+        ON CONFLICT (app_id)
+        DO UPDATE SET
+            newest_review_id = EXCLUDED.newest_review_id,
+            newest_reviewed_at = EXCLUDED.newest_reviewed_at,
+            updated_at = EXCLUDED.updated_at
+        WHERE app_scrape_state.newest_reviewed_at IS NULL
+           OR EXCLUDED.newest_reviewed_at >= app_scrape_state.newest_reviewed_at
+    ''',
+    # Dashboard reads of the review_daily_stats rollup, see review_queries. Reviews whose score
+    # could not be parsed are stored (and rolled up) as 0 and left out of both.
+    "review_summary": '''
+        SELECT score, sum(reviews) AS reviews, sum(replied) AS replied
+        FROM review_daily_stats
+        WHERE app_id = $1
+          AND score BETWEEN 1 AND 5
+          AND ($2::date IS NULL OR day >= $2)
+          AND ($3::date IS NULL OR day <= $3)
+        GROUP BY score
+    ''',
+    "daily_review_counts": '''
+        SELECT day, sum(reviews) AS reviews, sum(replied) AS replied,
+               sum(score * reviews)::float8 / NULLIF(sum(reviews), 0) AS average_score
+        FROM review_daily_stats
+        WHERE app_id = $1
+          AND score BETWEEN 1 AND 5
+          AND ($2::date IS NULL OR day >= $2)
+          AND ($3::date IS NULL OR day <= $3)
+        GROUP BY day
+        HAVING sum(reviews) > 0
+        ORDER BY day
+    ''',
+}
+
+
+class ServiceConnection(asyncpg.Connection):
+    """
+    Pooled connection remembering its pool role, its age and the hot statements prepared on it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.role = None
+        self.created_at = time.monotonic()
+        self.statements = {}
 
-review_pool = None
-status_pool = None
+    async def prepared(self, name: str):
+        statement = self.statements.get(name)
+        if statement is None:
+            statement = self.statements[name] = await self.prepare(STATEMENTS[name])
+        return statement
+
+# Tables and columns owned by this service beyond `reviews` and `scrape_jobs`, created on startup if missing
+SCHEMA_STATEMENTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS app_scrape_state (
+        app_id TEXT PRIMARY KEY,
+        newest_review_id TEXT,
+        newest_reviewed_at TIMESTAMP,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    ''',
+    # Seconds spent per stage (navigate, scroll, parse, insert, ...) of a finished job
+    '''
+    ALTER TABLE scrape_jobs ADD COLUMN IF NOT EXISTS stage_timings JSONB
+    ''',
+    # Why scraping stopped: target_reached, time_budget, exhausted, high_water_mark, error or cancelled
+    '''
+    ALTER TABLE scrape_jobs ADD COLUMN IF NOT EXISTS stop_reason TEXT
+    ''',
+    # Digest of the HTML snapshot a review was last parsed from (see snapshot_store), so reparse.py
+    # can replace the rows of a snapshot whose reviews now parse differently
+    '''
+    ALTER TABLE reviews ADD COLUMN IF NOT EXISTS snapshot_digest TEXT
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS reviews_snapshot_digest_idx
+    ON reviews (snapshot_digest)
+    WHERE snapshot_digest IS NOT NULL
+    ''',
+    # Keyset pagination of an app's reviews, newest first, optionally by score (see review_queries).
+    # Built once on the first startup; writes to `reviews` wait while it builds.
+    '''
+    CREATE INDEX IF NOT EXISTS reviews_app_reviewed_at_idx
+    ON reviews (app_id, reviewed_at DESC, review_id DESC)
+    WHERE reviewed_at IS NOT NULL
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS reviews_app_score_reviewed_at_idx
+    ON reviews (app_id, score, reviewed_at DESC, review_id DESC)
+    WHERE reviewed_at IS NOT NULL
+    ''',
+    # Reviews and replied reviews per app, day and score, kept up to date by insert_review_rows
+    '''
+    CREATE TABLE IF NOT EXISTS review_daily_stats (
+        app_id TEXT NOT NULL,
+        day DATE NOT NULL,
+        score SMALLINT NOT NULL,
+        reviews INTEGER NOT NULL DEFAULT 0,
+        replied INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (app_id, day, score)
+    )
+    ''',
+    # Backfill from the reviews stored before the rollup existed; a no-op once it has rows
+    f'''
+    INSERT INTO review_daily_stats (app_id, day, score, reviews, replied)
+    SELECT app_id, reviewed_at::date, COALESCE(score, 0), count(*),
+           count(*) FILTER (WHERE COALESCE(reply_content, '{NO_REPLY_CONTENT}') <> '{NO_REPLY_CONTENT}')
+    FROM reviews
+    WHERE reviewed_at IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM review_daily_stats)
+    GROUP BY 1, 2, 3
+    ''',
+]
+
+# Arbitrary key serializing schema changes between replicas starting at the same time
+SCHEMA_LOCK_ID = 7301845
+
+async def ensure_schema(pool):
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock($1)", SCHEMA_LOCK_ID)
+            for statement in SCHEMA_STATEMENTS:
+                await conn.execute(statement)
+
+async def _init_connection(role: str, conn):
+    conn.role = role
+    # Latency of every query outside run_prepared, which times its statements itself
+    conn.add_query_logger(lambda query: DB_QUERY_SECONDS.labels(role, "other").observe(query.elapsed))
+
+async def create_pool(role: str):
+    min_size, max_size = POOL_SIZES[role]
+    pool = await asyncpg.create_pool(
+        settings.DATABASE_URL,
+        min_size=min(min_size, max_size),
+        max_size=max_size,
+        max_queries=DB_MAX_QUERIES,
+        max_inactive_connection_lifetime=DB_MAX_INACTIVE_SECONDS,
+        connection_class=ServiceConnection,
+        init=partial(_init_connection, role),
+    )
+    # Sampled whenever /metrics is scraped
+    DB_POOL_CONNECTIONS.labels(role, "in_use").set_function(lambda: pool.get_size() - pool.get_idle_size())
+    DB_POOL_CONNECTIONS.labels(role, "idle").set_function(pool.get_idle_size)
+    return pool
 
 async def init_db():
-    global review_pool, status_pool
-    
-    print(f"Attempting to connect with URL: {settings.DATABASE_URL}")
-    
     if not settings.DATABASE_URL:
         raise ValueError("DATABASE_URL is not set in environment variables")
         
     if not settings.DATABASE_URL.startswith(('postgresql://', 'postgres://')):
         raise ValueError(f"Invalid DATABASE_URL format. Must start with postgresql:// or postgres://")
-    
-    review_pool = await asyncpg.create_pool(settings.DATABASE_URL)
-    status_pool = await asyncpg.create_pool(settings.DATABASE_URL)
+
+    async with _init_lock:
+        if pools:
+            return  # Initialized while waiting for the lock
+        logger.info(f"Connecting to Postgres with pool sizes {POOL_SIZES}")
+        created = {}
+        try:
+            for role in POOL_SIZES:
+                created[role] = await create_pool(role)
+            await ensure_schema(created["review"])
+        except BaseException:
+            for pool in created.values():
+                await pool.close()
+            raise
+        pools.update(created)
 
 async def close_db():
-    if review_pool:
-        await review_pool.close()
-    if status_pool:
-        await status_pool.close()
+    for pool in pools.values():
+        await pool.close()
+    pools.clear()
 
-async def get_review_pool():
-    if review_pool is None:
+async def get_pool(role: str):
+    if not pools:
         await init_db()
-    return review_pool
+    return pools[role]
+
+async def get_review_pool():
+    return await get_pool("review")
 
 async def get_status_pool():
-    if status_pool is None:
-        await init_db()
-    return status_pool
\ No newline at end of file
+    return await get_pool("status")
+
+@asynccontextmanager
+async def acquire(role: str = "review"):
+    """
+    Acquires a connection from the pool of `role`, recording the wait in db_pool_acquire_seconds.
+    Connections older than DB_CONNECTION_MAX_AGE are closed when released; the pool opens a
+    fresh one on demand, so long-lived replicas follow failovers and spread over database hosts.
+    """
+    pool = await get_pool(role)
+    waiting = perf_counter()
+    async with pool.acquire() as conn:
+        DB_POOL_WAIT_SECONDS.labels(role).observe(perf_counter() - waiting)
+        yield conn
+        if DB_CONNECTION_MAX_AGE and time.monotonic() - conn.created_at > DB_CONNECTION_MAX_AGE:
+            await conn.close()
+
+async def run_prepared(conn, name: str, *args, method: str = "fetch"):
+    """
+    Runs the hot query `name` from STATEMENTS on `conn` as a prepared statement, prepared once
+    per connection, and records its latency in db_query_seconds.
+
+    :param method: The PreparedStatement method to call: "fetch", "fetchrow" or "fetchval".
+    """
+    statement = await conn.prepared(name)
+    started = perf_counter()
+    try:
+        return await getattr(statement, method)(*args)
+    finally:
+        DB_QUERY_SECONDS.labels(conn.role, name).observe(perf_counter() - started)
+
+async def create_job(job_id: str, app_id: str, status: str = "pending"):
+    """
+    Inserts a new scrape job. Returns its started_at time.
+    """
+    started_at = datetime.now(timezone.utc)
+    async with acquire("status") as conn:
+        await run_prepared(conn, "create_job", job_id, app_id, status, started_at)
+    return started_at
+
+async def get_job(job_id: str):
+    """
+    Returns the job's row from scrape_jobs as a dict, or None if it does not exist.
+    """
+    async with acquire("status") as conn:
+        job = await run_prepared(conn, "get_job", job_id, method="fetchrow")
+    return dict(job) if job else None
+
+async def update_job_status(job_id: str, status: str, error_message: str = None, total_reviews: int = None,
+                            stage_timings: dict = None, stop_reason: str = None):
+    """
+    Updates the job status in the database. Returns a response indicating success.
+    `stage_timings` (stage -> seconds, see metrics.stage_breakdown) and `stop_reason`
+    (why scraping stopped) are stored when given.
+    """
+    try:
+        # Determine completion time
+        completed_at = datetime.now(timezone.utc) if status in ['completed', 'failed'] else None
+
+        async with acquire("status") as conn:
+            await run_prepared(
+                conn, "update_job_status", status, error_message, total_reviews, completed_at, job_id,
+                json.dumps(stage_timings) if stage_timings is not None else None, stop_reason,
+                method="fetchval",
+            )
+
+        # Explicitly return a success response
+        return {"status": "success", "message": "Job status updated successfully", "completed_at": completed_at}
+
+    except Exception as e:
+        # Log the error and return a failure response
+        logger.error(f"Error updating job status: {e}")
+        return {"status": "error", "message": str(e)}
+
+async def get_high_water_mark(app_id: str):
+    """
+    Returns the stored high-water mark of `app_id` as a dict, or None if the app was never scraped.
+    """
+    async with acquire("review") as conn:
+        row = await run_prepared(conn, "get_high_water_mark", app_id, method="fetchrow")
+    return dict(row) if row else None
+
+async def update_high_water_mark(app_id: str, review_id: str, reviewed_at):
+    """
+    Stores the newest review seen for `app_id`. The mark never moves back to an older date.
+    """
+    async with acquire("review") as conn:
+        await run_prepared(conn, "update_high_water_mark", app_id, review_id, reviewed_at, method="fetchval")
@@ -1,63 +1,204 @@
 from bs4 import BeautifulSoup
 import json
 import asyncio
+import os
 from play9 import scrape_play_store_html
 from typing import List, Dict
 
-async def extract_reviews_from_html(html: str) -> List[Dict[str, str]]:
-    """
-    Extracts reviews from the provided HTML string and returns them as a list of dictionaries.
-    Each dictionary contains review details like username, content, score, thumbs-up count, reviewed date, and replied content.
-    
-    :param html: The HTML content as a string.
-    :return: A list of dictionaries containing review information.
-    """
-    soup = BeautifulSoup(html, 'html.parser')
+# Optional faster parser backends; BeautifulSoup is always available as the fallback
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+# Every selector the parser uses, as (tag, attribute, value).
+# A "class" attribute matches one class of the element; any other attribute must match exactly.
+REVIEW_CARD = ("div", "class", "RHo1pe")
+REVIEW_FIELDS = {
+    "username": ("div", "class", "X5PpBb"),
+    "content": ("div", "class", "h3YV2d"),
+    "score": ("div", "class", "iXRFPc"),
+    "thumbsupcount": ("div", "jscontroller", "wW2D8b"),
+    "reviewedat": ("span", "class", "bp9Aid"),
+    "repliedcontent": ("div", "class", "ras4vb"),
+}
+
+# Preferred backend, "auto" picks the fastest one installed
+HTML_PARSER_BACKEND = os.getenv("HTML_PARSER_BACKEND", "auto")
+
+
+def _css(selector) -> str:
+    tag, attribute, value = selector
+    if attribute == "class":
+        return f"{tag}.{value}"
+    return f'{tag}[{attribute}="{value}"]'
+
+
+def _xpath(selector) -> str:
+    tag, attribute, value = selector
+    if attribute == "class":
+        return f".//{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {value} ')]"
+    return f".//{tag}[@{attribute}='{value}']"
+
+
+def _score_from_label(label) -> str:
+    # e.g. "Rated 4 stars out of five stars"
+    parts = label.split() if label else []
+    return parts[1] if len(parts) > 1 else "0"
+
+
+def _review(username, content, score_label, thumbs_up_count, reviewed_at, replied_content) -> Dict[str, str]:
+    return {
+        "username": username,
+        "content": content,
+        "score": _score_from_label(score_label),
+        "thumbsupcount": thumbs_up_count,
+        "reviewedat": reviewed_at,
+        "repliedcontent": replied_content,
+    }
+
+
+def _parse_selectolax(html: str) -> List[Dict[str, str]]:
+    tree = LexborHTMLParser(html)
+    selectors = {field: _css(selector) for field, selector in REVIEW_FIELDS.items()}
+
+    def text(card, field, strip_children=False):
+        node = card.css_first(selectors[field])
+        if node is None:
+            return None
+        return node.text(strip=True) if strip_children else node.text().strip()
+
+    reviews = []
+    for card in tree.css(_css(REVIEW_CARD)):
+        score_node = card.css_first(selectors["score"])
+        reviews.append(_review(
+            text(card, "username"),
+            text(card, "content"),
+            score_node.attributes.get("aria-label") if score_node is not None else None,
+            text(card, "thumbsupcount"),
+            text(card, "reviewedat"),
+            text(card, "repliedcontent", strip_children=True),
+        ))
+    return reviews
+
+
+def _parse_lxml(html: str) -> List[Dict[str, str]]:
+    if not html.strip():
+        return []
+    tree = lxml.html.fromstring(html)
+    selectors = {field: _xpath(selector) for field, selector in REVIEW_FIELDS.items()}
+
+    def first(card, field):
+        nodes = card.xpath(selectors[field])
+        return nodes[0] if nodes else None
+
+    def text(card, field, strip_children=False):
+        node = first(card, field)
+        if node is None:
+            return None
+        if strip_children:
+            return "".join(part.strip() for part in node.itertext())
+        return node.text_content().strip()
 
     reviews = []
+    for card in tree.xpath(_xpath(REVIEW_CARD)):
+        score_node = first(card, "score")
+        reviews.append(_review(
+            text(card, "username"),
+            text(card, "content"),
+            score_node.get("aria-label") if score_node is not None else None,
+            text(card, "thumbsupcount"),
+            text(card, "reviewedat"),
+            text(card, "repliedcontent", strip_children=True),
+        ))
+    return reviews
+
+
+def _parse_bs4(html: str) -> List[Dict[str, str]]:
+    soup = BeautifulSoup(html, "lxml" if lxml is not None else "html.parser")
 
-    # First loop for extracting username and content
-    for user_div in soup.find_all('div', class_="X5PpBb"):
-        user_name = user_div.text.strip()  # Extract user's name
-        review_content_div = user_div.find_next('div', class_="h3YV2d")  # Locate the corresponding review content
-        review_content = review_content_div.text.strip() if review_content_div else None
-
-        # Add an entry to the reviews list
-        reviews.append({
-            "username": user_name,
-            "content": review_content,
-            "score": None,  # Placeholder for score
-            "thumbsupcount": None,  # Placeholder for thumbs-up count
-            "reviewedat": None,  # Placeholder for reviewed date
-            "repliedcontent": None  # Placeholder for replied content
-        })
-
-    # Second loop for extracting score, thumbs-up count, reviewed date, and replied content
-    for i, container in enumerate(soup.find_all('div', class_="Jx4nYe")):
-        if i < len(reviews):  # Ensure data matches with existing review entries
-            # Extract score
-            score_div = container.find('div', class_="iXRFPc")
-            score = score_div["aria-label"].split()[1] if score_div and "aria-label" in score_div.attrs else "0"
-
-            # Extract thumbs-up count
-            thumbs_up_div = container.find('div', jscontroller="wW2D8b")
-            thumbs_up_count = thumbs_up_div.text.strip() if thumbs_up_div else None
-
-            # Extract reviewed date
-            reviewed_at_span = container.find('span', class_="bp9Aid")
-            reviewed_at = reviewed_at_span.text.strip() if reviewed_at_span else None
-
-            # Extract replied content
-            replied_content_div = container.find('div', class_="ras4vb")
-            replied_content = replied_content_div.get_text(strip=True) if replied_content_div else None
-
-            # Update the corresponding review entry
-            reviews[i].update({
-                "score": score,
-                "thumbsupcount": thumbs_up_count,
-                "reviewedat": reviewed_at,
-                "repliedcontent": replied_content
-            })
+    def find(element, selector):
+        tag, attribute, value = selector
+        if attribute == "class":
+            return element.find(tag, class_=value)
+        return element.find(tag, attrs={attribute: value})
 
+    def find_all(element, selector):
+        tag, attribute, value = selector
+        if attribute == "class":
+            return element.find_all(tag, class_=value)
+        return element.find_all(tag, attrs={attribute: value})
+
+    def text(card, field, strip_children=False):
+        node = find(card, REVIEW_FIELDS[field])
+        if node is None:
+            return None
+        return node.get_text(strip=True) if strip_children else node.text.strip()
+
+    reviews = []
+    for card in find_all(soup, REVIEW_CARD):
+        score_node = find(card, REVIEW_FIELDS["score"])
+        reviews.append(_review(
+            text(card, "username"),
+            text(card, "content"),
+            score_node.get("aria-label") if score_node is not None else None,
+            text(card, "thumbsupcount"),
+            text(card, "reviewedat"),
+            text(card, "repliedcontent", strip_children=True),
+        ))
     return reviews
 
+
+PARSER_BACKENDS = {
+    "selectolax": _parse_selectolax,
+    "lxml": _parse_lxml,
+    "bs4": _parse_bs4,
+}
+
+
+def available_backends() -> List[str]:
+    """
+    Returns the installed parser backends, fastest first.
+    """
+    backends = []
+    if LexborHTMLParser is not None:
+        backends.append("selectolax")
+    if lxml is not None:
+        backends.append("lxml")
+    backends.append("bs4")
+    return backends
+
+
+def parse_reviews(html: str, backend: str = None) -> List[Dict[str, str]]:
+    """
+    Parses every review card in `html` in a single pass, reading all fields from within the card.
+
+    :param html: A full reviews page or concatenated review card HTML.
+    :param backend: "selectolax", "lxml", "bs4" or "auto". Defaults to HTML_PARSER_BACKEND.
+    :return: A list of review dicts.
+    """
+    backend = backend or HTML_PARSER_BACKEND
+    if backend == "auto":
+        backend = available_backends()[0]
+    if backend not in available_backends():
+        raise ValueError(f"HTML parser backend not available: {backend}")
+    if not html:
+        return []
+    return PARSER_BACKENDS[backend](html)
+
+
+async def extract_reviews_from_html(html: str, backend: str = None) -> List[Dict[str, str]]:
+    """
+    Extracts reviews from the provided HTML string and returns them as a list of dictionaries.
+    Each dictionary contains review details like username, content, score, thumbs-up count, reviewed date, and replied content.
+
+    :param html: The HTML content as a string.
+    :param backend: Parser backend, see parse_reviews.
+    :return: A list of dictionaries containing review information.
+    """
+    return parse_reviews(html, backend)
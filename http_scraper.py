@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+import random
+from contextlib import aclosing
+from time import monotonic
+
+import httpx
+
+from play9 import PLAY_STORE_URL, STOP_EXHAUSTED, STOP_TARGET_REACHED, STOP_TIME_BUDGET
+from review_rpc import REVIEWS_RPC_ID, SORT_NEWEST, iter_rpc_payloads, decode_reviews_payload
+from review_variants import SORTS, merge_review_streams
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying; anything else is treated as a hard failure
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def build_reviews_request(app_id: str, sort: int = SORT_NEWEST, count: int = 100, token: str = None,
+                          stars: int = None) -> dict:
+    """
+    Returns the form body of one reviews RPC call, the same call the reviews dialog makes.
+    `stars` restricts the reviews to one star rating.
+    """
+    star_filter = [None, stars] if stars else []
+    params = [None, None, [2, sort, [count, None, token], None, star_filter], [app_id, 7]]
+    f_req = [[[REVIEWS_RPC_ID, json.dumps(params, separators=(",", ":")), None, "generic"]]]
+    return {"f.req": json.dumps(f_req, separators=(",", ":"))}
+
+
+class HttpReviewFetcher:
+    """
+    Pages through an app's reviews with the reviews RPC over plain HTTP, without a browser.
+    One instance is shared by every job of a worker: it owns a pooled httpx client and
+    limits the number of requests in flight across all of them.
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_retries: int = 3, backoff: float = 1.0,
+                 timeout: float = 30.0, base_url: str = None, rate_limiter=None):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.base_url = base_url or PLAY_STORE_URL
+        self.rate_limiter = rate_limiter  # Optional RedisTokenBucket awaited before every request
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            headers={"Content-Type": "application/x-www-form-urlencoded;charset=UTF-8"},
+        )
+        self.requests = 0
+        self.retries = 0
+
+    async def close(self):
+        await self._client.aclose()
+
+    async def fetch_page(self, app_id: str, token: str = None, sort: int = SORT_NEWEST, count: int = 100,
+                         lang: str = "en", country: str = "us", stars: int = None):
+        """
+        Fetches one page of reviews, retrying transient failures with exponential backoff.
+
+        :return: The decoded reviews and the continuation token of the next page, if any.
+        """
+        url = f"{self.base_url}/_/PlayStoreUi/data/batchexecute"
+        params = {"rpcids": REVIEWS_RPC_ID, "hl": lang, "gl": country}
+        data = build_reviews_request(app_id, sort, count, token, stars)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.acquire()
+                async with self._semaphore:
+                    self.requests += 1
+                    response = await self._client.post(url, params=params, data=data)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    break
+                error = httpx.HTTPStatusError(
+                    f"Retryable status {response.status_code}", request=response.request, response=response
+                )
+            except httpx.TransportError as e:
+                error = e
+
+            if attempt == self.max_retries:
+                raise error
+            delay = self.backoff * (2 ** attempt) * (1 + random.random())
+            logger.warning(f"Review request for {app_id} failed ({error}), retrying in {delay:.1f}s")
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+        for rpc_id, payload in iter_rpc_payloads(response.text):
+            if rpc_id == REVIEWS_RPC_ID:
+                return decode_reviews_payload(payload)
+        return [], None
+
+    async def stream_reviews(self, app_id: str, max_reviews: int = 2000, batch_size: int = 100,
+                             sort: int = SORT_NEWEST, lang: str = "en", country: str = "us", stats: dict = None,
+                             max_seconds: float = None, stars: int = None):
+        """
+        Yields lists of review dicts, one per page, following continuation tokens until there are
+        no more pages, `max_reviews` reviews were fetched or `max_seconds` have passed.
+        If a `stats` dict is given, its "pages_fetched" and "reviews_loaded" counters are kept up to date
+        and "stop_reason" tells why paging stopped (same values as play9.ScrollBudget).
+        """
+        stats = stats if stats is not None else {}
+        deadline = monotonic() + max_seconds if max_seconds else None
+        token = None
+        fetched = 0
+        while True:
+            if fetched >= max_reviews:
+                stats["stop_reason"] = STOP_TARGET_REACHED
+                break
+            if deadline is not None and monotonic() >= deadline:
+                stats["stop_reason"] = STOP_TIME_BUDGET
+                break
+            count = min(batch_size, max_reviews - fetched)
+            reviews, token = await self.fetch_page(app_id, token, sort, count, lang, country, stars)
+            if not reviews:
+                stats["stop_reason"] = STOP_EXHAUSTED
+                break
+            fetched += len(reviews)
+            stats["pages_fetched"] = stats.get("pages_fetched", 0) + 1
+            stats["reviews_loaded"] = fetched
+            yield reviews
+            if not token:
+                stats["stop_reason"] = STOP_EXHAUSTED
+                break
+
+    async def stream_variants(self, app_id: str, variants: list, max_reviews: int = 2000, batch_size: int = 100,
+                              stats: dict = None, max_seconds: float = None, concurrency: int = 3):
+        """
+        Pages through several slices of an app's reviews at once (languages, sorts and star
+        filters, see review_variants) and yields them merged and deduplicated, stopping once
+        `max_reviews` distinct reviews were fetched.
+        """
+        def open_stream(variant, variant_stats):
+            return self.stream_reviews(
+                app_id, max_reviews=max_reviews, batch_size=batch_size, sort=SORTS[variant["sort"]],
+                lang=variant["lang"], country=variant["country"], stats=variant_stats,
+                max_seconds=max_seconds, stars=variant["stars"],
+            )
+
+        async with aclosing(merge_review_streams(variants, open_stream, batch_size, stats, max_reviews,
+                                                 concurrency)) as merged:
+            async for reviews in merged:
+                yield reviews
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+from arq.constants import default_queue_name, expires_extra_ms, in_progress_key_prefix
+from arq.jobs import Job, JobStatus
+
+logger = logging.getLogger(__name__)
+
+# A completed scrape is reused for this long before a new one is started
+SCRAPE_FRESHNESS_MINUTES = int(os.getenv("SCRAPE_FRESHNESS_MINUTES", "10"))
+
+# Safety expiry of the in-flight record, in case a worker dies without clearing it. arq drops a job
+# still queued after expires_extra_ms, so by default the record outlives any queued job; the worker
+# renews it for its JOB_TIMEOUT once it picks the job up (see refresh_job_inflight)
+INFLIGHT_TTL_SECONDS = int(os.getenv("INFLIGHT_TTL_SECONDS", str(expires_extra_ms // 1000)))
+
+# How long completion records are kept around for the freshness check
+COMPLETED_TTL_SECONDS = 24 * 3600
+
+# arq queue per job priority; the worker runs one arq Worker per queue
+QUEUE_NAMES = {
+    "high": "arq:queue:high",
+    "low": "arq:queue:low",
+}
+
+ACTIVE_STATUSES = (JobStatus.deferred, JobStatus.queued, JobStatus.in_progress)
+
+# Moves a job that no worker has picked up yet from one arq queue to another, keeping its score
+# (the time it becomes runnable). Returns 1 if it was moved, 0 if it is running or gone.
+# arq keeps the job's function and arguments under its own key, so only the queue entry moves.
+MOVE_QUEUED_JOB_SCRIPT = """
+local score = redis.call("ZSCORE", KEYS[1], ARGV[1])
+if not score or redis.call("EXISTS", KEYS[3]) == 1 then
+    return 0
+end
+redis.call("ZREM", KEYS[1], ARGV[1])
+redis.call("ZADD", KEYS[2], score, ARGV[1])
+return 1
+"""
+
+
+def lock_key(app_id: str) -> str:
+    return f"scrape:lock:{app_id}"
+
+
+def scrape_params(mode: str, backend: str, target_reviews: int = None, max_seconds: float = None,
+                  variants: list = None) -> str:
+    """
+    Returns a digest of the options of a scrape job, as passed to scrape_reviews_task. Only a
+    job with the same options is reused: an incremental or time-capped scrape cannot stand in
+    for a full one, nor can a scrape of other variants.
+    """
+    options = json.dumps([mode, backend, target_reviews, max_seconds, variants], sort_keys=True, default=str)
+    return hashlib.sha1(options.encode("utf-8")).hexdigest()[:16]
+
+
+def inflight_key(app_id: str, params: str) -> str:
+    return f"scrape:inflight:{app_id}:{params}"
+
+
+def completed_key(app_id: str, params: str) -> str:
+    return f"scrape:completed:{app_id}:{params}"
+
+
+async def find_reusable_job(redis, app_id: str, params: str, freshness_minutes: int = SCRAPE_FRESHNESS_MINUTES,
+                            queue_name: str = None):
+    """
+    Looks for a job whose result can be returned instead of starting a new scrape of `app_id`
+    with the options digested in `params` (see scrape_params).
+    Call it while holding the app's lock (see lock_key).
+    A request for the high-priority `queue_name` does not wait behind low-priority work: a matching
+    job still waiting on the low queue is moved to the high one before it is reused.
+
+    :return: (job_id, "in_progress") for a job still queued or running,
+             (job_id, "cached") for a job completed within the freshness window,
+             or None.
+    """
+    inflight = await redis.get(inflight_key(app_id, params))
+    if inflight:
+        record = json.loads(inflight)
+        job_queue = record.get("queue", default_queue_name)
+        status = await Job(record["job_id"], redis, _queue_name=job_queue).status()
+        if status in ACTIVE_STATUSES:
+            if (queue_name == QUEUE_NAMES["high"] and job_queue == QUEUE_NAMES["low"]
+                    and status != JobStatus.in_progress):
+                await promote_queued_job(redis, app_id, params, record["job_id"])
+            return record["job_id"], "in_progress"
+
+    completed = await redis.get(completed_key(app_id, params))
+    if completed and freshness_minutes > 0:
+        record = json.loads(completed)
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(record["completed_at"])
+        if age.total_seconds() <= freshness_minutes * 60:
+            return record["job_id"], "cached"
+
+    return None
+
+
+async def mark_job_inflight(redis, app_id: str, params: str, job_id: str, queue_name: str = default_queue_name):
+    record = json.dumps({"job_id": job_id, "queue": queue_name})
+    await redis.set(inflight_key(app_id, params), record, ex=INFLIGHT_TTL_SECONDS)
+
+
+async def refresh_job_inflight(redis, app_id: str, params: str, job_id: str, ttl_seconds: float):
+    """
+    Renews the in-flight record of `job_id` for `ttl_seconds`, the longest it can still run.
+    Called by the worker when it starts the job.
+    """
+    try:
+        inflight = await redis.get(inflight_key(app_id, params))
+        if inflight and json.loads(inflight)["job_id"] == job_id:
+            await redis.expire(inflight_key(app_id, params), int(ttl_seconds))
+    except Exception as e:
+        logger.warning(f"Error refreshing the in-flight record of {app_id}: {e}")
+
+
+async def promote_queued_job(redis, app_id: str, params: str, job_id: str) -> bool:
+    """
+    Moves `job_id` from the low-priority queue to the high-priority one if no worker picked it up
+    yet, and updates its in-flight record. Returns whether it was moved.
+    """
+    move = redis.register_script(MOVE_QUEUED_JOB_SCRIPT)
+    keys = [QUEUE_NAMES["low"], QUEUE_NAMES["high"], in_progress_key_prefix + job_id]
+    moved = await move(keys=keys, args=[job_id])
+    if moved:
+        await mark_job_inflight(redis, app_id, params, job_id, QUEUE_NAMES["high"])
+        logger.info(f"Moved queued job {job_id} of {app_id} to the high-priority queue")
+    return bool(moved)
+
+
+async def mark_job_finished(redis, app_id: str, params: str, job_id: str, completed: bool):
+    """
+    Clears the in-flight record of `job_id` and, if it completed, records it for the freshness check.
+    """
+    try:
+        inflight = await redis.get(inflight_key(app_id, params))
+        if inflight and json.loads(inflight)["job_id"] == job_id:
+            await redis.delete(inflight_key(app_id, params))
+        if completed:
+            record = json.dumps({"job_id": job_id, "completed_at": datetime.now(timezone.utc).isoformat()})
+            await redis.set(completed_key(app_id, params), record, ex=COMPLETED_TTL_SECONDS)
+    except Exception as e:
+        # Coalescing is an optimization; never fail the job over it
+        logger.warning(f"Error updating job cache for {app_id}: {e}")
@@ -1,18 +1,31 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from uuid import uuid4
-from datetime import datetime, timezone
+from datetime import date
 from play9 import scrape_play_store_html  # Import the scraping function
-from database import get_review_pool, get_status_pool  # Database connection pool imports
+from database import close_db, create_job, get_job  # Data access, see database.py
 from bs4 import BeautifulSoup
 from html6 import extract_reviews_from_html
 from uuid import uuid4
 import json
 import ast
 import os
+import re
 from arq import create_pool
 from arq.connections import RedisSettings
+from job_cache import QUEUE_NAMES, find_reusable_job, lock_key, mark_job_inflight, scrape_params
+from progress import FINAL_STATUSES, progress_channel, read_progress, write_progress
+from metrics import API_REQUEST_SECONDS, render_metrics
+from review_export import EXPORT_FORMATS, export_reviews
+from review_queries import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, get_daily_review_counts, get_review_summary, list_reviews,
+)
+import asyncio
 import logging
+import time
+from typing import List, Literal, Optional
+from pydantic import Field
 
 app = FastAPI()
 
@@ -20,14 +33,65 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Models
+class ReviewVariant(BaseModel):
+    lang: str = "en"
+    country: str = "us"
+    sort: Literal["newest", "relevant", "rating"] = "newest"
+    stars: Optional[int] = Field(None, ge=1, le=5)  # Only reviews with this rating
+
 class ScrapeRequest(BaseModel):
     app_id: str
+    mode: Literal["full", "incremental"] = "full"  # "incremental" stops at the last review already stored
+    backend: Literal["browser", "http"] = "browser"  # "http" pages through reviews without a browser
+    force: bool = False  # Start a new scrape even if one is running or finished recently
+    priority: Literal["high", "low"] = "high"
+    target_reviews: Optional[int] = Field(None, ge=1)  # Stop once this many reviews are loaded
+    max_seconds: Optional[float] = Field(None, gt=0)  # Time budget, SCRAPE_MAX_SECONDS by default, capped at SCRAPE_MAX_SECONDS_LIMIT
+    variants: Optional[List[ReviewVariant]] = Field(None, min_length=1, max_length=50)  # Fan out over these slices
 
 class ScrapeResponse(BaseModel):
     jobId: str
     status: str
     message: str
 
+class BatchScrapeRequest(BaseModel):
+    app_ids: List[str] = Field(..., min_length=1, max_length=5000)
+    mode: Literal["full", "incremental"] = "full"
+    backend: Literal["browser", "http"] = "browser"
+    force: bool = False
+    priority: Literal["high", "low"] = "low"  # Batches wait behind interactive requests by default
+    target_reviews: Optional[int] = Field(None, ge=1)
+    max_seconds: Optional[float] = Field(None, gt=0)
+    variants: Optional[List[ReviewVariant]] = Field(None, min_length=1, max_length=50)
+
+class BatchScrapeJob(BaseModel):
+    appId: str
+    jobId: Optional[str] = None  # None if the app could not be enqueued
+    status: str  # "started", "in_progress", "cached" or "error"
+    error: Optional[str] = None
+
+class BatchScrapeResponse(BaseModel):
+    jobs: List[BatchScrapeJob]
+    started: int
+    reused: int
+    failed: int = 0
+
+# Seconds between keepalive comments on idle SSE streams, so proxies keep them open
+SSE_KEEPALIVE_SECONDS = 15
+
+# Apps enqueued at the same time by POST /scrape/batch
+BATCH_ENQUEUE_CONCURRENCY = int(os.getenv("BATCH_ENQUEUE_CONCURRENCY", "20"))
+
+# Fields GET /scrape/{job_id}/status has always returned, mirrored from scrape_jobs into the
+# Redis progress hash
+JOB_STATUS_FIELDS = ("job_id", "status", "started_at", "completed_at", "total_reviews", "error_message")
+
+SCRAPE_MESSAGES = {
+    "started": "Review scraping has started",
+    "in_progress": "A scrape of this app is already in progress",
+    "cached": "This app was scraped recently; returning the completed job",
+}
+
 class Settings:
     # Configure Redis for Render's environment
     redis_settings = RedisSettings(
@@ -47,92 +111,246 @@ async def startup():
 @app.on_event("shutdown")
 async def shutdown():
     await redis.close()
+    await close_db()
 
-async def update_job_status(job_id: str, status: str, error_message: str = None, total_reviews: int = None):
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template, not raw path, so job IDs do not explode the label set
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        API_REQUEST_SECONDS.labels(request.method, path, str(status)).observe(time.perf_counter() - start)
+
+@app.get("/metrics")
+async def metrics():
     """
-    Updates the job status in the database. Returns a response indicating success.
+    Prometheus metrics of this API process. Scrape job metrics are served by each worker
+    on WORKER_METRICS_PORT.
     """
-    try:
-        # Get a connection pool
-        pool = await get_status_pool()
-
-        # Acquire a connection from the pool
-        async with pool.acquire() as conn:
-            # Get the current UTC time
-            current_time = datetime.now(timezone.utc)
-
-            # Determine completion time
-            completed_at = current_time if status in ['completed', 'failed'] else None
-
-            # Update the scrape_jobs table
-            await conn.execute('''
-                UPDATE scrape_jobs 
-                SET status = $1,
-                    error_message = $2,
-                    total_reviews = COALESCE($3, total_reviews),
-                    completed_at = $4
-                WHERE job_id = $5
-            ''', status, error_message, total_reviews, completed_at, job_id)
-
-        # Explicitly return a success response
-        return {"status": "success", "message": "Job status updated successfully"}
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
-    except Exception as e:
-        # Log the error (optional) and return a failure response
-        print(f"Error updating job status: {e}")
-        return {"status": "error", "message": str(e)}
+async def start_or_reuse_job(app_id: str, mode: str, backend: str, priority: str, force: bool,
+                             target_reviews: int = None, max_seconds: float = None, variants: list = None):
+    """
+    Starts a scrape of `app_id` on the queue of `priority`, unless one with the same mode, backend,
+    target, time budget and variants is already queued or running (its job ID is returned with
+    status "in_progress", after moving it to the high queue if it waits on the low one and
+    `priority` is "high") or completed within SCRAPE_FRESHNESS_MINUTES (status "cached").
+    The check and the enqueue happen under a per-app Redis lock, so this holds across web replicas.
 
+    :return: (job_id, status) where status is "started", "in_progress" or "cached".
+    """
+    params = scrape_params(mode, backend, target_reviews, max_seconds, variants)
+    queue_name = QUEUE_NAMES[priority]
+    async with redis.lock(lock_key(app_id), timeout=30, blocking_timeout=10):
+        if not force:
+            reusable = await find_reusable_job(redis, app_id, params, queue_name=queue_name)
+            if reusable:
+                return reusable
 
-# Route for initiating the scraping task
-@app.post("/scrape", response_model=ScrapeResponse)
-async def start_scrape(request: ScrapeRequest, background_tasks: BackgroundTasks):
-    try:
         job_id = str(uuid4())
-        current_time = datetime.now(timezone.utc)
 
         # Initialize job in the database
-        pool = await get_status_pool()
-        async with pool.acquire() as conn:
-            await conn.execute('''
-                INSERT INTO scrape_jobs (
-                    job_id, app_id, status, started_at, created_at
-                ) VALUES ($1, $2, $3, $4, $5)
-            ''', job_id, request.app_id, "pending", current_time, current_time)
+        started_at = await create_job(job_id, app_id, "pending")
 
-        # Add background task for scraping
-        await redis.enqueue_job("scrape_reviews_task", request.app_id, job_id)
+        # Add background task for scraping, using our job ID as the arq job ID
+        await redis.enqueue_job(
+            "scrape_reviews_task", app_id, job_id, mode, backend, target_reviews, max_seconds, variants,
+            _job_id=job_id, _queue_name=queue_name,
+        )
+        await mark_job_inflight(redis, app_id, params, job_id, queue_name)
+        # The hash carries the scrape_jobs fields too, so status reads need no Postgres query
+        await write_progress(
+            redis, job_id, app_id=app_id, status="pending", stage="queued", started_at=started_at,
+            completed_at=None, total_reviews=None, error_message=None,
+        )
 
+    return job_id, "started"
 
+def variant_dicts(variants):
+    # Jobs receive plain dicts, see review_variants
+    return [variant.model_dump() for variant in variants] if variants else None
+
+# Route for initiating the scraping task
+@app.post("/scrape", response_model=ScrapeResponse)
+async def start_scrape(request: ScrapeRequest, background_tasks: BackgroundTasks):
+    try:
+        job_id, status = await start_or_reuse_job(
+            request.app_id, request.mode, request.backend, request.priority, request.force,
+            request.target_reviews, request.max_seconds, variant_dicts(request.variants),
+        )
         return ScrapeResponse(
             jobId=job_id,
-            status="started",
-            message="Review scraping has started"
+            status=status,
+            message=SCRAPE_MESSAGES[status]
         )
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+# Route for enqueuing many apps at once
+@app.post("/scrape/batch", response_model=BatchScrapeResponse)
+async def start_batch_scrape(request: BatchScrapeRequest):
+    """
+    Starts (or reuses) one scrape job per app ID. Defaults to the low priority queue, which the
+    worker drains at the global Play Store rate limit without blocking interactive requests.
+    An app that cannot be enqueued gets status "error" without failing the others.
+    """
+    try:
+        app_ids = list(dict.fromkeys(request.app_ids))  # Drop duplicates, keep order
+        semaphore = asyncio.Semaphore(BATCH_ENQUEUE_CONCURRENCY)
+
+        async def enqueue(app_id: str):
+            async with semaphore:
+                job_id, status = await start_or_reuse_job(
+                    app_id, request.mode, request.backend, request.priority, request.force,
+                    request.target_reviews, request.max_seconds, variant_dicts(request.variants),
+                )
+            return BatchScrapeJob(appId=app_id, jobId=job_id, status=status)
+
+        results = await asyncio.gather(*(enqueue(app_id) for app_id in app_ids), return_exceptions=True)
+        jobs = []
+        for app_id, result in zip(app_ids, results):
+            if isinstance(result, Exception):
+                print(f"Error enqueuing scrape of {app_id}: {result}")
+                result = BatchScrapeJob(appId=app_id, status="error", error=str(result))
+            elif isinstance(result, BaseException):
+                raise result  # Cancelled request
+            jobs.append(result)
+
+        started = sum(1 for job in jobs if job.status == "started")
+        failed = sum(1 for job in jobs if job.status == "error")
+        return BatchScrapeResponse(jobs=jobs, started=started, reused=len(jobs) - started - failed, failed=failed)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/scrape/{job_id}/status")
 async def get_scrape_status(job_id: str):
-    """Get the current status of a scraping job"""
+    """
+    Get the current status of a scraping job.
+    Returns the job's Redis progress hash while it exists: the JOB_STATUS_FIELDS of scrape_jobs
+    (the status stays "pending" until the job completes or fails) plus the live fields (stage,
+    reviews_loaded, reviews_inserted, ...). Falls back to the scrape_jobs row once it expires, or
+    for hashes written without those fields.
+    """
     try:
-        pool = await get_status_pool()
-        async with pool.acquire() as conn:
-            job = await conn.fetchrow('''
-                SELECT 
-                    job_id, status, started_at, completed_at, 
-                    total_reviews, error_message
-                FROM scrape_jobs 
-                WHERE job_id = $1
-            ''', job_id)
-            
-            if not job:
-                raise HTTPException(status_code=404, detail="Job not found")
-            
-            return dict(job)
-                    
+        progress = await read_progress(redis, job_id)
+        if progress and all(field in progress for field in JOB_STATUS_FIELDS):
+            return progress
+        return await get_job_from_db(job_id)
+
     except HTTPException as he:
         raise he
     except Exception as e:
         print(f"Error checking job status: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/scrape/{job_id}/events")
+async def stream_scrape_events(job_id: str, request: Request):
+    """
+    Server-sent events stream of a job's progress. Sends the current snapshot, then every update
+    the worker publishes, and closes once the job is completed or failed.
+    """
+    pubsub = redis.pubsub()
+    # Subscribe before reading the snapshot so no update falls in between
+    await pubsub.subscribe(progress_channel(job_id))
+    try:
+        snapshot = await read_progress(redis, job_id)
+        if snapshot is None:
+            snapshot = await get_job_from_db(job_id)
+    except BaseException:
+        await pubsub.aclose()
+        raise
+
+    async def events():
+        try:
+            yield format_sse(snapshot)
+            if snapshot.get("status") in FINAL_STATUSES or "stage" not in snapshot:
+                return  # Finished, or only known to Postgres
+
+            while not await request.is_disconnected():
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=SSE_KEEPALIVE_SECONDS)
+                if message is None:
+                    yield ": keepalive\n\n"
+                    continue
+                update = json.loads(message["data"])
+                yield format_sse(update)
+                if update.get("status") in FINAL_STATUSES:
+                    break
+        finally:
+            await pubsub.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def format_sse(data: dict) -> str:
+    return f"event: progress\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def get_job_from_db(job_id: str) -> dict:
+    """
+    Returns the job's row from scrape_jobs, raising 404 if it does not exist.
+    """
+    job = await get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job
+
+@app.get("/apps/{app_id}/reviews")
+async def get_app_reviews(app_id: str, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                          cursor: Optional[str] = None, score: Optional[int] = Query(None, ge=1, le=5)):
+    """
+    Stored reviews of an app, newest first. Pass the returned "next_cursor" to get the next page;
+    it is null on the last page.
+    """
+    try:
+        return await list_reviews(app_id, limit, cursor, score)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/apps/{app_id}/reviews/summary")
+async def get_app_review_summary(app_id: str, since: Optional[date] = None, until: Optional[date] = None):
+    """
+    Score histogram, average score and reply rate of an app's reviews, optionally only those
+    dated between `since` and `until`. Served from the review_daily_stats rollup.
+    """
+    return await get_review_summary(app_id, since, until)
+
+@app.get("/apps/{app_id}/reviews/daily")
+async def get_app_daily_reviews(app_id: str, since: Optional[date] = None, until: Optional[date] = None):
+    """
+    Reviews, replied reviews and average score per day of an app. Served from the review_daily_stats rollup.
+    """
+    return await get_daily_review_counts(app_id, since, until)
+
+@app.get("/apps/{app_id}/reviews/export")
+async def export_app_reviews(app_id: str, format: Literal["ndjson", "csv", "parquet"] = "ndjson",
+                             since: Optional[date] = None, until: Optional[date] = None):
+    """
+    Streams every stored review of an app, optionally only those dated between `since` and
+    `until`, as NDJSON, CSV or Parquet. Rows are read from a server-side cursor in chunks
+    (see review_export), so the export starts right away and memory stays flat.
+    """
+    try:
+        body = export_reviews(app_id, format, since, until)
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = re.sub(r"[^A-Za-z0-9_.-]", "_", app_id)
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}-reviews.{extension}"'},
+    )
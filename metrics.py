@@ -0,0 +1,78 @@
+from contextlib import contextmanager
+from time import perf_counter
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Stage durations range from milliseconds (parsing a batch) to minutes (long scrolls)
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+SCRAPE_JOBS = Counter("scrape_jobs_total", "Scrape jobs finished", ["backend", "status"])
+SCRAPE_JOB_SECONDS = Histogram("scrape_job_seconds", "End-to-end scrape job duration", ["backend"], buckets=SECONDS_BUCKETS)
+SCRAPE_STAGE_SECONDS = Histogram("scrape_stage_seconds", "Time spent in each stage of a scrape job", ["stage"], buckets=SECONDS_BUCKETS)
+SCRAPE_REVIEWS = Counter("scrape_reviews_total", "Reviews parsed or decoded")
+SCRAPE_REVIEWS_PER_SECOND = Histogram("scrape_reviews_per_second", "Reviews stored per second of job time", buckets=RATE_BUCKETS)
+SCRAPE_HTML_BYTES = Counter("scrape_html_bytes_total", "UTF-8 bytes of review HTML parsed")
+SCRAPE_SCROLL_ITERATIONS = Histogram("scrape_scroll_iterations", "Scroll iterations per browser job", buckets=RATE_BUCKETS)
+
+DB_ROWS_INSERTED = Counter("db_rows_inserted_total", "Review rows written to Postgres")
+DB_INSERT_SECONDS = Histogram("db_insert_seconds", "Time to write one batch of reviews", buckets=SECONDS_BUCKETS)
+DB_ROWS_PER_SECOND = Histogram("db_rows_per_second", "Review rows written per second, per batch", buckets=RATE_BUCKETS)
+DB_POOL_WAIT_SECONDS = Histogram("db_pool_acquire_seconds", "Time waiting for a pooled connection", ["pool"], buckets=QUERY_BUCKETS)
+DB_POOL_CONNECTIONS = Gauge("db_pool_connections", "Open connections of each pool, in use or idle", ["pool", "state"])
+DB_QUERY_SECONDS = Histogram("db_query_seconds", "Query latency, per prepared statement or \"other\"", ["pool", "query"], buckets=QUERY_BUCKETS)
+
+BROWSER_RSS_MB = Gauge("browser_rss_megabytes", "Resident memory of all pooled browsers")
+
+API_REQUEST_SECONDS = Histogram("api_request_seconds", "API request latency", ["method", "route", "status"], buckets=SECONDS_BUCKETS)
+
+
+@contextmanager
+def timed(stats: dict, stage: str):
+    """
+    Adds the time spent in the block to `stats["stage_seconds"][stage]`.
+    Stages may be entered many times per job; their durations accumulate.
+    """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stage_seconds = stats.setdefault("stage_seconds", {})
+            stage_seconds[stage] = stage_seconds.get(stage, 0.0) + perf_counter() - start
+
+
+def stage_breakdown(stats: dict) -> dict:
+    """
+    Returns the job's stage durations, rounded to milliseconds.
+    """
+    return {stage: round(seconds, 3) for stage, seconds in stats.get("stage_seconds", {}).items()}
+
+
+def observe_job(stats: dict, backend: str, status: str, total_seconds: float, total_reviews: int):
+    """
+    Records a finished job's stage breakdown and throughput.
+    """
+    SCRAPE_JOBS.labels(backend, status).inc()
+    SCRAPE_JOB_SECONDS.labels(backend).observe(total_seconds)
+    for stage, seconds in stats.get("stage_seconds", {}).items():
+        SCRAPE_STAGE_SECONDS.labels(stage).observe(seconds)
+    if total_seconds > 0:
+        SCRAPE_REVIEWS_PER_SECOND.observe(total_reviews / total_seconds)
+    if backend == "browser":
+        SCRAPE_SCROLL_ITERATIONS.observe(stats.get("scroll_iterations", 0))
+
+
+def observe_insert(rows: int, seconds: float):
+    DB_ROWS_INSERTED.inc(rows)
+    DB_INSERT_SECONDS.observe(seconds)
+    if seconds > 0:
+        DB_ROWS_PER_SECOND.observe(rows / seconds)
+
+
+def render_metrics():
+    """
+    Returns the Prometheus text exposition of every metric and its content type.
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
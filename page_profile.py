@@ -0,0 +1,134 @@
+import logging
+import os
+from collections import Counter
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Resource types the review parser never looks at
+DEFAULT_BLOCKED_RESOURCE_TYPES = ("image", "media", "font", "texttrack", "manifest")
+
+# Hosts the Play Store page needs to render and page through reviews (subdomains included)
+DEFAULT_ALLOWED_HOSTS = ("google.com", "gstatic.com")
+
+# Logging and analytics endpoints on otherwise allowed hosts
+DEFAULT_BLOCKED_URL_PATTERNS = ("/log?", "/gen_204", "/csi?")
+
+# Requests that count against the Play Store rate limit
+RATE_LIMITED_RESOURCE_TYPES = ("document", "xhr", "fetch")
+
+# Injected into every page to skip CSS animations and transitions
+DISABLE_ANIMATIONS_SCRIPT = """
+document.addEventListener("DOMContentLoaded", () => {
+    const style = document.createElement("style");
+    style.textContent = "*, *::before, *::after { animation: none !important; transition: none !important; }";
+    document.head.appendChild(style);
+});
+"""
+
+
+def _env_list(name: str, default: tuple) -> tuple:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return tuple(item.strip() for item in value.split(",") if item.strip())
+
+
+class PageProfile:
+    """
+    Lightweight browser context settings for scraping: a small viewport, reduced motion,
+    no service workers and a route handler that aborts requests the scraper does not need.
+    Create one instance per job; it keeps that job's request counters.
+    When a `rate_limiter` is set, documents and XHR/fetch requests that are let through wait for it.
+    """
+
+    def __init__(self, blocked_resource_types=DEFAULT_BLOCKED_RESOURCE_TYPES,
+                 allowed_hosts=DEFAULT_ALLOWED_HOSTS, blocked_url_patterns=DEFAULT_BLOCKED_URL_PATTERNS,
+                 viewport=None, disable_animations: bool = True, rate_limiter=None):
+        self.blocked_resource_types = set(blocked_resource_types)
+        self.allowed_hosts = tuple(allowed_hosts)
+        self.blocked_url_patterns = tuple(blocked_url_patterns)
+        self.viewport = viewport or {"width": 800, "height": 600}
+        self.disable_animations = disable_animations
+        self.rate_limiter = rate_limiter  # Optional RedisTokenBucket awaited before page loads and RPCs
+
+        self.blocked = Counter()  # Blocked requests by reason
+        self.allowed_requests = 0
+        self.bytes_loaded = 0  # Sum of Content-Length over allowed responses
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a profile from BLOCKED_RESOURCE_TYPES, ALLOWED_HOSTS and BLOCKED_URL_PATTERNS
+        (comma separated lists; an empty value disables that filter).
+        """
+        return cls(
+            blocked_resource_types=_env_list("BLOCKED_RESOURCE_TYPES", DEFAULT_BLOCKED_RESOURCE_TYPES),
+            allowed_hosts=_env_list("ALLOWED_HOSTS", DEFAULT_ALLOWED_HOSTS),
+            blocked_url_patterns=_env_list("BLOCKED_URL_PATTERNS", DEFAULT_BLOCKED_URL_PATTERNS),
+        )
+
+    def context_options(self) -> dict:
+        """
+        Keyword arguments for `browser.new_context`.
+        """
+        return {
+            "viewport": self.viewport,
+            "reduced_motion": "reduce",
+            "service_workers": "block",
+        }
+
+    async def attach(self, context):
+        """
+        Installs the route handler and init scripts on a BrowserContext.
+        """
+        if self.disable_animations:
+            await context.add_init_script(DISABLE_ANIMATIONS_SCRIPT)
+        await context.route("**/*", self._handle_route)
+        context.on("response", self._on_response)
+
+    def block_reason(self, url: str, resource_type: str):
+        """
+        Returns why a request should be aborted, or None to let it through.
+        """
+        if resource_type in self.blocked_resource_types:
+            return resource_type
+
+        host = urlsplit(url).hostname or ""
+        if self.allowed_hosts and not any(host == allowed or host.endswith("." + allowed) for allowed in self.allowed_hosts):
+            return "third_party"
+
+        if any(pattern in url for pattern in self.blocked_url_patterns):
+            return "analytics"
+
+        return None
+
+    async def _handle_route(self, route):
+        request = route.request
+        if request.url.startswith("data:"):
+            await route.continue_()
+            return
+
+        reason = self.block_reason(request.url, request.resource_type)
+        if reason:
+            self.blocked[reason] += 1
+            await route.abort()
+        else:
+            self.allowed_requests += 1
+            if self.rate_limiter is not None and request.resource_type in RATE_LIMITED_RESOURCE_TYPES:
+                await self.rate_limiter.acquire()
+            await route.continue_()
+
+    def _on_response(self, response):
+        try:
+            self.bytes_loaded += int(response.headers.get("content-length", 0))
+        except ValueError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "requests_blocked": sum(self.blocked.values()),
+            "requests_allowed": self.allowed_requests,
+            "blocked_by_reason": dict(self.blocked),
+            "bytes_loaded": self.bytes_loaded,
+        }
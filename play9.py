@@ -1,80 +1,510 @@
 import asyncio
-from playwright.async_api import async_playwright
-from time import time
+import os
+from contextlib import aclosing, asynccontextmanager
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+from time import monotonic
+from metrics import timed
+from urllib.parse import urlencode, urlsplit, urlunsplit, parse_qsl
+from review_rpc import (
+    REVIEW_DATE_TIMEZONE, REVIEWS_RPC_ID, SORT_NEWEST, apply_review_filters, extract_reviews_from_rpc, reviews_request_sort,
+)
+from review_variants import SORTS, merge_review_streams
 
-async def click_visible_button(page, text: str):
+# Overridable so the scraper can run against a local stub of the Play Store
+PLAY_STORE_URL = os.getenv("PLAY_STORE_URL", "https://play.google.com")
+
+# Longest wait for a button, the dialog or the first reviews to show up
+NAVIGATION_TIMEOUT = float(os.getenv("NAVIGATION_TIMEOUT", "30"))
+# Longest wait for new reviews after one scroll; a scroll that times out counts as idle
+SCROLL_WAIT_TIMEOUT = float(os.getenv("SCROLL_WAIT_TIMEOUT", "2"))
+
+# Why scrolling stopped, recorded as stats["stop_reason"]
+STOP_TARGET_REACHED = "target_reached"  # `target_reviews` reviews were loaded
+STOP_TIME_BUDGET = "time_budget"  # `max_seconds` ran out
+STOP_EXHAUSTED = "exhausted"  # The list stopped growing: every review was loaded
+
+async def click_visible_button(page, text: str, timeout: float = NAVIGATION_TIMEOUT):
     """
-    Clicks the first visible button containing the specified text.
+    Clicks the first visible button containing the specified text, waiting up to `timeout`
+    seconds for it to appear.
     """
     try:
         print(f"Clicking button with text: {text}")
-        await page.click(f"text='{text}'")
+        await page.click(f"text='{text}'", timeout=timeout * 1000)
         print("Button clicked successfully.")
     except Exception as e:
         print(f"Error clicking button: {e}")
 
-async def scrape_play_store_html(app_id: str, scroll_timeout: int = 5) -> str:
+# Each review in the "See all reviews" dialog is rendered as one of these cards
+REVIEW_CARD_SELECTOR = "div.RHo1pe"
+
+# Spinner shown while the next page of reviews is loading
+LOADER_SELECTOR = "div[role='progressbar']"
+
+# Set on review cards already read (or rendered for another sort), so a card is recognized by
+# its element rather than by its position and a re-rendered list is read again from the top
+READ_MARKER = "data-scraper-read"
+
+# Returns the outer HTML of every review card not read yet and marks those cards as read
+NEW_CARDS_SCRIPT = """
+([selector, marker]) => {
+    const html = [];
+    for (const card of document.querySelectorAll(`${selector}:not([${marker}])`)) {
+        html.push(card.outerHTML);
+        card.setAttribute(marker, "");
+    }
+    return html;
+}
+"""
+
+# Marks every rendered review card as read, returning how many there were
+MARK_CARDS_READ_SCRIPT = """
+([selector, marker]) => {
+    const cards = document.querySelectorAll(selector);
+    cards.forEach(card => card.setAttribute(marker, ""));
+    return cards.length;
+}
+"""
+
+# Resolves once more than `count` review cards are rendered
+MORE_CARDS_SCRIPT = "([selector, count]) => document.querySelectorAll(selector).length > count"
+
+# Resolves once a review card not read yet is rendered
+UNREAD_CARDS_SCRIPT = "([selector, marker]) => document.querySelector(`${selector}:not([${marker}])`) !== null"
+
+class ScrollBudget:
+    """
+    Decides when to stop scrolling: once `target_reviews` reviews are loaded, once `max_seconds`
+    have passed since it was created (once the page's browser was checked out), or after `max_idle_ticks` scrolls in a row that loaded
+    nothing. The reason is written to `stats["stop_reason"]`.
+    """
+
+    def __init__(self, max_seconds: float = None, target_reviews: int = None, max_idle_ticks: int = 3,
+                 stats: dict = None):
+        self.deadline = monotonic() + max_seconds if max_seconds else None
+        self.target_reviews = target_reviews
+        self.max_idle_ticks = max_idle_ticks
+        self.stats = stats if stats is not None else {}
+        self.idle_ticks = 0
+
+    def remaining(self) -> float:
+        """
+        Seconds left in the time budget (infinite without one).
+        """
+        return self.deadline - monotonic() if self.deadline is not None else float("inf")
+
+    def wait_timeout(self) -> float:
+        # Never wait past the deadline
+        return max(0.0, min(SCROLL_WAIT_TIMEOUT, self.remaining()))
+
+    def record(self, loaded: int, grew: bool):
+        """
+        Records the outcome of one scroll: whether anything new loaded and the running total.
+        """
+        self.stats["scroll_iterations"] = self.stats.get("scroll_iterations", 0) + 1
+        self.stats["reviews_loaded"] = loaded
+        self.idle_ticks = 0 if grew else self.idle_ticks + 1
+
+    def stop_reason(self):
+        """
+        Returns why scrolling should stop now, or None to keep going.
+        """
+        if self.target_reviews and self.stats.get("reviews_loaded", 0) >= self.target_reviews:
+            reason = STOP_TARGET_REACHED
+        elif self.remaining() <= 0:
+            reason = STOP_TIME_BUDGET
+        elif self.idle_ticks >= self.max_idle_ticks:
+            reason = STOP_EXHAUSTED
+        else:
+            return None
+        self.stats["stop_reason"] = reason
+        print(f"Stopping scrolling: {reason} ({self.stats.get('reviews_loaded', 0)} reviews loaded)")
+        return reason
+
+@asynccontextmanager
+async def open_context(browser_pool=None, profile=None):
+    """
+    Yields a fresh browser context, set up with the given PageProfile.
+    When a `browser_pool` is given the context comes from the pool,
+    otherwise a dedicated browser is launched and closed afterwards.
+    """
+    # Review dates render in the browser's timezone; pin it so they match decoded reviews
+    context_options = {"timezone_id": REVIEW_DATE_TIMEZONE}
+    if profile is not None:
+        context_options.update(profile.context_options())
+
+    if browser_pool is not None:
+        async with browser_pool.context(**context_options) as context:
+            if profile is not None:
+                await profile.attach(context)
+            yield context
+        return
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)  # Visible browser for debugging
+        try:
+            context = await browser.new_context(**context_options)
+            if profile is not None:
+                await profile.attach(context)
+            yield context
+        finally:
+            await browser.close()
+
+@asynccontextmanager
+async def open_page(browser_pool=None, profile=None):
+    """
+    Yields a new page in a fresh browser context, see open_context.
+    """
+    async with open_context(browser_pool, profile) as context:
+        yield await context.new_page()
+
+async def scrape_play_store_html(app_id: str, max_seconds: float = 300, browser_pool=None,
+                                 extraction: str = "page", max_idle_ticks: int = 3, profile=None,
+                                 stats: dict = None, target_reviews: int = None) -> str:
     """
     Scrapes the Google Play Store for a given app.
     Uses explicit mouse scrolling to fetch and save the HTML structure.
     Saves only the last HTML after scrolling is completed.
+    The page is opened with open_page, using `browser_pool` and `profile` when given.
+
+    Scrolling stops once `target_reviews` reviews are loaded, once `max_seconds` have passed,
+    or once `max_idle_ticks` scrolls in a row load nothing (see ScrollBudget).
+
+    `extraction` selects how the HTML is collected:
+    - "page": serialize the whole page once scrolling stops.
+    - "cards": read only the review cards added since the last scroll. Returns the
+      concatenated card HTML.
+
+    If a `stats` dict is given, it receives scroll counters, the stop reason and per-stage
+    timings (see metrics.timed).
     """
-    base_url = f"https://play.google.com/store/apps/details?id={app_id}&hl=en"
+    if extraction not in ("page", "cards"):
+        raise ValueError(f"Unknown extraction mode: {extraction}")
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)  # Visible browser for debugging
-        page = await browser.new_page()
+    async with open_page(browser_pool, profile) as page:
+        # The time budget starts once a browser is checked out, not while waiting for one
+        budget = ScrollBudget(max_seconds, target_reviews, max_idle_ticks, stats)
+        return await _scrape_page(page, app_id, extraction, budget)
 
-        try:
-            print("Opening app page...")
-            await page.goto(base_url)
-            await page.wait_for_load_state("networkidle")
-            await asyncio.sleep(2)  # Asynchronous sleep
-
-            # Click "See all reviews" button
-            print("Clicking 'See all reviews' button...")
-            await click_visible_button(page, "See all reviews")
-            await asyncio.sleep(2)
-
-            # Click the sort dropdown and select "Newest"
-            print("Applying filters to sort by 'Newest'...")
+async def stream_play_store_reviews(app_id: str, max_seconds: float = 300, browser_pool=None,
+                                   max_idle_ticks: int = 3, batch_size: int = 100, profile=None,
+                                   extraction: str = "cards", stats: dict = None, target_reviews: int = None):
+    """
+    Streaming counterpart of scrape_play_store_html.
+    Yields batches while the page is still scrolling, so callers can parse and store reviews
+    without holding the whole page in memory. Batches hold at least `batch_size` items,
+    except for the last one.
+
+    `extraction` selects what is yielded:
+    - "cards": lists of review card HTML, to be parsed with html6.extract_reviews_from_html.
+    - "network": lists of review dicts decoded from the reviews RPC responses the page
+      receives while scrolling (see ReviewResponseCapture). No DOM is serialized.
+
+    If a `stats` dict is given, its "scroll_iterations" and "reviews_loaded" counters are kept
+    up to date while scrolling, "stop_reason" tells why scrolling stopped and per-stage timings
+    are added to it (see metrics.timed).
+
+    Errors are raised to the caller instead of being swallowed, so batches already consumed
+    stay valid and the failure is still reported.
+    """
+    async with open_page(browser_pool, profile) as page:
+        # The time budget starts once a browser is checked out, not while waiting for one
+        budget = ScrollBudget(max_seconds, target_reviews, max_idle_ticks, stats)
+        async for batch in _stream_page(page, app_id, batch_size, extraction, budget):
+            yield batch
+
+async def _stream_page(page, app_id: str, batch_size: int, extraction: str, budget: ScrollBudget):
+    if extraction == "network":
+        # Listen before navigating so the first page of reviews is not missed
+        capture = ReviewResponseCapture(page)
+        await open_reviews_dialog(page, app_id, budget.stats, capture)
+        print("Scrolling with mouse wheel and capturing review responses...")
+        items = iter_captured_reviews(page, capture, budget)
+    elif extraction == "cards":
+        await open_reviews_dialog(page, app_id, budget.stats)
+        print("Scrolling with mouse wheel and streaming new review cards...")
+        items = iter_new_review_cards(page, budget)
+    else:
+        raise ValueError(f"Unknown extraction mode: {extraction}")
+
+    batch = []
+    async for new_items in items:
+        batch.extend(new_items)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def _scrape_page(page, app_id: str, extraction: str, budget: ScrollBudget) -> str:
+    """
+    Opens the reviews dialog on `page`, sorts by newest and scrolls until the budget says to stop.
+    """
+    try:
+        await open_reviews_dialog(page, app_id, budget.stats)
+
+        if extraction == "cards":
+            print("Scrolling with mouse wheel and collecting new review cards...")
+            cards = []
+            async for new_cards in iter_new_review_cards(page, budget):
+                cards.extend(new_cards)
+            print(f"Finished scraping with {len(cards)} review cards.")
+            return "".join(cards)
+
+        # Scroll until the card count stops growing, then serialize the page once
+        print("Scrolling with mouse wheel and collecting HTML...")
+        count = await page.locator(REVIEW_CARD_SELECTOR).count()
+        while not budget.stop_reason():
+            with timed(budget.stats, "scroll"):
+                await page.mouse.wheel(0, 10000)
+                grew = await wait_for_more_cards(page, count, budget.wait_timeout())
+                if grew:
+                    count = await page.locator(REVIEW_CARD_SELECTOR).count()
+            budget.record(count, grew or await is_loading(page))
+
+        html = await page.content()
+        print("Finished scraping and saved the last HTML.")
+        return html
+
+    except Exception as e:
+        print(f"Error during scraping: {str(e)}")
+
+async def wait_for_more_cards(page, count: int, timeout: float) -> bool:
+    """
+    Waits up to `timeout` seconds for more than `count` review cards to be rendered.
+    """
+    try:
+        await page.wait_for_function(MORE_CARDS_SCRIPT, arg=[REVIEW_CARD_SELECTOR, count], timeout=timeout * 1000)
+        return True
+    except PlaywrightTimeoutError:
+        return False
+
+async def wait_for_unread_cards(page, timeout: float) -> bool:
+    """
+    Waits up to `timeout` seconds for a review card that was not read yet (see READ_MARKER).
+    """
+    try:
+        await page.wait_for_function(UNREAD_CARDS_SCRIPT, arg=[REVIEW_CARD_SELECTOR, READ_MARKER], timeout=timeout * 1000)
+        return True
+    except PlaywrightTimeoutError:
+        return False
+
+async def is_loading(page) -> bool:
+    """
+    Whether the next page of reviews is still loading. A scroll that ends with the spinner
+    visible is not counted as idle.
+    """
+    try:
+        return await page.locator(LOADER_SELECTOR).first.is_visible()
+    except Exception:
+        return False
+
+async def open_reviews_dialog(page, app_id: str, stats: dict = None, capture=None, choose_sort: bool = True):
+    """
+    Navigates to the app page, opens "See all reviews" and, if `choose_sort`, sorts by "Newest".
+    Each step waits for what it needs (the button, the first cards or the first response of
+    `capture`) instead of sleeping, up to NAVIGATION_TIMEOUT.
+    The "Most relevant" cards stay rendered until the first "Newest" response arrives, so they
+    are marked as read before sorting and only cards rendered afterwards count as loaded.
+    Time is recorded in `stats` under the "navigate", "click" and "wait" stages.
+    """
+    base_url = f"{PLAY_STORE_URL}/store/apps/details?id={app_id}&hl=en"
+
+    print("Opening app page...")
+    with timed(stats, "navigate"):
+        await page.goto(base_url, wait_until="domcontentloaded")
+
+    # Click "See all reviews" button; clicks wait for their button to become visible
+    print("Clicking 'See all reviews' button...")
+    with timed(stats, "click"):
+        await click_visible_button(page, "See all reviews")
+
+    if choose_sort:
+        # Click the sort dropdown and select "Newest"
+        print("Applying filters to sort by 'Newest'...")
+        with timed(stats, "click"):
             await click_visible_button(page, "Most relevant")
-            await asyncio.sleep(1)
+            # Cards rendering after the marking would pass for "Newest" ones
+            if capture is None:
+                await wait_for_more_cards(page, 0, NAVIGATION_TIMEOUT)
+            await page.evaluate(MARK_CARDS_READ_SCRIPT, [REVIEW_CARD_SELECTOR, READ_MARKER])
             await click_visible_button(page, "Newest")
-            await asyncio.sleep(1)
 
-            # Initialize variables for scrolling
-            print("Scrolling with mouse wheel and collecting HTML...")
-            start_time = time()
-            last_html = ""
+    with timed(stats, "wait"):
+        if capture is not None:
+            arrived = await capture.wait(NAVIGATION_TIMEOUT)
+        else:
+            arrived = await wait_for_unread_cards(page, NAVIGATION_TIMEOUT)
+    if not arrived:
+        print(f"No reviews appeared within {NAVIGATION_TIMEOUT:.0f}s.")
+
+async def iter_new_review_cards(page, budget: ScrollBudget):
+    """
+    Scrolls the reviews dialog and yields the outer HTML of the review cards added since the
+    previous scroll. Only new cards cross the browser boundary, so the cost stays linear in the
+    number of reviews. Cards are marked as read in the page (see READ_MARKER) rather than
+    counted, so cards of a re-rendered list are read again instead of skipped; the duplicates
+    are dropped by review ID on insert. After each scroll it waits for an unread card rather
+    than for a fixed delay. Stops when `budget` says so.
+    """
+    seen = 0
+
+    # Cards rendered with the first page
+    new_cards = await page.evaluate(NEW_CARDS_SCRIPT, [REVIEW_CARD_SELECTOR, READ_MARKER])
+    if new_cards:
+        seen += len(new_cards)
+        budget.stats["reviews_loaded"] = seen
+        yield new_cards
 
-            while True:
-                # Check if the timeout has been reached
-                if time() - start_time > scroll_timeout:
-                    print("Scroll timeout reached. Stopping scrolling.")
-                    break
+    while not budget.stop_reason():
+        with timed(budget.stats, "scroll"):
+            await page.mouse.wheel(0, 10000)
+            new_cards = []
+            if await wait_for_unread_cards(page, budget.wait_timeout()):
+                new_cards = await page.evaluate(NEW_CARDS_SCRIPT, [REVIEW_CARD_SELECTOR, READ_MARKER])
+        seen += len(new_cards)
+        budget.record(seen, bool(new_cards) or await is_loading(page))
+        if new_cards:
+            yield new_cards
 
-                # Perform explicit mouse scroll
-                await page.mouse.wheel(0, 10000)  # Scroll down by 1000 pixels
-                await asyncio.sleep(0.1)  # Minimal delay for smooth scrolling
+class ReviewResponseCapture:
+    """
+    Collects the reviews contained in the reviews RPC responses a page receives.
+    Responses for another sort order (e.g. the initial "Most relevant" page) are ignored unless
+    `sort` is None, and reviews already captured are dropped by review ID.
+    """
 
-                # Get the current HTML
-                current_html = await page.content()
+    def __init__(self, page, sort: int = SORT_NEWEST):
+        self.sort = sort
+        self.responses = 0
+        self._pending = []
+        self._seen_ids = set()
+        self._arrived = asyncio.Event()  # Set while reviews are pending
+        page.on("response", self._on_response)
 
-                # Detect if more content is loading
-                if current_html != last_html:
-                    last_html = current_html  # Update with the latest content
-                else:
-                    print("No more content to load. Stopping scrolling.")
-                    break
+    async def _on_response(self, response):
+        if "batchexecute" not in response.url or REVIEWS_RPC_ID not in response.url:
+            return
 
-            print("Finished scraping and saved the last HTML.")
-            return last_html
+        request_sort = reviews_request_sort(response.request.post_data or "")
+        if self.sort is not None and request_sort is not None and request_sort != self.sort:
+            return
 
+        try:
+            body = await response.text()
         except Exception as e:
-            print(f"Error during scraping: {str(e)}")
-        finally:
-            await browser.close()
+            print(f"Error reading review response: {e}")
+            return
+
+        self.responses += 1
+        for review in extract_reviews_from_rpc(body):
+            review_id = review.get("reviewid")
+            if review_id in self._seen_ids:
+                continue
+            self._seen_ids.add(review_id)
+            self._pending.append(review)
+        if self._pending:
+            self._arrived.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """
+        Waits up to `timeout` seconds for reviews to be pending. Returns whether any are.
+        """
+        try:
+            await asyncio.wait_for(self._arrived.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def drain(self) -> list:
+        """
+        Returns the reviews captured since the last call.
+        """
+        reviews, self._pending = self._pending, []
+        self._arrived.clear()
+        return reviews
+
+async def iter_captured_reviews(page, capture: ReviewResponseCapture, budget: ScrollBudget):
+    """
+    Scrolls the reviews dialog and yields the reviews `capture` decoded since the previous scroll.
+    After each scroll it waits for the next reviews response rather than for a fixed delay.
+    Stops when `budget` says so.
+    """
+    loaded = 0
+
+    # Reviews of the first page
+    new_reviews = capture.drain()
+    if new_reviews:
+        loaded += len(new_reviews)
+        budget.stats["reviews_loaded"] = loaded
+        yield new_reviews
+
+    while not budget.stop_reason():
+        with timed(budget.stats, "scroll"):
+            await page.mouse.wheel(0, 10000)
+            await capture.wait(budget.wait_timeout())
+        new_reviews = capture.drain()
+        loaded += len(new_reviews)
+        budget.record(loaded, bool(new_reviews) or await is_loading(page))
+        if new_reviews:
+            yield new_reviews
+
+def _is_reviews_rpc(url: str) -> bool:
+    return "batchexecute" in url and REVIEWS_RPC_ID in url
+
+def _with_query(url: str, **params) -> str:
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query, keep_blank_values=True))
+    query.update(params)
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+async def stream_review_variants(app_id: str, variants: list, max_seconds: float = 300, browser_pool=None,
+                                 max_idle_ticks: int = 3, batch_size: int = 100, profile=None,
+                                 stats: dict = None, target_reviews: int = None, concurrency: int = 3):
+    """
+    Scrapes several slices of an app's reviews (languages, sorts and star filters, see
+    review_variants) in one browser context, one page per variant with at most `concurrency`
+    pages open at a time, and yields review dicts merged and deduplicated by review ID.
+
+    Every page keeps the English UI so the same buttons can be clicked; its reviews RPC requests
+    are rewritten to the variant's language, sort and star filter before they leave the browser,
+    and the reviews are decoded from the responses as in "network" extraction.
+    Scrolling of every page stops as described in stream_play_store_reviews; the merge stops
+    early once `target_reviews` distinct reviews were loaded.
+    """
+    stats = stats if stats is not None else {}
+
+    async with open_context(browser_pool, profile) as context:
+        deadline = monotonic() + max_seconds if max_seconds else None
+
+        async def open_stream(variant, variant_stats):
+            remaining = deadline - monotonic() if deadline is not None else None
+            budget = ScrollBudget(remaining, target_reviews, max_idle_ticks, variant_stats)
+            return _stream_variant_page(context, app_id, variant, budget)
+
+        async with aclosing(merge_review_streams(variants, open_stream, batch_size, stats, target_reviews,
+                                                 concurrency)) as merged:
+            async for reviews in merged:
+                yield reviews
+
+async def _stream_variant_page(context, app_id: str, variant: dict, budget: ScrollBudget):
+    page = await context.new_page()
+    try:
+        async def rewrite(route):
+            request = route.request
+            await route.fallback(
+                url=_with_query(request.url, hl=variant["lang"], gl=variant["country"]),
+                post_data=apply_review_filters(request.post_data or "", SORTS[variant["sort"]], variant["stars"]),
+            )
+
+        # Every reviews request of this page is rewritten, so every response belongs to the variant
+        await page.route(_is_reviews_rpc, rewrite)
+        capture = ReviewResponseCapture(page, sort=None)
+        await open_reviews_dialog(page, app_id, budget.stats, capture, choose_sort=False)
+        async for reviews in iter_captured_reviews(page, capture, budget):
+            yield reviews
+    finally:
+        await page.close()
 
 # Example of how to run the asynchronous function
 # if __name__ == "__main__":
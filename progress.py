@@ -0,0 +1,97 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Job progress is kept this long after the last update
+PROGRESS_TTL_SECONDS = 24 * 3600
+
+FINAL_STATUSES = ("completed", "failed")
+
+INT_FIELDS = ("reviews_loaded", "reviews_inserted", "scroll_iterations", "pages_fetched", "total_reviews")
+
+
+def progress_key(job_id: str) -> str:
+    return f"scrape:progress:{job_id}"
+
+
+def progress_channel(job_id: str) -> str:
+    return f"scrape:progress:{job_id}:events"
+
+
+def _encode(value) -> str:
+    if value is None:
+        return ""
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def _decode(raw: dict) -> dict:
+    progress = {}
+    for key, value in raw.items():
+        key = key.decode() if isinstance(key, bytes) else key
+        value = value.decode() if isinstance(value, bytes) else value
+        if key in INT_FIELDS and value != "":
+            value = int(value)
+        progress[key] = value if value != "" else None
+    return progress
+
+
+async def read_progress(redis, job_id: str):
+    """
+    Returns the latest progress snapshot of `job_id`, or None if Redis has none.
+    """
+    raw = await redis.hgetall(progress_key(job_id))
+    return _decode(raw) if raw else None
+
+
+async def write_progress(redis, job_id: str, **fields):
+    """
+    Merges `fields` into the job's progress hash and publishes the full snapshot to its channel.
+    """
+    fields["job_id"] = job_id
+    fields["updated_at"] = datetime.now(timezone.utc).isoformat()
+    mapping = {key: _encode(value) for key, value in fields.items()}
+    key = progress_key(job_id)
+
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, PROGRESS_TTL_SECONDS)
+        pipe.hgetall(key)
+        *_, snapshot = await pipe.execute()
+
+    await redis.publish(progress_channel(job_id), json.dumps(_decode(snapshot)))
+
+
+class JobProgress:
+    """
+    Publishes a running job's progress to Redis: a hash for point reads and a pub/sub channel
+    for streaming clients. Failures are logged and ignored so progress never fails a job.
+    """
+
+    def __init__(self, redis, job_id: str, app_id: str):
+        self.redis = redis
+        self.job_id = job_id
+        self.app_id = app_id
+        self._last = None
+
+    async def update(self, **fields):
+        if self.redis is None:
+            return
+        try:
+            await write_progress(self.redis, self.job_id, app_id=self.app_id, **fields)
+        except Exception as e:
+            logger.warning(f"Error publishing progress for job {self.job_id}: {e}")
+
+    async def report_every(self, interval: float, snapshot):
+        """
+        Publishes `snapshot()` every `interval` seconds whenever it changed. Run it as a task
+        and cancel it when the job is done.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            fields = snapshot()
+            if fields != self._last:
+                self._last = fields
+                await self.update(**fields)
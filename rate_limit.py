@@ -0,0 +1,54 @@
+import asyncio
+
+# Refills the bucket from the time elapsed since the last call, then takes one token if available.
+# Returns 0 when a token was taken, otherwise the milliseconds until one will be.
+# Uses the Redis server clock so every worker process shares the same notion of time.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local state = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate / 1000)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "ts", now)
+redis.call("PEXPIRE", KEYS[1], math.ceil(capacity * 1000 / rate) + 1000)
+return wait
+"""
+
+
+class RedisTokenBucket:
+    """
+    Token bucket shared through Redis, so the limit holds across every worker process.
+    Allows `rate` requests per second on average with bursts of up to `capacity`.
+    """
+
+    def __init__(self, redis, key: str = "ratelimit:play_store", rate: float = 5.0, capacity: int = 10):
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self._script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+        self.waited_seconds = 0.0
+
+    async def acquire(self):
+        """
+        Waits until a token is available and takes it.
+        """
+        while True:
+            wait_ms = await self._script(keys=[self.key], args=[self.rate, self.capacity])
+            if not wait_ms:
+                return
+            self.waited_seconds += wait_ms / 1000
+            await asyncio.sleep(wait_ms / 1000)
@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from database import close_db
+from review_rows import parse_review_rows
+from scraping_task import insert_review_rows
+from snapshot_store import SNAPSHOT_DIR, SnapshotStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rows upserted per transaction
+REPARSE_INSERT_BATCH = int(os.getenv("REPARSE_INSERT_BATCH", "5000"))
+
+
+def parse_snapshot(root: str, app_id: str, digest: str, backend: str = None) -> list:
+    """
+    Loads one snapshot and returns its reviews as row tuples (see review_rows.parse_review_rows).
+    Runs in a worker process, so decompression, parsing and normalization all happen off the
+    main process.
+    """
+    html = SnapshotStore(root).get(digest)
+    return parse_review_rows(app_id, html, backend)
+
+
+async def reparse(store: SnapshotStore, app_ids=None, since: datetime = None, workers: int = None,
+                  backend: str = None, dry_run: bool = False) -> dict:
+    """
+    Re-parses every stored snapshot matching `app_ids` and `since` with the current parser in a
+    process pool and upserts the resulting rows in batches of REPARSE_INSERT_BATCH.
+    Content shared by several jobs of an app is parsed once. Snapshots are applied oldest job
+    first, so a review found in several of them keeps the row of the newest.
+    The rows of a snapshot replace the reviews last stored from it: when a parser fix changes
+    review IDs (they hash the parsed fields), the rows under the old IDs are deleted rather than
+    kept next to the new ones. Reviews stored before rows recorded their snapshot are only upserted.
+
+    :return: Counters of the run.
+    """
+    # Oldest job first; a snapshot shared by several jobs counts as scraped by the newest of them
+    manifests = sorted(store.iter_manifests(app_ids, since),
+                       key=lambda manifest: datetime.fromisoformat(manifest["created_at"]))
+    tasks = {}
+    for manifest in manifests:
+        created_at = datetime.fromisoformat(manifest["created_at"])
+        for snapshot in manifest["snapshots"]:
+            tasks[(manifest["app_id"], snapshot["digest"])] = created_at
+    keys = sorted(tasks, key=tasks.get)
+    logger.info(f"Re-parsing {len(tasks)} snapshots from {len(manifests)} jobs")
+
+    counters = {"jobs": len(manifests), "snapshots": len(tasks), "failed": 0, "rows": 0}
+    pending = {}  # Review ID -> (row, digest and created_at of the snapshot it was parsed from)
+    parsed_digests = []  # Snapshots whose rows are all in `pending`
+    loop = asyncio.get_running_loop()
+
+    async def flush():
+        rows = [row for row, _, _ in pending.values()]
+        digests = [digest for _, digest, _ in pending.values()]
+        replaced = list(parsed_digests)
+        pending.clear()
+        parsed_digests.clear()
+        if rows and not dry_run:
+            await insert_review_rows(rows, digests, replaced)
+        counters["rows"] += len(rows)
+
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        remaining = iter(keys)
+        in_flight = deque()
+
+        def submit():
+            # Keep a few snapshots queued per process so workers never idle
+            while len(in_flight) < workers * 4:
+                key = next(remaining, None)
+                if key is None:
+                    return
+                future = loop.run_in_executor(pool, parse_snapshot, str(store.root), key[0], key[1], backend)
+                in_flight.append((future, key))
+
+        submit()
+        done_count = 0
+        while in_flight:
+            # Results are taken in snapshot order, not completion order, so when snapshots disagree
+            # about a review the newest one wins, across flushes too
+            future, (app_id, digest) = in_flight.popleft()
+            created_at = tasks[(app_id, digest)]
+            try:
+                rows = await future
+            except Exception as e:
+                counters["failed"] += 1
+                logger.warning(f"Error re-parsing snapshot {digest} of {app_id}: {e}")
+                rows = None
+            for row in rows or ():
+                # Review IDs must be unique within one upsert
+                current = pending.get(row[1])
+                if current is None or (current[2], current[1]) <= (created_at, digest):
+                    pending[row[1]] = (row, digest, created_at)
+            if rows:
+                # A snapshot that no longer parses to any review more likely hit a parser
+                # bug than lost its reviews, so its stored rows are left alone
+                parsed_digests.append(digest)
+            if rows is not None:
+                done_count += 1
+            if len(pending) >= REPARSE_INSERT_BATCH:
+                await flush()
+            submit()
+            if done_count and done_count % 100 == 0:
+                logger.info(f"{done_count}/{len(tasks)} snapshots parsed, {counters['rows']} rows stored")
+        await flush()
+
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-parse stored HTML snapshots and upsert the reviews.")
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR or "snapshots")
+    parser.add_argument("--app-id", action="append", dest="app_ids", help="Only this app (repeatable)")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Only jobs scraped at or after this ISO date")
+    parser.add_argument("--workers", type=int, help="Parser processes, the CPU count by default")
+    parser.add_argument("--backend", help="HTML parser backend, see html6.parse_reviews")
+    parser.add_argument("--dry-run", action="store_true", help="Parse and count, but do not write to the database")
+    args = parser.parse_args()
+
+    since = args.since
+    if since is not None and since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+
+    async def run():
+        try:
+            return await reparse(SnapshotStore(args.snapshot_dir), args.app_ids, since, args.workers, args.backend,
+                                 args.dry_run)
+        finally:
+            await close_db()
+
+    counters = asyncio.run(run())
+    logger.info(f"Re-parse finished: {counters}")
+
+
+if __name__ == "__main__":
+    main()
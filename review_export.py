@@ -0,0 +1,197 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+from datetime import date, datetime, time, timedelta
+
+from database import acquire
+from review_rows import REVIEW_COLUMNS
+
+# Optional: Parquet exports need pyarrow
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched from the server-side cursor per round trip; also the Parquet row group size
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+# Exports running at the same time in one web process; each holds a review pool connection
+EXPORT_MAX_CONCURRENCY = int(os.getenv("EXPORT_MAX_CONCURRENCY", "2"))
+
+# Format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+export_slots = asyncio.Semaphore(EXPORT_MAX_CONCURRENCY)
+
+
+async def iter_review_chunks(app_id: str, since: date = None, until: date = None,
+                             chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """
+    Yields an app's reviews as lists of at most `chunk_rows` records with the REVIEW_COLUMNS,
+    read through a server-side cursor so neither Postgres nor this process materializes the result.
+    Dated reviews come first, oldest first, along reviews_app_reviewed_at_idx; reviews without
+    a date follow unless `since` or `until` (inclusive dates) are given.
+    """
+    conditions = ["app_id = $1", "reviewed_at IS NOT NULL"]
+    params = [app_id]
+    if since is not None:
+        params.append(datetime.combine(since, time.min))
+        conditions.append(f"reviewed_at >= ${len(params)}")
+    if until is not None:
+        params.append(datetime.combine(until + timedelta(days=1), time.min))
+        conditions.append(f"reviewed_at < ${len(params)}")
+    columns = ", ".join(REVIEW_COLUMNS)
+    queries = [(f'''
+        SELECT {columns}
+        FROM reviews
+        WHERE {" AND ".join(conditions)}
+        ORDER BY reviewed_at, review_id
+    ''', params)]
+    if since is None and until is None:
+        queries.append((f'''
+            SELECT {columns}
+            FROM reviews
+            WHERE app_id = $1 AND reviewed_at IS NULL
+        ''', [app_id]))
+
+    async with acquire("review") as conn:
+        # Cursors only live inside a transaction
+        async with conn.transaction(readonly=True):
+            for query, query_params in queries:
+                cursor = await conn.cursor(query, *query_params)
+                while True:
+                    rows = await cursor.fetch(chunk_rows)
+                    if not rows:
+                        break
+                    yield rows
+
+
+def encode_ndjson(chunks):
+    """
+    One JSON object per review and line.
+    """
+    async def encode():
+        async for rows in chunks:
+            yield "".join(json.dumps(dict(row), default=str) + "\n" for row in rows).encode("utf-8")
+    return encode()
+
+
+def encode_csv(chunks):
+    """
+    A header line, then one CSV record per review.
+    """
+    async def encode():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(REVIEW_COLUMNS)
+        async for rows in chunks:
+            writer.writerows(rows)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")  # Only the header, for an empty export
+    return encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only file handing its bytes over chunk by chunk. Tracks the absolute position
+    # itself because the Parquet footer records the offsets of earlier row groups.
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def parquet_schema():
+    return pa.schema([
+        ("app_id", pa.string()),
+        ("review_id", pa.string()),
+        ("user_name", pa.string()),
+        ("content", pa.string()),
+        ("score", pa.int32()),
+        ("thumbs_up_count", pa.int32()),
+        ("reviewed_at", pa.timestamp("us")),
+        ("reply_content", pa.string()),
+        ("replied_at", pa.timestamp("us")),
+    ])
+
+
+def encode_parquet(chunks):
+    """
+    A Parquet file with one row group per chunk, sent as each row group is written.
+    """
+    if pa is None:
+        raise RuntimeError("Parquet exports need pyarrow")
+    schema = parquet_schema()
+
+    async def encode():
+        sink = _ChunkSink()
+        with pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd") as writer:
+            async for rows in chunks:
+                columns = [[str(row[i]) if name == "review_id" else row[i] for row in rows]
+                           for i, name in enumerate(REVIEW_COLUMNS)]
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                yield sink.take()
+        yield sink.take()  # Footer
+    return encode()
+
+
+ENCODERS = {
+    "ndjson": encode_ndjson,
+    "csv": encode_csv,
+    "parquet": encode_parquet,
+}
+
+
+def export_reviews(app_id: str, export_format: str, since: date = None, until: date = None):
+    """
+    Returns an async iterator of the encoded bytes of an app's reviews in `export_format`
+    (see EXPORT_FORMATS). Memory stays at about one chunk of EXPORT_CHUNK_ROWS rows whatever the
+    size of the export, and the consumer's pace throttles the cursor. At most
+    EXPORT_MAX_CONCURRENCY exports run at once; others wait for a slot.
+    Raises RuntimeError if the format's optional dependency is missing.
+    """
+    chunks = iter_review_chunks(app_id, since, until)
+    encoded = ENCODERS[export_format](chunks)
+
+    async def stream():
+        try:
+            async with export_slots:
+                async for data in encoded:
+                    if data:
+                        yield data
+        except Exception as e:
+            # Headers are already sent; dropping the connection tells the client the file is incomplete
+            logger.error(f"Export of reviews for {app_id} failed: {e}")
+            raise
+        finally:
+            # Releases the cursor's connection right away, also when the client disconnects
+            await encoded.aclose()
+            await chunks.aclose()
+    return stream()
@@ -0,0 +1,196 @@
+import base64
+import json
+from datetime import date, datetime
+
+from database import acquire, run_prepared
+from review_rows import NO_REPLY_CONTENT
+
+# Columns returned by the review read API
+REVIEW_FIELDS = (
+    "review_id", "user_name", "content", "score", "thumbs_up_count",
+    "reviewed_at", "reply_content", "replied_at",
+)
+
+# Reviews per page of GET /apps/{app_id}/reviews
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# First key of the advisory locks serializing rollup updates per app (the second is the app's hash)
+ROLLUP_LOCK_CLASS = 7301846
+
+# Adds the change a staged batch makes to review_daily_stats. Must run in the transaction that
+# upserts `reviews_staging` into `reviews`, before the upsert: a review already stored first
+# takes back its old contribution, then adds its new one, since the upsert overwrites every
+# parsed column.
+ROLLUP_DELTA_SQL = '''
+    WITH changes AS (
+        SELECT r.app_id, r.reviewed_at::date AS day, COALESCE(r.score, 0) AS score,
+               -1 AS reviews, -(COALESCE(r.reply_content, $1) <> $1)::int AS replied
+        FROM reviews_staging s
+        JOIN reviews r ON r.review_id = s.review_id
+        WHERE r.reviewed_at IS NOT NULL
+        UNION ALL
+        SELECT app_id, reviewed_at::date, COALESCE(score, 0),
+               1, (COALESCE(reply_content, $1) <> $1)::int
+        FROM reviews_staging
+        WHERE reviewed_at IS NOT NULL
+    )
+    INSERT INTO review_daily_stats AS stats (app_id, day, score, reviews, replied)
+    SELECT app_id, day, score, sum(reviews), sum(replied)
+    FROM changes
+    GROUP BY app_id, day, score
+    HAVING sum(reviews) <> 0 OR sum(replied) <> 0
+    ON CONFLICT (app_id, day, score)
+    DO UPDATE SET
+        reviews = stats.reviews + EXCLUDED.reviews,
+        replied = stats.replied + EXCLUDED.replied
+'''
+
+
+# Deletes the reviews last parsed from the snapshots in $2 that are not in `reviews_staging`
+# (their re-parsed rows have other IDs) and takes their contribution out of review_daily_stats
+REPLACED_REVIEWS_SQL = '''
+    WITH removed AS (
+        DELETE FROM reviews r
+        WHERE r.snapshot_digest = ANY($2::text[])
+          AND NOT EXISTS (SELECT 1 FROM reviews_staging s WHERE s.review_id = r.review_id)
+        RETURNING r.app_id, r.reviewed_at, r.score, r.reply_content
+    )
+    INSERT INTO review_daily_stats AS stats (app_id, day, score, reviews, replied)
+    SELECT app_id, reviewed_at::date, COALESCE(score, 0), -count(*),
+           -count(*) FILTER (WHERE COALESCE(reply_content, $1) <> $1)
+    FROM removed
+    WHERE reviewed_at IS NOT NULL
+    GROUP BY 1, 2, 3
+    ON CONFLICT (app_id, day, score)
+    DO UPDATE SET
+        reviews = stats.reviews + EXCLUDED.reviews,
+        replied = stats.replied + EXCLUDED.replied
+'''
+
+
+async def update_review_rollups(conn, replaced_snapshots: list = None):
+    """
+    Applies the batch in `reviews_staging` to review_daily_stats (see ROLLUP_DELTA_SQL).
+    With `replaced_snapshots` (snapshot digests), the batch replaces every review last parsed
+    from those snapshots: the ones missing from it are deleted first (see REPLACED_REVIEWS_SQL).
+    Takes a transaction-level lock per app first, so concurrent writers of the same app cannot
+    both count a review as new.
+    """
+    replaced_snapshots = list(replaced_snapshots or ())
+    await conn.execute('''
+        SELECT pg_advisory_xact_lock($1, hashtext(app_id))
+        FROM (
+            SELECT app_id FROM reviews_staging
+            UNION
+            SELECT app_id FROM reviews WHERE snapshot_digest = ANY($2::text[])
+        ) AS apps
+        ORDER BY app_id
+    ''', ROLLUP_LOCK_CLASS, replaced_snapshots)
+    if replaced_snapshots:
+        await conn.execute(REPLACED_REVIEWS_SQL, NO_REPLY_CONTENT, replaced_snapshots)
+    await conn.execute(ROLLUP_DELTA_SQL, NO_REPLY_CONTENT)
+
+
+def encode_cursor(reviewed_at: datetime, review_id) -> str:
+    """
+    Returns the opaque cursor of the page following the review with this (reviewed_at, review_id).
+    """
+    key = json.dumps([reviewed_at.isoformat(), str(review_id)])
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Reverses encode_cursor, raising ValueError for anything it did not produce.
+    """
+    try:
+        reviewed_at, review_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(reviewed_at), review_id
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+async def list_reviews(app_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None, score: int = None) -> dict:
+    """
+    Returns one page of an app's reviews, newest first, with keyset pagination on
+    (reviewed_at, review_id): every page is a range scan of reviews_app_reviewed_at_idx (or
+    reviews_app_score_reviewed_at_idx with `score`), however deep it is.
+    Reviews whose date could not be parsed are not listed.
+
+    :param cursor: The "next_cursor" of the previous page, or None for the first page.
+    :return: {"reviews": [...], "next_cursor": str or None once the last page is reached}.
+    """
+    conditions = ["app_id = $1", "reviewed_at IS NOT NULL"]
+    params = [app_id]
+    if score is not None:
+        params.append(score)
+        conditions.append(f"score = ${len(params)}")
+    if cursor:
+        reviewed_at, review_id = decode_cursor(cursor)
+        params += [reviewed_at, review_id]
+        conditions.append(f"(reviewed_at, review_id) < (${len(params) - 1}, ${len(params)})")
+    params.append(limit + 1)  # One extra row tells whether there is a next page
+
+    async with acquire("review") as conn:
+        rows = await conn.fetch(f'''
+            SELECT {", ".join(REVIEW_FIELDS)}
+            FROM reviews
+            WHERE {" AND ".join(conditions)}
+            ORDER BY reviewed_at DESC, review_id DESC
+            LIMIT ${len(params)}
+        ''', *params)
+
+    reviews = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = reviews[-1]
+        next_cursor = encode_cursor(last["reviewed_at"], last["review_id"])
+    return {"reviews": reviews, "next_cursor": next_cursor}
+
+
+async def get_review_summary(app_id: str, since: date = None, until: date = None) -> dict:
+    """
+    Returns the score histogram, average score and reply rate of an app's reviews dated between
+    `since` and `until` (inclusive, both optional), read from review_daily_stats.
+    Reviews without a valid score (stored as 0) are not counted.
+    """
+    async with acquire("review") as conn:
+        rows = await run_prepared(conn, "review_summary", app_id, since, until)
+
+    histogram = {str(score): 0 for score in range(1, 6)}
+    total = replied = score_sum = 0
+    for row in rows:
+        histogram[str(row["score"])] = row["reviews"]
+        total += row["reviews"]
+        replied += row["replied"]
+        score_sum += row["score"] * row["reviews"]
+
+    return {
+        "app_id": app_id,
+        "total_reviews": total,
+        "average_score": round(score_sum / total, 3) if total else None,
+        "scores": histogram,
+        "replied": replied,
+        "reply_rate": round(replied / total, 4) if total else None,
+    }
+
+
+async def get_daily_review_counts(app_id: str, since: date = None, until: date = None) -> list:
+    """
+    Returns reviews, replied reviews and the average score per day for an app, oldest day first,
+    read from review_daily_stats. Days without reviews are omitted, and reviews without a valid
+    score (stored as 0) are not counted.
+    """
+    async with acquire("review") as conn:
+        rows = await run_prepared(conn, "daily_review_counts", app_id, since, until)
+
+    return [
+        {
+            "day": row["day"],
+            "reviews": row["reviews"],
+            "replied": row["replied"],
+            "average_score": round(row["average_score"], 3),
+        }
+        for row in rows
+    ]
@@ -0,0 +1,163 @@
+import asyncio
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from uuid import UUID, uuid5
+
+from html6 import parse_reviews
+
+# Kept free of database and web imports: these functions also run in parser worker processes
+# (see create_parse_executor and reparse.py).
+
+# Where parsing and normalization run: "thread" (default), "process" or "inline" (on the event loop)
+PARSE_EXECUTOR = os.getenv("PARSE_EXECUTOR", "thread")
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0"))  # Threads or processes, 0 for the executor's default
+
+# Namespace for deterministic review IDs, so re-scraping the same review updates it in place
+REVIEW_ID_NAMESPACE = UUID("6f1d3c2e-5b7a-4e8f-9a0d-2c4b6e8f1a3d")
+
+REVIEW_COLUMNS = (
+    "app_id", "review_id", "user_name", "content",
+    "score", "thumbs_up_count", "reviewed_at",
+    "reply_content", "replied_at",
+)
+
+# Stored in place of a missing developer reply
+NO_REPLY_CONTENT = "No reply content"
+
+# Positions in a row tuple
+ROW_REVIEW_ID = REVIEW_COLUMNS.index("review_id")
+ROW_REVIEWED_AT = REVIEW_COLUMNS.index("reviewed_at")
+
+def make_review_id(app_id: str, user_name: str, reviewed_at: str, content: str) -> str:
+    """
+    Returns a stable review ID derived from the app, author, review date and content.
+    """
+    key = "\x1f".join((app_id, user_name or "", reviewed_at or "", content or ""))
+    return str(uuid5(REVIEW_ID_NAMESPACE, key))
+
+def _parse_review_date(value):
+    # Parse reviewed_at (e.g., 'January 3, 2025' -> %B %d, %Y)
+    try:
+        return datetime.strptime(value, "%B %d, %Y")
+    except (TypeError, ValueError):
+        return None
+
+def _parse_thumbs_up(value) -> int:
+    # The page renders e.g. "1,234 people found this review helpful"
+    if value is None:
+        return 0
+    if isinstance(value, int):
+        return value
+    match = re.match(r"\s*([\d,]+)", str(value))
+    return int(match.group(1).replace(",", "")) if match else 0
+
+def normalize_reviews(app_id: str, reviews: list) -> list:
+    """
+    Converts scraped review dicts into row tuples ordered like REVIEW_COLUMNS.
+    Handles null values by using default values, truncates text to the column limits and
+    drops duplicates within the batch. Dates are parsed once per distinct value.
+    """
+    parsed_dates = {}
+    rows = {}
+
+    for review in reviews:
+        # Handle null or missing fields with default values
+        username = str(review.get("username") or "Anonymous")
+        content = str(review.get("content") or "No review content provided")
+
+        # Ensure score is an integer and handle invalid cases (e.g., score being a string)
+        score = review.get("score") or 0
+        if isinstance(score, str):
+            try:
+                score = int(score)  # Convert to int if it's a string
+            except ValueError:
+                score = 0  # Default to 0 if conversion fails
+
+        thumbs_up_count = _parse_thumbs_up(review.get("thumbsupcount"))
+
+        # Parse reviewed_at once per distinct date, None if parsing fails.
+        # Reviews decoded from the network carry the exact timestamp instead.
+        raw_reviewed_at = review.get("reviewedat")
+        reviewed_at = review.get("reviewedts")
+        if reviewed_at is None and raw_reviewed_at:
+            if raw_reviewed_at not in parsed_dates:
+                parsed_dates[raw_reviewed_at] = _parse_review_date(raw_reviewed_at)
+            reviewed_at = parsed_dates[raw_reviewed_at]
+
+        # Handle the case where 'repliedcontent' is None
+        replied_content = review.get("repliedcontent") or NO_REPLY_CONTENT
+
+        review_id = make_review_id(app_id, username, raw_reviewed_at, content)
+        rows[review_id] = (
+            app_id,
+            review_id,
+            username[:255],  # Truncate username to fit database constraints
+            content[:10000],  # Truncate content to fit database constraints
+            score,
+            thumbs_up_count,
+            reviewed_at,
+            replied_content[:10000],  # Truncate reply content
+            review.get("repliedts"),  # Only known for reviews decoded from the network
+        )
+
+    return list(rows.values())
+
+def parse_review_rows(app_id: str, html: str, backend: str = None) -> list:
+    """
+    Parses review HTML straight into row tuples (see normalize_reviews).
+    """
+    return normalize_reviews(app_id, parse_reviews(html, backend))
+
+def row_key(row: tuple) -> tuple:
+    """
+    Returns the (review_id, reviewed_at) pair of a row, used as a high-water mark.
+    """
+    return row[ROW_REVIEW_ID], row[ROW_REVIEWED_AT]
+
+def cut_at_high_water_mark(rows: list, high_water_mark: dict):
+    """
+    Keeps the rows newer than `high_water_mark`, assuming `rows` is sorted newest first.
+    A review is known once its ID matches the mark or its day is before the mark's day
+    (rendered dates only have day precision, so same-day reviews are kept and deduplicated on insert).
+
+    :return: The new rows and whether the mark was reached.
+    """
+    mark_id = high_water_mark.get("newest_review_id")
+    mark_date = high_water_mark.get("newest_reviewed_at")
+
+    for i, row in enumerate(rows):
+        if row[ROW_REVIEW_ID] == mark_id:
+            return rows[:i], True
+        reviewed_at = row[ROW_REVIEWED_AT]
+        if mark_date and reviewed_at and reviewed_at.date() < mark_date.date():
+            return rows[:i], True
+
+    return rows, False
+
+def create_parse_executor(kind: str = None, workers: int = None):
+    """
+    Returns the executor parse_review_rows and normalize_reviews run in, or None for "inline".
+    Selectolax and lxml release the GIL while parsing, so threads already keep the event loop
+    free; processes also spread the Python side of normalization over several cores.
+    """
+    kind = kind or PARSE_EXECUTOR
+    workers = workers or PARSE_WORKERS or None
+    if kind == "inline":
+        return None
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="parse")
+    if kind == "process":
+        # Spawned, not forked: the worker process already runs an event loop and browser threads
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    raise ValueError(f"Unknown parse executor: {kind}")
+
+async def run_parser(executor, func, *args):
+    """
+    Runs `func(*args)` in `executor`, or directly on the event loop if `executor` is None.
+    """
+    if executor is None:
+        return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
@@ -0,0 +1,159 @@
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode
+from zoneinfo import ZoneInfo
+
+# batchexecute RPC the reviews dialog calls for every page of reviews
+REVIEWS_RPC_ID = "UsvDTd"
+
+# Sort codes sent in the reviews RPC request
+SORT_MOST_RELEVANT = 1
+SORT_NEWEST = 2
+SORT_RATING = 3
+
+# Every batchexecute response body starts with this anti-JSON-hijacking prefix
+RESPONSE_PREFIX = ")]}'"
+
+# Timezone review dates are rendered in. Browser contexts are pinned to it (see
+# play9.open_context) and decoded reviews format their date in it, so a review gets the same
+# date string, and therefore the same review ID, from a card and from the RPC.
+REVIEW_DATE_TIMEZONE = os.getenv("REVIEW_DATE_TIMEZONE", "UTC")
+_review_date_zone = ZoneInfo(REVIEW_DATE_TIMEZONE)
+
+_decoder = json.JSONDecoder()
+
+
+def _get(data, *path):
+    # Walks nested lists, returning None as soon as an index is missing
+    for index in path:
+        if not isinstance(data, list) or not -len(data) <= index < len(data):
+            return None
+        data = data[index]
+    return data
+
+
+def _format_date(timestamp: datetime) -> str:
+    # Same format and timezone the reviews page renders, e.g. "January 3, 2025"
+    day = timestamp.replace(tzinfo=timezone.utc).astimezone(_review_date_zone)
+    return f"{day:%B} {day.day}, {day.year}"
+
+
+def _timestamp(seconds) -> Optional[datetime]:
+    # Naive UTC, like the other timestamps written to `reviews`
+    if not isinstance(seconds, (int, float)):
+        return None
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).replace(tzinfo=None)
+
+
+def iter_rpc_payloads(body: str):
+    """
+    Yields (rpc_id, payload) for every "wrb.fr" entry in a batchexecute response body.
+    Handles both plain responses and length-prefixed chunked ones (rt=c).
+    """
+    if body.startswith(RESPONSE_PREFIX):
+        body = body[len(RESPONSE_PREFIX):]
+
+    position = 0
+    length = len(body)
+    while position < length:
+        # Skip whitespace and the chunk length lines between JSON arrays
+        if body[position] != "[":
+            position += 1
+            continue
+        try:
+            chunk, position = _decoder.raw_decode(body, position)
+        except json.JSONDecodeError:
+            position += 1
+            continue
+        for entry in chunk if isinstance(chunk, list) else []:
+            if isinstance(entry, list) and _get(entry, 0) == "wrb.fr" and isinstance(_get(entry, 2), str):
+                yield entry[1], entry[2]
+
+
+def decode_review(data: list) -> Optional[Dict]:
+    """
+    Converts one review array from the reviews RPC into the dict schema of
+    html6.extract_reviews_from_html, plus the exact values the page does not render:
+    "reviewid", "reviewedts" and "repliedts". "reviewedat" is the date as the page renders it
+    in REVIEW_DATE_TIMEZONE.
+    """
+    if not isinstance(data, list):
+        return None
+
+    reviewed_ts = _timestamp(_get(data, 5, 0))
+    thumbs_up_count = _get(data, 6)
+    score = _get(data, 2)
+
+    return {
+        "username": _get(data, 1, 0),
+        "content": _get(data, 4),
+        "score": str(score) if score is not None else "0",
+        "thumbsupcount": str(thumbs_up_count) if thumbs_up_count is not None else None,
+        "reviewedat": _format_date(reviewed_ts) if reviewed_ts else None,
+        "repliedcontent": _get(data, 7, 1),
+        "reviewid": _get(data, 0),
+        "reviewedts": reviewed_ts,
+        "repliedts": _timestamp(_get(data, 7, 2, 0)),
+    }
+
+
+def decode_reviews_payload(payload: str) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Decodes the payload of one reviews RPC.
+
+    :return: The decoded reviews and the continuation token for the next page, if any.
+    """
+    data = json.loads(payload)
+    reviews = [review for review in map(decode_review, _get(data, 0) or []) if review]
+    token = _get(data, -2, -1)
+    return reviews, token if isinstance(token, str) else None
+
+
+def extract_reviews_from_rpc(body: str) -> List[Dict]:
+    """
+    Returns every review contained in a batchexecute response body.
+    """
+    reviews = []
+    for rpc_id, payload in iter_rpc_payloads(body):
+        if rpc_id == REVIEWS_RPC_ID:
+            reviews.extend(decode_reviews_payload(payload)[0])
+    return reviews
+
+
+def reviews_request_sort(post_data: str) -> Optional[int]:
+    """
+    Returns the sort code of a reviews RPC request body, or None if it cannot be read.
+    """
+    try:
+        request = json.loads(parse_qs(post_data)["f.req"][0])
+        for call in _get(request, 0) or []:
+            if _get(call, 0) == REVIEWS_RPC_ID:
+                return _get(json.loads(call[1]), 2, 1)
+    except (KeyError, TypeError, ValueError):
+        pass
+    return None
+
+
+def apply_review_filters(post_data: str, sort: int = None, stars: int = None) -> str:
+    """
+    Returns a reviews RPC request body with its sort code and star filter replaced.
+    Bodies that cannot be read are returned unchanged.
+    """
+    try:
+        form = parse_qs(post_data, keep_blank_values=True)
+        request = json.loads(form["f.req"][0])
+        for call in _get(request, 0) or []:
+            if _get(call, 0) != REVIEWS_RPC_ID:
+                continue
+            params = json.loads(call[1])
+            if sort is not None:
+                params[2][1] = sort
+            if stars is not None:
+                params[2][4] = [None, stars]
+            call[1] = json.dumps(params, separators=(",", ":"))
+        form["f.req"] = [json.dumps(request, separators=(",", ":"))]
+        return urlencode(form, doseq=True)
+    except (KeyError, IndexError, TypeError, ValueError):
+        return post_data
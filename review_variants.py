@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from contextlib import aclosing
+
+from review_rpc import SORT_MOST_RELEVANT, SORT_NEWEST, SORT_RATING
+
+logger = logging.getLogger(__name__)
+
+# Sort names accepted in a variant, mapped to the sort codes of the reviews RPC
+SORTS = {
+    "newest": SORT_NEWEST,
+    "relevant": SORT_MOST_RELEVANT,
+    "rating": SORT_RATING,
+}
+
+DEFAULT_VARIANT = {"lang": "en", "country": "us", "sort": "newest", "stars": None}
+
+# Counters of the per-variant stats dicts summed into the job's stats
+SUMMED_STATS = ("scroll_iterations", "pages_fetched")
+
+
+def normalize_variants(variants: list) -> list:
+    """
+    Fills in defaults, validates and deduplicates a list of variant dicts.
+    A variant selects one slice of an app's reviews: a language ("lang", "country"),
+    a sort ("newest", "relevant" or "rating") and optionally a star rating ("stars", 1-5).
+    """
+    normalized = []
+    for variant in variants:
+        variant = {**DEFAULT_VARIANT, **{key: value for key, value in variant.items() if value is not None}}
+        if variant["sort"] not in SORTS:
+            raise ValueError(f"Unknown sort: {variant['sort']}")
+        if variant["stars"] is not None and variant["stars"] not in range(1, 6):
+            raise ValueError(f"Star filter must be between 1 and 5: {variant['stars']}")
+        if variant not in normalized:
+            normalized.append(variant)
+    return normalized
+
+
+def variant_label(variant: dict) -> str:
+    stars = f"/{variant['stars']}*" if variant.get("stars") else ""
+    return f"{variant['lang']}-{variant['country']}/{variant['sort']}{stars}"
+
+
+def _dedupe_key(review: dict):
+    # Decoded reviews carry their ID; fall back to the fields make_review_id uses
+    return review.get("reviewid") or (review.get("username"), review.get("reviewedat"), review.get("content"))
+
+
+async def merge_review_streams(variants: list, open_stream, batch_size: int = 100, stats: dict = None,
+                               target_reviews: int = None, concurrency: int = 3):
+    """
+    Runs one review stream per variant, at most `concurrency` at a time, and yields their reviews
+    merged into batches of at least `batch_size` (except the last one), dropping reviews already
+    yielded by another variant.
+
+    :param open_stream: Called as `open_stream(variant, variant_stats)`; returns an async generator
+                        of review dict lists and keeps its own counters in `variant_stats`.
+    :param stats: Optional dict receiving the merged "reviews_loaded", the summed scroll/page
+                  counters and stage timings, "stop_reason" and "variants" (per-variant stop reasons).
+    :param target_reviews: Stop once this many distinct reviews were yielded.
+
+    A failing variant is logged and skipped; the merge only fails if every variant failed.
+    """
+    stats = stats if stats is not None else {}
+    variant_stats = [{} for _ in variants]
+    queue = asyncio.Queue(maxsize=max(1, concurrency) * 2)
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = []
+
+    async def run(variant, own_stats):
+        try:
+            async with semaphore:
+                stream = open_stream(variant, own_stats)
+                async with aclosing(stream):
+                    async for reviews in stream:
+                        await queue.put(reviews)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Review variant {variant_label(variant)} failed: {e}")
+            own_stats["stop_reason"] = "error"
+            errors.append(e)
+
+    async def finish(tasks):
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await queue.put(None)  # End of all streams
+
+    def update_stats():
+        for counter in SUMMED_STATS:
+            total = sum(own.get(counter, 0) for own in variant_stats)
+            if total:
+                stats[counter] = total
+
+    tasks = [asyncio.create_task(run(variant, own)) for variant, own in zip(variants, variant_stats)]
+    finisher = asyncio.create_task(finish(tasks))
+    seen = set()
+    batch = []
+    try:
+        while True:
+            reviews = await queue.get()
+            if reviews is None:
+                break
+            for review in reviews:
+                key = _dedupe_key(review)
+                if key not in seen:
+                    seen.add(key)
+                    batch.append(review)
+            stats["reviews_loaded"] = len(seen)
+            update_stats()
+            if target_reviews and len(seen) >= target_reviews:
+                # Drop what the last response brought beyond the target
+                del batch[len(batch) - (len(seen) - target_reviews):]
+                stats["reviews_loaded"] = target_reviews
+                stats["stop_reason"] = "target_reached"
+                break
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        if errors and len(errors) == len(variants):
+            raise errors[0]
+        if batch:
+            yield batch
+    finally:
+        for task in tasks + [finisher]:
+            task.cancel()
+        await asyncio.gather(*tasks, finisher, return_exceptions=True)
+
+        update_stats()
+        for own in variant_stats:
+            for stage, seconds in own.get("stage_seconds", {}).items():
+                stage_seconds = stats.setdefault("stage_seconds", {})
+                stage_seconds[stage] = stage_seconds.get(stage, 0.0) + seconds
+        reasons = [own.get("stop_reason") for own in variant_stats]
+        stats["variants"] = {variant_label(variant): reason for variant, reason in zip(variants, reasons)}
+        if "stop_reason" not in stats:
+            # The job ran out of time if any slice did; otherwise every slice was read to the end
+            stats["stop_reason"] = "time_budget" if "time_budget" in reasons else "exhausted"
@@ -2,126 +2,406 @@ from fastapi import FastAPI, HTTPException, BackgroundTasks
 from pydantic import BaseModel
 from uuid import uuid4
 from datetime import datetime, timezone
-from play9 import scrape_play_store_html  # Import the scraping function
-from database import get_review_pool, get_status_pool  # Database connection pool imports
+from play9 import scrape_play_store_html, stream_play_store_reviews, stream_review_variants  # Import the scraping functions
+from database import acquire, get_high_water_mark, update_high_water_mark, update_job_status
 from bs4 import BeautifulSoup
-from html6 import extract_reviews_from_html
 from uuid import uuid4
 import json
 import ast
 from arq import create_pool
 from arq.connections import RedisSettings  # Scraping function
-from html6 import extract_reviews_from_html  # Review extraction
-from main5 import update_job_status
+from page_profile import PageProfile
+from review_rows import (
+    REVIEW_COLUMNS, cut_at_high_water_mark, normalize_reviews, parse_review_rows, row_key, run_parser,
+)
+from review_queries import update_review_rollups
+from review_variants import normalize_variants
+from snapshot_store import JobSnapshots
+from job_cache import mark_job_finished, refresh_job_inflight, scrape_params
+from progress import JobProgress
+from metrics import (
+    SCRAPE_HTML_BYTES, SCRAPE_REVIEWS,
+    observe_insert, observe_job, stage_breakdown, timed,
+)
+import asyncio
+from contextlib import aclosing
 import logging
+import os
+from time import perf_counter
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def scrape_reviews_task(ctx,app_id: str, job_id: str):
+# Scraping settings
+SCRAPE_EXTRACTION = os.getenv("SCRAPE_EXTRACTION", "cards")  # "cards", "network" or "page", see play9
+SCRAPE_MAX_SECONDS = float(os.getenv("SCRAPE_MAX_SECONDS", "600"))  # Default time budget of a job
+SCRAPE_MAX_SECONDS_LIMIT = float(os.getenv("SCRAPE_MAX_SECONDS_LIMIT", "1800"))  # Largest budget a job may ask for
+JOB_TIMEOUT_MARGIN = float(os.getenv("JOB_TIMEOUT_MARGIN", "300"))  # Navigation, parsing and inserts past the budget
+# arq cancels a job running longer than this (see worker.py), so it covers the largest budget plus the margin
+JOB_TIMEOUT = SCRAPE_MAX_SECONDS_LIMIT + JOB_TIMEOUT_MARGIN
+SCRAPE_TARGET_REVIEWS = int(os.getenv("SCRAPE_TARGET_REVIEWS", "0"))  # Default review target, 0 for all of them
+PIPELINE_BATCH_SIZE = int(os.getenv("PIPELINE_BATCH_SIZE", "100"))  # Review cards parsed and inserted together
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))  # Parsed batches waiting for the database
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "1"))  # Seconds between progress updates
+BLOCK_RESOURCES = os.getenv("BLOCK_RESOURCES", "true").lower() == "true"  # Use the lightweight PageProfile
+
+HTTP_MAX_REVIEWS = int(os.getenv("HTTP_MAX_REVIEWS", "2000"))  # Review target of the HTTP backend if none is set
+VARIANT_CONCURRENCY = int(os.getenv("VARIANT_CONCURRENCY", "3"))  # Variants of one job scraped at the same time
+
+SCRAPE_MODES = ("full", "incremental")
+SCRAPE_BACKENDS = ("browser", "http")
+
+async def scrape_reviews_task(ctx,app_id: str, job_id: str, mode: str = "full", backend: str = "browser",
+                              target_reviews: int = None, max_seconds: float = None, variants: list = None):
+    """
+    Scrapes, parses and stores the reviews of `app_id`.
+    In "incremental" mode scrolling stops as soon as a review at or below the app's high-water
+    mark is reached. Both modes advance the mark once the job completes.
+    `backend` is "browser" (Playwright, see play9) or "http" (HttpReviewFetcher, no browser).
+    Scraping also stops once `target_reviews` reviews are loaded or `max_seconds` have passed
+    (SCRAPE_TARGET_REVIEWS and SCRAPE_MAX_SECONDS by default, at most SCRAPE_MAX_SECONDS_LIMIT);
+    the reason is stored with the job.
+    Time spent per stage is exported as metrics and stored with the job (scrape_jobs.stage_timings).
+    `variants` (see review_variants) fans the job out over several languages, sorts and star
+    filters, VARIANT_CONCURRENCY at a time; their reviews are merged and deduplicated before
+    parsing and insertion. Variants are not sorted newest first together, so such jobs neither
+    stop at nor advance the high-water mark.
+    Parsing and normalization run in the worker's parse executor (ctx["parse_executor"], see
+    review_rows.create_parse_executor), off the event loop.
+    """
+    started = perf_counter()
+    params = scrape_params(mode, backend, target_reviews, max_seconds, variants)  # Before defaults, like main5
+    progress = {"inserted": 0, "newest": None, "stage": "starting"}
+    target_reviews = target_reviews or SCRAPE_TARGET_REVIEWS or None
+    max_seconds = min(max_seconds or SCRAPE_MAX_SECONDS, SCRAPE_MAX_SECONDS_LIMIT)
+    profile = PageProfile.from_env() if BLOCK_RESOURCES else None
+    if profile is not None:
+        profile.rate_limiter = ctx.get("rate_limiter")
+    executor = ctx.get("parse_executor")
+    completed = False
+
+    # Raw HTML is kept so reviews can be re-parsed offline (see reparse.py)
+    snapshots = None
+    if ctx.get("snapshot_store") is not None:
+        snapshots = JobSnapshots(ctx["snapshot_store"], app_id, job_id, extraction=SCRAPE_EXTRACTION)
+
+    # Requests for the same scrape keep coalescing onto this job for as long as arq may run it
+    if "redis" in ctx:
+        await refresh_job_inflight(ctx["redis"], app_id, params, job_id, JOB_TIMEOUT)
+
+    # Live progress goes to Redis; Postgres only receives the final status
+    reporter = JobProgress(ctx.get("redis"), job_id, app_id)
+    ticker = asyncio.create_task(reporter.report_every(PROGRESS_INTERVAL, lambda: progress_snapshot(progress)))
     try:
         # Update job status to "in_progress"
-        logger.info(f"Task {job_id} started for app {app_id} at {datetime.now()}")
+        logger.info(f"Task {job_id} started for app {app_id} ({mode}) at {datetime.now()}")
+
+        if mode not in SCRAPE_MODES:
+            raise ValueError(f"Unknown scrape mode: {mode}")
+        if backend not in SCRAPE_BACKENDS:
+            raise ValueError(f"Unknown scrape backend: {backend}")
+        variants = normalize_variants(variants) if variants else None
+
+        # The status stays "pending" until the job finishes, as in scrape_jobs; the stage tells a
+        # running job from a queued one
+        await reporter.update(status="pending", **progress_snapshot(progress))
 
-        await update_job_status(job_id, "pending")
-        logger.info(f"Job {job_id} status updated to 'pending'")
+        high_water_mark = await get_high_water_mark(app_id) if mode == "incremental" and not variants else None
 
-        # Scrape HTML content
-        html = await scrape_play_store_html(app_id)
-        logger.info(f"HTML scraped for app {app_id} at {datetime.now()}")
+        progress["stage"] = "scraping"
+        if variants and backend == "http":
+            batches = ctx["http_fetcher"].stream_variants(
+                app_id, variants, max_reviews=target_reviews or HTTP_MAX_REVIEWS, batch_size=PIPELINE_BATCH_SIZE,
+                stats=progress, max_seconds=max_seconds, concurrency=VARIANT_CONCURRENCY,
+            )
+            await run_review_pipeline(app_id, batches, True, progress, executor=executor)
+        elif variants:
+            # One page per variant in a single browser context
+            batches = stream_review_variants(
+                app_id,
+                variants,
+                max_seconds=max_seconds,
+                browser_pool=ctx.get("browser_pool"),
+                batch_size=PIPELINE_BATCH_SIZE,
+                profile=profile,
+                stats=progress,
+                target_reviews=target_reviews,
+                concurrency=VARIANT_CONCURRENCY,
+            )
+            await run_review_pipeline(app_id, batches, True, progress, executor=executor)
+        elif backend == "http":
+            # Page through the reviews RPC directly and insert page by page
+            batches = ctx["http_fetcher"].stream_reviews(
+                app_id, max_reviews=target_reviews or HTTP_MAX_REVIEWS, batch_size=PIPELINE_BATCH_SIZE,
+                stats=progress, max_seconds=max_seconds,
+            )
+            await run_review_pipeline(app_id, batches, True, progress, high_water_mark, executor=executor)
+        elif SCRAPE_EXTRACTION in ("cards", "network"):
+            # Scrape, parse and insert batch by batch while the page is still scrolling
+            batches = stream_play_store_reviews(
+                app_id,
+                max_seconds=max_seconds,
+                target_reviews=target_reviews,
+                browser_pool=ctx.get("browser_pool"),
+                batch_size=PIPELINE_BATCH_SIZE,
+                profile=profile,
+                extraction=SCRAPE_EXTRACTION,
+                stats=progress,
+            )
+            await run_review_pipeline(
+                app_id, batches, SCRAPE_EXTRACTION == "network", progress, high_water_mark, snapshots, executor
+            )
+        else:
+            # Scrape HTML content
+            html = await scrape_play_store_html(
+                app_id,
+                max_seconds=max_seconds,
+                target_reviews=target_reviews,
+                browser_pool=ctx.get("browser_pool"),
+                extraction=SCRAPE_EXTRACTION,
+                profile=profile,
+                stats=progress,
+            )
+            logger.info(f"HTML scraped for app {app_id} at {datetime.now()}")
+            digest = await snapshots.add(html) if snapshots is not None else None
 
-        # Parse reviews (you can add your parse logic here, if needed)
-        reviews  = await extract_reviews_from_html(html)
-        logger.info(f"Total reviews scraped for {app_id}: {len(reviews)}")
+            # Parse reviews straight into rows
+            rows = await parse_rows_timed(app_id, html, progress, executor)
+            logger.info(f"Total reviews scraped for {app_id}: {len(rows)}")
+            if high_water_mark:
+                rows, reached = cut_at_high_water_mark(rows, high_water_mark)
+                if reached:
+                    progress["stop_reason"] = "high_water_mark"
+                logger.info(f"{len(rows)} reviews are newer than the high-water mark for {app_id}")
+            if rows:
+                progress["newest"] = row_key(rows[0])
 
-        # Insert reviews into the database
-        await insert_reviews_into_db(app_id, reviews)
-        logger.info(f"Reviews inserted into DB for app {app_id}")
+            # Insert reviews into the database
+            with timed(progress, "insert"):
+                await insert_rows_into_db(app_id, rows, digest)
+            progress["inserted"] = len(rows)
+            logger.info(f"Reviews inserted into DB for app {app_id}")
+
+        progress["stage"] = "finishing"
+
+        # Only advance the mark after a complete run, so a failed job cannot hide a gap
+        if progress["newest"] and not variants:
+            await update_high_water_mark(app_id, *progress["newest"])
 
         # Update job status to "completed"
-        done = await update_job_status(job_id, "completed", total_reviews=len(reviews))
-        logger.info(f"Job {job_id} completed at {datetime.now()} with {len(reviews)} reviews.")
+        total_reviews = progress["inserted"]
+        done = await update_job_status(
+            job_id, "completed", total_reviews=total_reviews, stage_timings=stage_breakdown(progress),
+            stop_reason=progress.get("stop_reason"),
+        )
+        completed = True
+        progress["stage"] = "completed"
+        await reporter.update(
+            status="completed", total_reviews=total_reviews, completed_at=done.get("completed_at"),
+            **progress_snapshot(progress)
+        )
+        logger.info(f"Job {job_id} completed at {datetime.now()} with {total_reviews} reviews.")
+    except asyncio.CancelledError:
+        # arq cancels jobs running past JOB_TIMEOUT, and running jobs when the worker shuts down.
+        # CancelledError is not an Exception, so record the failure here and let it propagate.
+        progress["stop_reason"] = "cancelled"
+        await record_failure(job_id, reporter, progress, "Job was cancelled (timed out or worker shut down)")
+        raise
     except Exception as e:
-        # Update job status to "failed" with error message
-        await update_job_status(job_id, "failed", error_message=str(e))
-        logger.error(f"Job {job_id} status updated to 'failed' due to error: {e}")
+        progress.setdefault("stop_reason", "error")
+        await record_failure(job_id, reporter, progress, str(e))
+    finally:
+        ticker.cancel()  # Stop periodic progress updates
+        if snapshots is not None:
+            await snapshots.close()
+        if "redis" in ctx:
+            await mark_job_finished(ctx["redis"], app_id, params, job_id, completed)
+        if profile is not None and backend == "browser":
+            logger.info(f"Job {job_id} network: {profile.stats()}")
+        total_seconds = perf_counter() - started
+        observe_job(progress, backend, "completed" if completed else "failed", total_seconds, progress["inserted"])
+        logger.info(f"Job {job_id} took {total_seconds:.1f}s: {stage_breakdown(progress)}")
+
+
+async def record_failure(job_id: str, reporter: JobProgress, progress: dict, error_message: str):
+    """
+    Marks a job "failed" in Postgres and Redis with `error_message`, keeping the count of
+    reviews already stored.
+    """
+    done = await update_job_status(
+        job_id, "failed", error_message=error_message, total_reviews=progress["inserted"],
+        stage_timings=stage_breakdown(progress), stop_reason=progress["stop_reason"],
+    )
+    await reporter.update(
+        status="failed", error_message=error_message, total_reviews=progress["inserted"],
+        completed_at=done.get("completed_at"), **progress_snapshot(progress)
+    )
+    logger.error(f"Job {job_id} status updated to 'failed' due to error: {error_message}")
 
 
+async def parse_rows_timed(app_id: str, html: str, stats: dict, executor=None) -> list:
+    """
+    Parses review HTML into row tuples (see review_rows.parse_review_rows) in `executor`,
+    recording the time under the "parse" stage of `stats` and the volume in the
+    scrape_html_bytes_total and scrape_reviews_total metrics.
+    """
+    with timed(stats, "parse"):
+        rows = await run_parser(executor, parse_review_rows, app_id, html)
+    SCRAPE_HTML_BYTES.inc(len(html.encode("utf-8")))
+    SCRAPE_REVIEWS.inc(len(rows))
+    return rows
 
 
+async def normalize_rows_timed(app_id: str, reviews: list, stats: dict, executor=None) -> list:
+    """
+    Converts decoded review dicts into row tuples in `executor`, recording the time under the
+    "normalize" stage of `stats` and the volume in the scrape_reviews_total metric.
+    """
+    with timed(stats, "normalize"):
+        rows = await run_parser(executor, normalize_reviews, app_id, reviews)
+    SCRAPE_REVIEWS.inc(len(reviews))
+    return rows
 
 
-async def insert_reviews_into_db(app_id: str, reviews: list):
+def progress_snapshot(progress: dict) -> dict:
     """
-    Inserts reviews into the database. Handles null values by using default values.
-    
-    :param app_id: The app ID to associate the reviews with.
-    :param reviews: The list of reviews to insert.
-    :param job_id: Job identifier for tracking.
+    The fields of a job's progress dict that are published to Redis.
     """
+    return {
+        "stage": progress["stage"],
+        "reviews_loaded": progress.get("reviews_loaded", 0),
+        "reviews_inserted": progress["inserted"],
+        "scroll_iterations": progress.get("scroll_iterations", 0),
+        "pages_fetched": progress.get("pages_fetched", 0),
+        "stop_reason": progress.get("stop_reason"),
+    }
+
+
+async def run_review_pipeline(app_id: str, batches, decoded: bool = False, progress: dict = None,
+                              high_water_mark: dict = None, snapshots: JobSnapshots = None, executor=None):
+    """
+    Consumes batches from a scraper stream, parses each batch into row tuples and commits it
+    to the database as it arrives. Parsed batches wait in a bounded queue, so memory stays
+    constant and a slow database pauses scraping instead of piling up reviews. Batches
+    committed before a failure are kept.
+
+    :param batches: Async generator of review card HTML lists, or of review dict lists if `decoded`.
+    :param decoded: Whether `batches` already yields review dicts.
+    :param progress: Optional dict whose "inserted" key is kept up to date with stored reviews
+                     and whose "newest" key receives the (review_id, reviewed_at) of the newest review.
+    :param high_water_mark: Optional mark from get_high_water_mark; scraping stops once it is reached.
+    :param snapshots: Optional JobSnapshots receiving the HTML of every batch before it is parsed;
+                      stored rows record the digest of the batch they were parsed from.
+    :param executor: Optional executor parsing and normalization run in (see review_rows.run_parser).
+    :return: The total number of reviews inserted.
+    """
+    if progress is None:
+        progress = {}
+    progress["inserted"] = 0
+    progress["newest"] = None
+    queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    async def produce():
+        async with aclosing(batches):
+            async for batch in batches:
+                digest = None
+                if decoded:
+                    rows = await normalize_rows_timed(app_id, batch, progress, executor)
+                else:
+                    html = "".join(batch)
+                    if snapshots is not None:
+                        digest = await snapshots.add(html)
+                    rows = await parse_rows_timed(app_id, html, progress, executor)
+                reached = False
+                if high_water_mark:
+                    rows, reached = cut_at_high_water_mark(rows, high_water_mark)
+                if rows:
+                    if progress["newest"] is None:
+                        progress["newest"] = row_key(rows[0])
+                    await queue.put((rows, digest))
+                if reached:
+                    logger.info(f"Reached the high-water mark for {app_id}. Stopping.")
+                    progress["stop_reason"] = "high_water_mark"
+                    break
+        await queue.put(None)  # End of stream
+
+    async def consume():
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            rows, digest = item
+            with timed(progress, "insert"):
+                await insert_rows_into_db(app_id, rows, digest)
+            progress["inserted"] += len(rows)
+            logger.info(f"Stored batch of {len(rows)} reviews for {app_id} ({progress['inserted']} total)")
+
+    producer = asyncio.create_task(produce())
+    consumer = asyncio.create_task(consume())
     try:
-        pool = await get_review_pool()  # Assumed to return a connection pool
-        async with pool.acquire() as conn:
-            async with conn.transaction():
-                for review in reviews:
-                    # Handle null or missing fields with default values
-                    username = str(review.get("username", "Anonymous"))
-                    content = str(review.get("content", "No review content provided"))
-                    
-                    # Ensure score is an integer and handle invalid cases (e.g., score being a string)
-                    score = review.get("score", 0)
-                    if isinstance(score, str):
-                        try:
-                            score = int(score)  # Convert to int if it's a string
-                        except ValueError:
-                            score = 0  # Default to 0 if conversion fails
-                    
-                    # Handle thumbsupcount being None or invalid
-                    thumbs_up_count = review.get("thumbsupcount", 0)
-                    if thumbs_up_count is None:
-                        thumbs_up_count = 0  # Default to 0 if None
-                    
-                    # Handle reviewed_at date string and parse it if necessary
-                    reviewed_at = review.get("reviewedat")
-                    if reviewed_at:
-                        try:
-                            # Parse reviewed_at (e.g., 'January 3, 2025' -> %B %d, %Y)
-                            reviewed_at = datetime.strptime(reviewed_at, "%B %d, %Y")
-                        except ValueError:
-                            reviewed_at = None  # Default to None if parsing fails
-                    
-                    # Handle the case where 'repliedcontent' is None
-                    replied_content = review.get("repliedcontent", "No reply content")
-                    if replied_content is None:
-                        replied_content = "No reply content"
-
-                    # Generate a unique review ID
-                    review_id = str(uuid4())
-
-                    # Insert or update the review in the database
-                    await conn.execute('''
-                        INSERT INTO reviews (
-                            app_id, review_id, user_name, content, 
-                            score, thumbs_up_count, reviewed_at, 
-                            reply_content, replied_at
-                        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
-                        ON CONFLICT (review_id) 
-                        DO UPDATE SET
-                            content = EXCLUDED.content,
-                            score = EXCLUDED.score,
-                            thumbs_up_count = EXCLUDED.thumbs_up_count,
-                            reply_content = EXCLUDED.reply_content,
-                            replied_at = EXCLUDED.replied_at
-                    ''',
-                    app_id,
-                    review_id,  # Unique review ID
-                    username[:255],  # Truncate username to fit database constraints
-                    content[:10000],  # Truncate content to fit database constraints
-                    score,
-                    thumbs_up_count,
-                    reviewed_at,
-                    replied_content[:10000],  # Truncate reply content
-                    None)  # No replied_at provided
-        print(f"Successfully stored reviews for app_id {app_id}.")
+        # Whichever side fails first cancels the other so neither blocks on the queue forever
+        await asyncio.gather(producer, consumer)
+    except BaseException:
+        producer.cancel()
+        consumer.cancel()
+        await asyncio.gather(producer, consumer, return_exceptions=True)
+        raise
+
+    return progress["inserted"]
+
+
+async def insert_rows_into_db(app_id: str, rows: list, snapshot_digest: str = None):
+    """
+    Bulk-inserts row tuples of `app_id` already normalized by review_rows, all parsed from the
+    snapshot `snapshot_digest` if given.
+    """
+    if not rows:
+        return
+
+    try:
+        await insert_review_rows(rows, [snapshot_digest] * len(rows) if snapshot_digest else None)
+        print(f"Successfully stored {len(rows)} reviews for app_id {app_id}.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error inserting reviews: {str(e)}")
+
+async def insert_review_rows(rows: list, snapshot_digests: list = None, replaced_snapshots: list = None):
+    """
+    Copies row tuples ordered like REVIEW_COLUMNS (see review_rows) into a temporary
+    staging table and merges them into `reviews` with a single upsert that overwrites every
+    parsed column. Rows may belong to different apps but must not repeat a review ID.
+    The per-day rollups (review_daily_stats) are updated in the same transaction.
+
+    :param snapshot_digests: Optional digest of the HTML snapshot each row was parsed from,
+                             in the order of `rows`.
+    :param replaced_snapshots: Snapshot digests whose stored reviews the batch replaces: those
+                               reviews missing from `rows` are deleted (see reparse.py).
+    """
+    digests = snapshot_digests if snapshot_digests is not None else [None] * len(rows)
+    records = [row + (digest,) for row, digest in zip(rows, digests)]
+    staged_columns = REVIEW_COLUMNS + ("snapshot_digest",)
+    columns = ", ".join(staged_columns)
+    async with acquire("review") as conn:
+        writing = perf_counter()
+        async with conn.transaction():
+            await conn.execute('''
+                CREATE TEMP TABLE reviews_staging
+                (LIKE reviews INCLUDING DEFAULTS)
+                ON COMMIT DROP
+            ''')
+            await conn.copy_records_to_table("reviews_staging", records=records, columns=staged_columns)
+            await update_review_rollups(conn, replaced_snapshots)
+            await conn.execute(f'''
+                INSERT INTO reviews ({columns})
+                SELECT {columns} FROM reviews_staging
+                ON CONFLICT (review_id)
+                DO UPDATE SET
+                    user_name = EXCLUDED.user_name,
+                    content = EXCLUDED.content,
+                    score = EXCLUDED.score,
+                    thumbs_up_count = EXCLUDED.thumbs_up_count,
+                    reviewed_at = EXCLUDED.reviewed_at,
+                    reply_content = EXCLUDED.reply_content,
+                    replied_at = EXCLUDED.replied_at,
+                    snapshot_digest = EXCLUDED.snapshot_digest
+            ''')
+        observe_insert(len(rows), perf_counter() - writing)
@@ -0,0 +1,144 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Where raw HTML snapshots are kept; an empty value disables snapshots
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+SNAPSHOT_COMPRESSION_LEVEL = int(os.getenv("SNAPSHOT_COMPRESSION_LEVEL", "6"))
+
+# App IDs are Java package names; anything else is refused as a path component
+APP_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+class SnapshotStore:
+    """
+    Content-addressed store of the raw HTML the scraper parsed, so reviews can be re-parsed
+    offline after a parser fix (see reparse.py) instead of being scraped again.
+
+    Layout under `root`:
+    - objects/<2 hex>/<sha256>.html.gz: gzip-compressed HTML, written once per distinct content.
+    - jobs/<app_id>/<job_id>.json: the job's manifest, listing its snapshots in scrape order.
+    """
+
+    def __init__(self, root, compression_level: int = SNAPSHOT_COMPRESSION_LEVEL):
+        self.root = Path(root)
+        self.compression_level = compression_level
+
+    @classmethod
+    def from_env(cls):
+        """
+        Returns a store at SNAPSHOT_DIR, or None if snapshots are disabled.
+        """
+        return cls(SNAPSHOT_DIR) if SNAPSHOT_DIR else None
+
+    def object_path(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / f"{digest}.html.gz"
+
+    def manifest_path(self, app_id: str, job_id: str) -> Path:
+        if not APP_ID_PATTERN.match(app_id) or not APP_ID_PATTERN.match(job_id):
+            raise ValueError(f"Invalid snapshot key: {app_id}/{job_id}")
+        return self.root / "jobs" / app_id / f"{job_id}.json"
+
+    def _write_atomic(self, path: Path, data: bytes):
+        # Write to a temporary file in the same directory and rename, so readers never see partial files
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def put(self, html: str) -> dict:
+        """
+        Stores `html` unless the same content is already stored.
+
+        :return: The snapshot's manifest entry: its digest and raw and compressed sizes.
+        """
+        raw = html.encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        path = self.object_path(digest)
+        if path.exists():
+            compressed_bytes = path.stat().st_size
+        else:
+            compressed = gzip.compress(raw, compresslevel=self.compression_level, mtime=0)
+            self._write_atomic(path, compressed)
+            compressed_bytes = len(compressed)
+        return {"digest": digest, "bytes": len(raw), "compressed_bytes": compressed_bytes}
+
+    def get(self, digest: str) -> str:
+        return gzip.decompress(self.object_path(digest).read_bytes()).decode("utf-8")
+
+    def write_manifest(self, app_id: str, job_id: str, snapshots: list, **metadata):
+        manifest = {
+            "app_id": app_id,
+            "job_id": job_id,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            **metadata,
+            "snapshots": snapshots,
+        }
+        self._write_atomic(self.manifest_path(app_id, job_id), json.dumps(manifest).encode("utf-8"))
+
+    def iter_manifests(self, app_ids=None, since: datetime = None):
+        """
+        Yields the manifest of every stored job, optionally only for `app_ids` and for jobs
+        created at or after `since` (timezone aware).
+        """
+        jobs_dir = self.root / "jobs"
+        app_dirs = [jobs_dir / app_id for app_id in app_ids] if app_ids else sorted(jobs_dir.glob("*"))
+        for app_dir in app_dirs:
+            for path in sorted(app_dir.glob("*.json")):
+                manifest = json.loads(path.read_text())
+                if since and datetime.fromisoformat(manifest["created_at"]) < since:
+                    continue
+                yield manifest
+
+
+class JobSnapshots:
+    """
+    Records the HTML snapshots of one scrape job. Compression and disk writes run in a thread.
+    Call `close` when the job ends, failed or not, to write its manifest.
+    """
+
+    def __init__(self, store: SnapshotStore, app_id: str, job_id: str, **metadata):
+        self.store = store
+        self.app_id = app_id
+        self.job_id = job_id
+        self.metadata = metadata
+        self.snapshots = []
+
+    async def add(self, html: str):
+        """
+        Stores one page or batch of HTML and returns its digest, or None if it was not stored.
+        Failures are logged; snapshots never fail a job.
+        """
+        if not html:
+            return None
+        try:
+            entry = await asyncio.to_thread(self.store.put, html)
+        except Exception as e:
+            logger.warning(f"Error storing HTML snapshot for {self.app_id}: {e}")
+            return None
+        self.snapshots.append(entry)
+        return entry["digest"]
+
+    async def close(self):
+        if not self.snapshots:
+            return
+        try:
+            await asyncio.to_thread(
+                self.store.write_manifest, self.app_id, self.job_id, self.snapshots, **self.metadata
+            )
+        except Exception as e:
+            logger.warning(f"Error writing snapshot manifest for job {self.job_id}: {e}")
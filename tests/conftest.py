@@ -0,0 +1,55 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# The service modules live at the repository root
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# config.py requires a database URL at import; tests never connect to it
+os.environ.setdefault("DB_URL", "postgresql://localhost/tests")
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+@pytest.fixture
+def rpc_body():
+    """
+    Returns the body of a reviews RPC response from tests/fixtures, e.g. rpc_body("first_page").
+    """
+    def load(name: str) -> str:
+        return (FIXTURES / f"usvdtd_{name}.txt").read_text()
+    return load
+
+
+@pytest.fixture
+def redis():
+    """
+    Returns an arq Redis pool backed by an in-memory server (fakeredis), for the job cache,
+    progress and rate limiter.
+    """
+    import fakeredis
+    from arq.connections import ArqRedis
+
+    return ArqRedis(connection_pool=fakeredis.FakeAsyncRedis().connection_pool)
+
+
+@pytest.fixture
+def mock_store():
+    """
+    Starts a MockPlayStore (see benchmarks/mock_play_store.py) with the given options.
+    """
+    from benchmarks.mock_play_store import MockPlayStore
+
+    stores = []
+
+    def start(**options):
+        store = MockPlayStore(**options).start()
+        stores.append(store)
+        return store
+
+    yield start
+    for store in stores:
+        store.stop()
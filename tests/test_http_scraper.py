@@ -0,0 +1,95 @@
+import asyncio
+
+import httpx
+import pytest
+
+from http_scraper import HttpReviewFetcher
+from play9 import STOP_EXHAUSTED, STOP_TARGET_REACHED
+
+
+def collect(store, backoff: float = 0.001, max_retries: int = 3, **options):
+    """
+    Streams reviews from `store` with a fresh fetcher; returns the batches, stats and fetcher.
+    """
+    async def run():
+        fetcher = HttpReviewFetcher(max_retries=max_retries, backoff=backoff, base_url=store.url)
+        stats = {}
+        try:
+            batches = [batch async for batch in fetcher.stream_reviews("com.example.app", stats=stats, **options)]
+        finally:
+            await fetcher.close()
+        return batches, stats, fetcher
+    return asyncio.run(run())
+
+
+def review_ids(batches) -> list:
+    return [review["reviewid"] for batch in batches for review in batch]
+
+
+def test_stream_reviews_follows_tokens_to_the_end(mock_store):
+    store = mock_store(total_reviews=250)
+
+    batches, stats, fetcher = collect(store, max_reviews=1000, batch_size=100)
+
+    assert [len(batch) for batch in batches] == [100, 100, 50]
+    assert review_ids(batches) == [f"gp:com.example.app:{index}" for index in range(250)]
+    assert stats["pages_fetched"] == 3
+    assert stats["reviews_loaded"] == 250
+    assert stats["stop_reason"] == STOP_EXHAUSTED
+    assert store.rpc_calls == fetcher.requests == 3
+
+
+def test_stream_reviews_stops_at_max_reviews(mock_store):
+    store = mock_store(total_reviews=250)
+
+    batches, stats, _ = collect(store, max_reviews=120, batch_size=50)
+
+    assert [len(batch) for batch in batches] == [50, 50, 20]
+    assert stats["stop_reason"] == STOP_TARGET_REACHED
+    assert store.rpc_calls == 3
+
+
+def test_stream_reviews_star_filter(mock_store):
+    store = mock_store(total_reviews=100)
+
+    batches, _, _ = collect(store, max_reviews=1000, stars=5)
+
+    assert batches
+    assert {review["score"] for batch in batches for review in batch} == {"5"}
+
+
+def test_fetch_page_retries_transient_failures(mock_store):
+    store = mock_store(total_reviews=10, failing_calls=2)
+
+    batches, stats, fetcher = collect(store, max_reviews=100)
+
+    assert len(review_ids(batches)) == 10
+    assert fetcher.retries == 2
+    assert store.rpc_calls == 3
+    assert stats["stop_reason"] == STOP_EXHAUSTED
+
+
+def test_fetch_page_backs_off_exponentially(mock_store, monkeypatch):
+    store = mock_store(total_reviews=10, failing_calls=3)
+    delays = []
+    sleep = asyncio.sleep
+
+    async def record_sleep(delay):
+        delays.append(delay)
+        await sleep(0)
+
+    monkeypatch.setattr(asyncio, "sleep", record_sleep)
+    collect(store, backoff=1.0, max_retries=3, max_reviews=100)
+
+    # backoff * 2 ** attempt, with up to 100% jitter
+    assert len(delays) == 3
+    for attempt, delay in enumerate(delays):
+        assert 2 ** attempt <= delay <= 2 ** (attempt + 1)
+
+
+def test_fetch_page_gives_up_after_max_retries(mock_store):
+    store = mock_store(total_reviews=10, failing_calls=10)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        collect(store, max_retries=2, max_reviews=100)
+    assert store.rpc_calls == 3
@@ -0,0 +1,177 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+from arq.constants import expires_extra_ms, in_progress_key_prefix
+from arq.jobs import JobStatus
+
+import job_cache
+from job_cache import (
+    QUEUE_NAMES, completed_key, find_reusable_job, inflight_key, mark_job_finished, mark_job_inflight,
+    promote_queued_job, refresh_job_inflight, scrape_params,
+)
+
+APP_ID = "com.example.app"
+PARAMS = scrape_params("full", "bs4")
+
+
+async def enqueue(redis, job_id: str, priority: str, score: int = 1):
+    # What arq's enqueue_job leaves in the queue, plus the record start_or_reuse_job adds
+    await redis.zadd(QUEUE_NAMES[priority], {job_id: score})
+    await mark_job_inflight(redis, APP_ID, PARAMS, job_id, QUEUE_NAMES[priority])
+
+
+def test_scrape_params_digests_every_option():
+    variants = [{"lang": "en", "country": "us", "sort": "newest", "stars": None}]
+
+    assert scrape_params("full", "bs4") == scrape_params("full", "bs4", None, None, None)
+    assert scrape_params("full", "bs4", variants=variants) == scrape_params("full", "bs4", variants=[dict(variants[0])])
+    digests = {
+        scrape_params("full", "bs4"),
+        scrape_params("incremental", "bs4"),
+        scrape_params("full", "http"),
+        scrape_params("full", "bs4", target_reviews=100),
+        scrape_params("full", "bs4", max_seconds=60),
+        scrape_params("full", "bs4", variants=variants),
+    }
+    assert len(digests) == 6
+
+
+def test_find_reusable_job_returns_a_queued_job(redis):
+    async def run():
+        await enqueue(redis, "job-1", "high")
+        return await find_reusable_job(redis, APP_ID, PARAMS)
+
+    assert asyncio.run(run()) == ("job-1", "in_progress")
+
+
+def test_find_reusable_job_returns_a_fresh_completed_job(redis):
+    async def run():
+        await enqueue(redis, "job-1", "high")
+        await redis.zrem(QUEUE_NAMES["high"], "job-1")  # arq is done with it
+        await mark_job_finished(redis, APP_ID, PARAMS, "job-1", completed=True)
+        return (
+            await redis.get(inflight_key(APP_ID, PARAMS)),
+            await find_reusable_job(redis, APP_ID, PARAMS),
+            await find_reusable_job(redis, APP_ID, PARAMS, freshness_minutes=0),
+        )
+
+    assert asyncio.run(run()) == (None, ("job-1", "cached"), None)
+
+
+def test_find_reusable_job_ignores_stale_and_failed_jobs(redis):
+    async def run():
+        completed_at = datetime.now(timezone.utc) - timedelta(minutes=30)
+        record = json.dumps({"job_id": "job-1", "completed_at": completed_at.isoformat()})
+        await redis.set(completed_key(APP_ID, PARAMS), record)
+        # A failed job leaves no completion record, and its in-flight one points at a job arq no longer has
+        await mark_job_inflight(redis, APP_ID, PARAMS, "job-2", QUEUE_NAMES["high"])
+        return await find_reusable_job(redis, APP_ID, PARAMS, freshness_minutes=10)
+
+    assert asyncio.run(run()) is None
+
+
+def test_find_reusable_job_needs_the_same_options(redis):
+    async def run():
+        await enqueue(redis, "job-1", "high")
+        return await find_reusable_job(redis, APP_ID, scrape_params("incremental", "bs4"))
+
+    assert asyncio.run(run()) is None
+
+
+def test_mark_job_finished_keeps_a_newer_jobs_record(redis):
+    async def run():
+        await mark_job_inflight(redis, APP_ID, PARAMS, "job-2", QUEUE_NAMES["high"])
+        await mark_job_finished(redis, APP_ID, PARAMS, "job-1", completed=False)
+        record = json.loads(await redis.get(inflight_key(APP_ID, PARAMS)))
+        return record["job_id"], await redis.get(completed_key(APP_ID, PARAMS))
+
+    assert asyncio.run(run()) == ("job-2", None)
+
+
+def test_start_or_reuse_job_coalesces_unless_forced(redis, monkeypatch):
+    import main5
+
+    started_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    async def create_job(job_id, app_id, status):
+        return started_at
+
+    monkeypatch.setattr(main5, "redis", redis, raising=False)
+    monkeypatch.setattr(main5, "create_job", create_job)
+
+    async def run():
+        first = await main5.start_or_reuse_job(APP_ID, "full", "bs4", "high", force=False)
+        again = await main5.start_or_reuse_job(APP_ID, "full", "bs4", "high", force=False)
+        forced = await main5.start_or_reuse_job(APP_ID, "full", "bs4", "high", force=True)
+        other = await main5.start_or_reuse_job(APP_ID, "incremental", "bs4", "high", force=False)
+        return first, again, forced, other, await redis.zcard(QUEUE_NAMES["high"])
+
+    first, again, forced, other, queued = asyncio.run(run())
+
+    assert first[1] == forced[1] == other[1] == "started"
+    assert again == (first[0], "in_progress")
+    assert len({first[0], forced[0], other[0]}) == 3
+    assert queued == 3
+
+
+def test_high_priority_request_promotes_a_queued_low_job(redis):
+    async def run():
+        await enqueue(redis, "job-1", "low", score=42)
+        reusable = await find_reusable_job(redis, APP_ID, PARAMS, queue_name=QUEUE_NAMES["high"])
+        scores = await redis.zscore(QUEUE_NAMES["low"], "job-1"), await redis.zscore(QUEUE_NAMES["high"], "job-1")
+        return reusable, scores, json.loads(await redis.get(inflight_key(APP_ID, PARAMS)))
+
+    reusable, scores, record = asyncio.run(run())
+
+    assert reusable == ("job-1", "in_progress")
+    assert scores == (None, 42)  # Keeps its place in time
+    assert record == {"job_id": "job-1", "queue": QUEUE_NAMES["high"]}
+
+
+def test_low_priority_request_leaves_the_job_queued(redis):
+    async def run():
+        await enqueue(redis, "job-1", "low")
+        reusable = await find_reusable_job(redis, APP_ID, PARAMS, queue_name=QUEUE_NAMES["low"])
+        return reusable, await redis.zscore(QUEUE_NAMES["low"], "job-1")
+
+    assert asyncio.run(run()) == (("job-1", "in_progress"), 1)
+
+
+def test_running_low_job_is_reused_as_is(redis, monkeypatch):
+    async def in_progress(self):
+        return JobStatus.in_progress
+
+    async def run():
+        await enqueue(redis, "job-1", "low")
+        reusable = await find_reusable_job(redis, APP_ID, PARAMS, queue_name=QUEUE_NAMES["high"])
+        return reusable, await redis.zscore(QUEUE_NAMES["high"], "job-1")
+
+    monkeypatch.setattr(job_cache.Job, "status", in_progress)
+
+    assert asyncio.run(run()) == (("job-1", "in_progress"), None)
+
+
+def test_promotion_skips_a_job_picked_up_meanwhile(redis):
+    async def run():
+        await enqueue(redis, "job-1", "low")
+        await redis.set(in_progress_key_prefix + "job-1", "1")  # A worker took it after the status check
+        moved = await promote_queued_job(redis, APP_ID, PARAMS, "job-1")
+        return moved, await redis.zscore(QUEUE_NAMES["low"], "job-1")
+
+    assert asyncio.run(run()) == (False, 1)
+
+
+def test_inflight_record_outlives_a_queued_job():
+    assert job_cache.INFLIGHT_TTL_SECONDS * 1000 >= expires_extra_ms
+
+
+def test_refresh_job_inflight_renews_only_its_own_record(redis):
+    async def run():
+        await enqueue(redis, "job-1", "low")
+        await refresh_job_inflight(redis, APP_ID, PARAMS, "job-1", 2100)
+        renewed = await redis.ttl(inflight_key(APP_ID, PARAMS))
+        await refresh_job_inflight(redis, APP_ID, PARAMS, "job-2", 60)
+        return renewed, await redis.ttl(inflight_key(APP_ID, PARAMS))
+
+    assert asyncio.run(run()) == (2100, 2100)
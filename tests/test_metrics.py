@@ -0,0 +1,51 @@
+from prometheus_client import REGISTRY
+
+import metrics
+from metrics import observe_insert, observe_job, render_metrics, stage_breakdown, timed
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_timed_accumulates_stage_seconds(monkeypatch):
+    clock = iter([0.0, 1.5, 10.0, 10.25, 20.0, 20.125])
+    monkeypatch.setattr(metrics, "perf_counter", lambda: next(clock))
+    stats = {}
+
+    for stage in ("scroll", "scroll", "parse"):
+        with timed(stats, stage):
+            pass
+
+    assert stats["stage_seconds"] == {"scroll": 1.75, "parse": 0.125}
+    assert stage_breakdown(stats) == {"scroll": 1.75, "parse": 0.125}
+    assert stage_breakdown({"stage_seconds": {"parse": 0.00049}}) == {"parse": 0.0}
+    assert stage_breakdown({}) == {}
+
+
+def test_timed_without_stats():
+    with timed(None, "scroll"):
+        pass
+
+
+def test_observe_job_records_stages_and_throughput():
+    jobs = sample("scrape_jobs_total", backend="browser", status="completed")
+    parse_count = sample("scrape_stage_seconds_count", stage="parse")
+    scrolls = sample("scrape_scroll_iterations_sum")
+
+    observe_job({"stage_seconds": {"parse": 0.5}, "scroll_iterations": 12}, "browser", "completed", 10.0, 200)
+
+    assert sample("scrape_jobs_total", backend="browser", status="completed") == jobs + 1
+    assert sample("scrape_stage_seconds_count", stage="parse") == parse_count + 1
+    assert sample("scrape_scroll_iterations_sum") == scrolls + 12
+
+
+def test_observe_insert_and_render():
+    rows = sample("db_rows_inserted_total")
+
+    observe_insert(250, 0.5)
+    body, content_type = render_metrics()
+
+    assert sample("db_rows_inserted_total") == rows + 250
+    assert b"db_rows_per_second_bucket" in body
+    assert content_type.startswith("text/plain")
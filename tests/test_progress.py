@@ -0,0 +1,101 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import progress
+from progress import JobProgress, progress_channel, read_progress, write_progress
+
+JOB_ID = "job-1"
+
+
+def test_write_progress_merges_and_publishes(redis):
+    async def run():
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(progress_channel(JOB_ID))
+        await pubsub.get_message(timeout=1)  # Subscription confirmation
+        started_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        await write_progress(redis, JOB_ID, status="pending", stage="queued", started_at=started_at,
+                             total_reviews=None)
+        await write_progress(redis, JOB_ID, stage="scraping", reviews_loaded=120)
+        await pubsub.get_message(timeout=1)  # First write
+        message = await pubsub.get_message(timeout=1)
+        await pubsub.aclose()
+        return await read_progress(redis, JOB_ID), json.loads(message["data"])
+
+    snapshot, published = asyncio.run(run())
+
+    assert snapshot["status"] == "pending"
+    assert snapshot["stage"] == "scraping"
+    assert snapshot["started_at"] == "2025-01-01T00:00:00+00:00"
+    assert snapshot["reviews_loaded"] == 120
+    assert snapshot["total_reviews"] is None
+    assert snapshot["job_id"] == JOB_ID
+    assert published == snapshot
+
+
+def test_read_progress_of_unknown_job(redis):
+    assert asyncio.run(read_progress(redis, "unknown")) is None
+
+
+def test_report_every_publishes_only_changes(monkeypatch):
+    published = []
+    snapshots = iter([{"reviews_loaded": 1}, {"reviews_loaded": 1}, {"reviews_loaded": 2}, {"reviews_loaded": 2}])
+    done = asyncio.Event()
+
+    async def record(redis, job_id, **fields):
+        published.append(fields["reviews_loaded"])
+
+    def snapshot():
+        fields = next(snapshots, None)
+        if fields is None:
+            done.set()
+            return {"reviews_loaded": 2}
+        return fields
+
+    async def run():
+        reporter = JobProgress(object(), JOB_ID, "com.example.app")
+        ticker = asyncio.create_task(reporter.report_every(0, snapshot))
+        await done.wait()
+        ticker.cancel()
+
+    monkeypatch.setattr(progress, "write_progress", record)
+    asyncio.run(run())
+
+    assert published == [1, 2]
+
+
+def test_job_progress_never_fails_the_job():
+    class BrokenRedis:
+        def pipeline(self, transaction=True):
+            raise ConnectionError("Redis is down")
+
+    async def run():
+        await JobProgress(BrokenRedis(), JOB_ID, "com.example.app").update(stage="scraping")
+        await JobProgress(None, JOB_ID, "com.example.app").update(stage="scraping")
+
+    asyncio.run(run())
+
+
+def test_status_is_served_from_redis(redis, monkeypatch):
+    import main5
+
+    async def get_job(job_id):
+        return {"job_id": job_id, "status": "completed", "source": "postgres"}
+
+    monkeypatch.setattr(main5, "redis", redis, raising=False)
+    monkeypatch.setattr(main5, "get_job_from_db", get_job)
+
+    async def run():
+        await write_progress(redis, JOB_ID, app_id="com.example.app", status="pending", stage="scraping",
+                             started_at=datetime.now(timezone.utc), completed_at=None, total_reviews=None,
+                             error_message=None)
+        # A hash written without the scrape_jobs fields
+        await write_progress(redis, "job-2", stage="scraping")
+        return await main5.get_scrape_status(JOB_ID), await main5.get_scrape_status("job-2")
+
+    live, legacy = asyncio.run(run())
+
+    assert live["status"] == "pending"
+    assert live["stage"] == "scraping"
+    assert "source" not in live
+    assert legacy["source"] == "postgres"
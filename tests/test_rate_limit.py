@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+import rate_limit
+from rate_limit import RedisTokenBucket
+
+
+def test_token_bucket_allows_a_burst_then_paces(redis, monkeypatch):
+    delays = []
+    sleep = asyncio.sleep
+
+    async def record_sleep(delay):
+        delays.append(delay)
+        await sleep(0)
+
+    async def run():
+        bucket = RedisTokenBucket(redis, rate=2, capacity=3)
+        for _ in range(3):
+            await bucket.acquire()
+        burst = list(delays)
+        await bucket.acquire()
+        return bucket, burst
+
+    monkeypatch.setattr(rate_limit.asyncio, "sleep", record_sleep)
+    bucket, burst = asyncio.run(run())
+
+    assert burst == []
+    # The recorded sleeps take no time, so the bucket keeps asking until half a second passed
+    assert 0 < delays[0] <= 0.5
+    assert bucket.waited_seconds == pytest.approx(sum(delays))
+
+
+def test_token_bucket_is_shared_through_redis(redis):
+    # Two workers' buckets on the same key draw from the same tokens
+    async def run():
+        first = RedisTokenBucket(redis, rate=1, capacity=2)
+        second = RedisTokenBucket(redis, rate=1, capacity=2)
+        await first.acquire()
+        await second.acquire()
+        wait_ms = await second._script(keys=[second.key], args=[second.rate, second.capacity])
+        return first.waited_seconds + second.waited_seconds, wait_ms
+
+    waited, wait_ms = asyncio.run(run())
+
+    assert waited == 0
+    assert 0 < wait_ms <= 1000
+
+
+def test_token_bucket_rejects_a_zero_rate(redis):
+    with pytest.raises(ValueError):
+        RedisTokenBucket(redis, rate=0)
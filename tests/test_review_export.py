@@ -0,0 +1,117 @@
+import asyncio
+import csv
+import io
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import pyarrow.parquet as pq
+
+import review_export
+from review_export import encode_csv, encode_ndjson, encode_parquet, export_reviews
+from review_rows import REVIEW_COLUMNS
+
+APP_ID = "com.example.app"
+
+
+class Record(tuple):
+    # Like an asyncpg Record: a tuple whose values can also be read by column name
+    def keys(self):
+        return REVIEW_COLUMNS
+
+    def __getitem__(self, key):
+        return super().__getitem__(REVIEW_COLUMNS.index(key) if isinstance(key, str) else key)
+
+
+def record(index: int) -> Record:
+    return Record((
+        APP_ID, f"id-{index}", f"User {index}", "Great, \"really\"\nwell done", 5, index,
+        datetime(2025, 1, 1 + index, 12), "No reply", None,
+    ))
+
+
+def chunks_of(*sizes):
+    async def chunks():
+        start = 0
+        for size in sizes:
+            yield [record(index) for index in range(start, start + size)]
+            start += size
+    return chunks()
+
+
+def collect(encoded) -> bytes:
+    async def run():
+        return b"".join([data async for data in encoded])
+    return asyncio.run(run())
+
+
+def test_encode_ndjson():
+    lines = collect(encode_ndjson(chunks_of(2, 1))).decode("utf-8").splitlines()
+
+    assert len(lines) == 3
+    assert json.loads(lines[1]) == {
+        "app_id": APP_ID, "review_id": "id-1", "user_name": "User 1", "content": "Great, \"really\"\nwell done",
+        "score": 5, "thumbs_up_count": 1, "reviewed_at": "2025-01-02 12:00:00", "reply_content": "No reply",
+        "replied_at": None,
+    }
+
+
+def test_encode_csv():
+    rows = list(csv.reader(io.StringIO(collect(encode_csv(chunks_of(2, 1))).decode("utf-8"))))
+
+    assert rows[0] == list(REVIEW_COLUMNS)
+    assert [row[1] for row in rows[1:]] == ["id-0", "id-1", "id-2"]
+    assert rows[1][3] == "Great, \"really\"\nwell done"
+
+
+def test_encode_csv_of_an_empty_export():
+    assert collect(encode_csv(chunks_of())).decode("utf-8").strip() == ",".join(REVIEW_COLUMNS)
+
+
+def test_encode_parquet_writes_a_row_group_per_chunk():
+    parquet_file = pq.ParquetFile(io.BytesIO(collect(encode_parquet(chunks_of(2, 1)))))
+
+    assert parquet_file.metadata.num_row_groups == 2
+    table = parquet_file.read()
+    assert table.column_names == list(REVIEW_COLUMNS)
+    assert table.column("review_id").to_pylist() == ["id-0", "id-1", "id-2"]
+    assert table.column("reviewed_at").to_pylist()[2] == datetime(2025, 1, 3, 12)
+    assert table.column("replied_at").to_pylist() == [None, None, None]
+
+
+def test_export_reviews_streams_chunks_and_releases_the_connection(monkeypatch):
+    queries = []
+    released = []
+
+    class Cursor:
+        def __init__(self, rows):
+            self.rows = rows
+
+        async def fetch(self, count):
+            rows, self.rows = self.rows[:count], self.rows[count:]
+            return rows
+
+    class Connection:
+        @asynccontextmanager
+        async def transaction(self, readonly=False):
+            yield
+
+        async def cursor(self, query, *params):
+            queries.append((query, params))
+            # Dated reviews, then the undated ones
+            return Cursor([record(index) for index in range(3)] if len(queries) == 1 else [])
+
+    @asynccontextmanager
+    async def acquire(pool):
+        try:
+            yield Connection()
+        finally:
+            released.append(pool)
+
+    monkeypatch.setattr(review_export, "acquire", acquire)
+
+    lines = collect(export_reviews(APP_ID, "ndjson")).decode("utf-8").splitlines()
+
+    assert [json.loads(line)["review_id"] for line in lines] == ["id-0", "id-1", "id-2"]
+    assert len(queries) == 2
+    assert released == ["review"]
@@ -0,0 +1,119 @@
+import asyncio
+import string
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import pytest
+
+import review_queries
+from review_queries import (
+    REPLACED_REVIEWS_SQL, ROLLUP_DELTA_SQL, ROLLUP_LOCK_CLASS, decode_cursor, encode_cursor, get_review_summary,
+    list_reviews, update_review_rollups,
+)
+from review_rows import NO_REPLY_CONTENT
+
+APP_ID = "com.example.app"
+
+
+class RecordingConnection:
+    """
+    Stands in for an asyncpg connection: records every statement and returns `rows` from fetch.
+    """
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.calls = []
+
+    async def execute(self, sql, *args):
+        self.calls.append((sql, args))
+
+    async def fetch(self, sql, *args):
+        self.calls.append((sql, args))
+        return self.rows[:args[-1]]
+
+
+def use_connection(monkeypatch, conn):
+    @asynccontextmanager
+    async def acquire(pool):
+        yield conn
+
+    monkeypatch.setattr(review_queries, "acquire", acquire)
+
+
+def review(index: int) -> dict:
+    return {
+        "review_id": f"id-{index}", "user_name": "Jane", "content": "text", "score": 5, "thumbs_up_count": 0,
+        "reviewed_at": datetime(2025, 1, 31 - index, 12), "reply_content": NO_REPLY_CONTENT, "replied_at": None,
+    }
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(datetime(2025, 1, 2, 3, 4, 5), 42)
+
+    assert decode_cursor(cursor) == (datetime(2025, 1, 2, 3, 4, 5), "42")
+    assert set(cursor) <= set(string.ascii_letters + string.digits + "-_=")  # Safe in a query string
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "bm90IGpzb24=", "WzEsIDIsIDNd", "WyJub3QgYSBkYXRlIiwgIngiXQ=="])
+def test_decode_cursor_rejects_garbage(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_list_reviews_pages_with_the_cursor(monkeypatch):
+    conn = RecordingConnection([review(index) for index in range(3)])
+    use_connection(monkeypatch, conn)
+
+    page = asyncio.run(list_reviews(APP_ID, limit=2, score=5))
+
+    assert [row["review_id"] for row in page["reviews"]] == ["id-0", "id-1"]
+    assert decode_cursor(page["next_cursor"]) == (datetime(2025, 1, 30, 12), "id-1")
+    sql, args = conn.calls[0]
+    assert args == (APP_ID, 5, 3)  # One row more than the page
+
+    conn.rows = conn.rows[2:]
+    page = asyncio.run(list_reviews(APP_ID, limit=2, cursor=page["next_cursor"]))
+
+    assert [row["review_id"] for row in page["reviews"]] == ["id-2"]
+    assert page["next_cursor"] is None
+    sql, args = conn.calls[1]
+    assert "(reviewed_at, review_id) < ($2, $3)" in sql
+    assert args == (APP_ID, datetime(2025, 1, 30, 12), "id-1", 3)
+
+
+def test_update_review_rollups_locks_then_applies_the_delta():
+    conn = RecordingConnection()
+
+    asyncio.run(update_review_rollups(conn))
+
+    lock, delta = conn.calls
+    assert "pg_advisory_xact_lock" in lock[0]
+    assert lock[1] == (ROLLUP_LOCK_CLASS, [])
+    assert delta == (ROLLUP_DELTA_SQL, (NO_REPLY_CONTENT,))
+
+
+def test_update_review_rollups_removes_replaced_reviews_first():
+    conn = RecordingConnection()
+
+    asyncio.run(update_review_rollups(conn, ("digest-1",)))
+
+    assert [sql for sql, _ in conn.calls[1:]] == [REPLACED_REVIEWS_SQL, ROLLUP_DELTA_SQL]
+    assert conn.calls[1][1] == (NO_REPLY_CONTENT, ["digest-1"])
+
+
+def test_review_summary_from_daily_stats(monkeypatch):
+    rows = [{"score": 5, "reviews": 3, "replied": 1}, {"score": 1, "reviews": 1, "replied": 1}]
+
+    async def run_prepared(conn, name, *args):
+        assert name == "review_summary"
+        return rows
+
+    use_connection(monkeypatch, None)
+    monkeypatch.setattr(review_queries, "run_prepared", run_prepared)
+
+    summary = asyncio.run(get_review_summary(APP_ID))
+
+    assert summary["total_reviews"] == 4
+    assert summary["scores"] == {"1": 1, "2": 0, "3": 0, "4": 0, "5": 3}
+    assert summary["average_score"] == 4.0
+    assert summary["reply_rate"] == 0.5
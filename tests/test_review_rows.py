@@ -0,0 +1,159 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from benchmarks.fixtures import review_array, review_card_html, review_page_html
+from html6 import available_backends, parse_reviews
+from review_rows import (
+    NO_REPLY_CONTENT, REVIEW_COLUMNS, ROW_REVIEW_ID, ROW_REVIEWED_AT, create_parse_executor,
+    cut_at_high_water_mark, make_review_id, normalize_reviews, parse_review_rows, row_key, run_parser,
+)
+from review_rpc import extract_reviews_from_rpc
+
+APP_ID = "com.example.app"
+
+
+def as_dict(row: tuple) -> dict:
+    return dict(zip(REVIEW_COLUMNS, row))
+
+
+def test_make_review_id_is_stable():
+    review_id = make_review_id(APP_ID, "Jane", "January 1, 2025", "Great")
+
+    assert review_id == make_review_id(APP_ID, "Jane", "January 1, 2025", "Great")
+    assert review_id != make_review_id(APP_ID, "Jane", "January 2, 2025", "Great")
+    assert review_id != make_review_id("com.other.app", "Jane", "January 1, 2025", "Great")
+    assert make_review_id(APP_ID, None, None, None) == make_review_id(APP_ID, "", "", "")
+
+
+def test_normalize_reviews_defaults_and_parsing():
+    row = as_dict(normalize_reviews(APP_ID, [{
+        "username": None,
+        "content": "",
+        "score": "not a number",
+        "thumbsupcount": "1,234 people found this review helpful",
+        "reviewedat": "January 3, 2025",
+        "repliedcontent": None,
+    }])[0])
+
+    assert row["user_name"] == "Anonymous"
+    assert row["content"] == "No review content provided"
+    assert row["score"] == 0
+    assert row["thumbs_up_count"] == 1234
+    assert row["reviewed_at"] == datetime(2025, 1, 3)
+    assert row["reply_content"] == NO_REPLY_CONTENT
+    assert row["replied_at"] is None
+    assert row["review_id"] == make_review_id(APP_ID, "Anonymous", "January 3, 2025", "No review content provided")
+
+
+def test_normalize_reviews_drops_duplicates_and_truncates():
+    review = {"username": "x" * 300, "content": "y" * 20000, "score": "4", "reviewedat": "not a date"}
+
+    rows = normalize_reviews(APP_ID, [review, dict(review)])
+
+    assert len(rows) == 1
+    row = as_dict(rows[0])
+    assert len(row["user_name"]) == 255
+    assert len(row["content"]) == 10000
+    assert row["score"] == 4
+    assert row["reviewed_at"] is None
+
+
+def test_normalize_reviews_keeps_exact_network_timestamps(rpc_body):
+    rows = normalize_reviews(APP_ID, extract_reviews_from_rpc(rpc_body("first_page")))
+
+    row = as_dict(rows[0])
+    assert row["reviewed_at"] == datetime(2025, 1, 1, 23, 59)
+    assert row["replied_at"] == datetime(2025, 1, 3)
+    assert row["thumbs_up_count"] == 12
+
+
+def test_review_ids_match_between_cards_and_network():
+    # Both sources render the date in REVIEW_DATE_TIMEZONE, so the same review gets the same ID,
+    # even for a review posted a minute before midnight UTC
+    from benchmarks.mock_play_store import rpc_response
+
+    reviews = [review_array(APP_ID, index) for index in range(20)]
+    cards = parse_reviews("".join(review_card_html(review) for review in reviews))
+    network = extract_reviews_from_rpc(rpc_response(APP_ID, 0, 20, 20))
+
+    card_ids = [row[ROW_REVIEW_ID] for row in normalize_reviews(APP_ID, cards)]
+    network_ids = [row[ROW_REVIEW_ID] for row in normalize_reviews(APP_ID, network)]
+    assert card_ids == network_ids
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_parse_review_rows_backends_agree(backend):
+    html = review_page_html(APP_ID, 50)
+
+    rows = parse_review_rows(APP_ID, html, backend)
+
+    assert rows == parse_review_rows(APP_ID, html, "bs4")
+    assert len(rows) == 50
+    assert all(len(row) == len(REVIEW_COLUMNS) for row in rows)
+
+
+def test_parse_review_rows_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        parse_review_rows(APP_ID, "<div></div>", "regex")
+
+
+def test_row_key():
+    row = parse_review_rows(APP_ID, review_page_html(APP_ID, 1))[0]
+
+    assert row_key(row) == (row[ROW_REVIEW_ID], row[ROW_REVIEWED_AT])
+
+
+def test_cut_at_high_water_mark_by_review_id():
+    rows = parse_review_rows(APP_ID, review_page_html(APP_ID, 10))
+    mark = {"newest_review_id": rows[4][ROW_REVIEW_ID], "newest_reviewed_at": None}
+
+    kept, reached = cut_at_high_water_mark(rows, mark)
+
+    assert kept == rows[:4]
+    assert reached
+
+
+def test_cut_at_high_water_mark_by_day():
+    rows = normalize_reviews(APP_ID, [
+        {"username": "a", "content": "newest", "reviewedat": "January 3, 2025"},
+        {"username": "b", "content": "same day", "reviewedat": "January 2, 2025"},
+        {"username": "c", "content": "older", "reviewedat": "January 1, 2025"},
+    ])
+    mark = {"newest_review_id": "unknown", "newest_reviewed_at": datetime(2025, 1, 2, 18, 30)}
+
+    kept, reached = cut_at_high_water_mark(rows, mark)
+
+    # Same-day reviews are kept, since rendered dates have no time of day
+    assert [as_dict(row)["content"] for row in kept] == ["newest", "same day"]
+    assert reached
+
+
+def test_cut_at_high_water_mark_not_reached():
+    rows = parse_review_rows(APP_ID, review_page_html(APP_ID, 5))
+
+    kept, reached = cut_at_high_water_mark(rows, {"newest_review_id": "unknown", "newest_reviewed_at": None})
+
+    assert kept == rows
+    assert not reached
+
+
+@pytest.mark.parametrize("kind", ["inline", "thread", "process"])
+def test_run_parser_in_each_executor(kind):
+    html = review_page_html(APP_ID, 20)
+    executor = create_parse_executor(kind, workers=1)
+
+    async def parse():
+        return await run_parser(executor, parse_review_rows, APP_ID, html)
+
+    try:
+        assert asyncio.run(parse()) == parse_review_rows(APP_ID, html)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def test_create_parse_executor_rejects_unknown_kind():
+    with pytest.raises(ValueError):
+        create_parse_executor("fiber")
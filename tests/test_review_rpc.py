@@ -0,0 +1,97 @@
+import json
+from datetime import datetime
+from urllib.parse import urlencode
+from zoneinfo import ZoneInfo
+
+import review_rpc
+
+from review_rpc import (
+    REVIEWS_RPC_ID, SORT_MOST_RELEVANT, SORT_NEWEST, decode_review, decode_reviews_payload,
+    extract_reviews_from_rpc, iter_rpc_payloads, reviews_request_sort,
+)
+
+
+def test_iter_rpc_payloads_plain_response(rpc_body):
+    payloads = list(iter_rpc_payloads(rpc_body("first_page")))
+
+    assert [rpc_id for rpc_id, _ in payloads] == [REVIEWS_RPC_ID]
+
+
+def test_iter_rpc_payloads_chunked_response(rpc_body):
+    payloads = list(iter_rpc_payloads(rpc_body("chunked")))
+
+    # Chunk lengths, "di"/"af.httprm" frames and the trailing "e" frame are skipped
+    assert [rpc_id for rpc_id, _ in payloads] == ["oCPfdb", REVIEWS_RPC_ID]
+
+
+def test_iter_rpc_payloads_ignores_garbage():
+    assert list(iter_rpc_payloads(")]}'\n\n12\n[not json\n")) == []
+    assert list(iter_rpc_payloads("")) == []
+
+
+def test_decode_reviews_payload_returns_token(rpc_body):
+    _, payload = next(iter_rpc_payloads(rpc_body("first_page")))
+    reviews, token = decode_reviews_payload(payload)
+
+    assert [review["reviewid"] for review in reviews] == ["gp:AOqpTOE1", "gp:AOqpTOE2", "gp:AOqpTOE3"]
+    assert token == "CpEBCo4BKmwKfvfCl2pmmNO"
+
+
+def test_decode_reviews_payload_last_page(rpc_body):
+    _, payload = next(iter_rpc_payloads(rpc_body("last_page")))
+    reviews, token = decode_reviews_payload(payload)
+
+    assert len(reviews) == 1
+    assert token is None
+
+
+def test_decode_review_fields(rpc_body):
+    review = extract_reviews_from_rpc(rpc_body("first_page"))[0]
+
+    assert review == {
+        "username": "Jane Doe",
+        "content": "Works great after the last update.",
+        "score": "5",
+        "thumbsupcount": "12",
+        "reviewedat": "January 1, 2025",
+        "repliedcontent": "Thanks for the kind words!",
+        "reviewid": "gp:AOqpTOE1",
+        "reviewedts": datetime(2025, 1, 1, 23, 59),
+        "repliedts": datetime(2025, 1, 3),
+    }
+
+
+def test_decode_review_renders_date_in_review_timezone(rpc_body, monkeypatch):
+    # The page renders dates in the browser's timezone, which play9 pins to REVIEW_DATE_TIMEZONE
+    monkeypatch.setattr(review_rpc, "_review_date_zone", ZoneInfo("Asia/Tokyo"))
+
+    review = extract_reviews_from_rpc(rpc_body("first_page"))[0]
+
+    assert review["reviewedat"] == "January 2, 2025"
+    assert review["reviewedts"] == datetime(2025, 1, 1, 23, 59)  # Stored in UTC either way
+
+
+def test_decode_review_missing_fields(rpc_body):
+    review = extract_reviews_from_rpc(rpc_body("first_page"))[2]
+
+    assert review["username"] is None
+    assert review["repliedcontent"] is None
+    assert review["repliedts"] is None
+    assert decode_review("not a review") is None
+
+
+def test_extract_reviews_from_rpc_skips_other_rpcs(rpc_body):
+    assert extract_reviews_from_rpc(rpc_body("chunked")) == extract_reviews_from_rpc(rpc_body("first_page"))
+
+
+def reviews_request_body(sort: int) -> str:
+    # Form body of the reviews RPC as the dialog sends it
+    params = [None, None, [2, sort, [20, None, None], None, []], ["com.example.app", 7]]
+    f_req = [[[REVIEWS_RPC_ID, json.dumps(params), None, "generic"]]]
+    return urlencode({"f.req": json.dumps(f_req)})
+
+
+def test_reviews_request_sort():
+    assert reviews_request_sort(reviews_request_body(SORT_NEWEST)) == SORT_NEWEST
+    assert reviews_request_sort(reviews_request_body(SORT_MOST_RELEVANT)) == SORT_MOST_RELEVANT
+    assert reviews_request_sort("unreadable") is None
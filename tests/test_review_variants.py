@@ -0,0 +1,115 @@
+import asyncio
+from urllib.parse import urlencode
+
+import pytest
+
+from http_scraper import build_reviews_request
+from review_rpc import SORT_MOST_RELEVANT, SORT_NEWEST, apply_review_filters, reviews_request_sort
+from review_variants import merge_review_streams, normalize_variants
+
+
+def review(index: int, **fields) -> dict:
+    return {"reviewid": f"gp:{index}", "username": f"User {index}", "content": "text", **fields}
+
+
+def stream_of(pages, fail: bool = False):
+    """
+    Returns an open_stream callable yielding `pages` (lists of review indexes) for every variant.
+    """
+    def open_stream(variant, variant_stats):
+        async def stream():
+            for page in pages[variant["lang"]]:
+                variant_stats["pages_fetched"] = variant_stats.get("pages_fetched", 0) + 1
+                yield [review(index) for index in page]
+                await asyncio.sleep(0)
+            if fail and variant["lang"] == "de":
+                raise RuntimeError("blocked")
+            variant_stats["stop_reason"] = "exhausted"
+        return stream()
+    return open_stream
+
+
+def merge(variants, open_stream, **options) -> tuple:
+    async def run():
+        stats = {}
+        batches = [batch async for batch in merge_review_streams(variants, open_stream, stats=stats, **options)]
+        return batches, stats
+    return asyncio.run(run())
+
+
+VARIANTS = normalize_variants([{"lang": "en"}, {"lang": "de"}])
+
+
+def test_merge_review_streams_drops_duplicates():
+    pages = {"en": [[0, 1, 2], [3, 4]], "de": [[2, 3], [5, 6]]}
+
+    batches, stats = merge(VARIANTS, stream_of(pages), batch_size=1)
+
+    ids = [review["reviewid"] for batch in batches for review in batch]
+    assert sorted(ids) == [f"gp:{index}" for index in range(7)]
+    assert stats["reviews_loaded"] == 7
+    assert stats["pages_fetched"] == 4
+    assert stats["stop_reason"] == "exhausted"
+    assert stats["variants"] == {"en-us/newest": "exhausted", "de-us/newest": "exhausted"}
+
+
+def test_merge_review_streams_dedupes_without_review_ids():
+    def open_stream(variant, variant_stats):
+        async def stream():
+            yield [{"username": "Jane", "reviewedat": "January 1, 2025", "content": "same"}]
+        return stream()
+
+    batches, _ = merge(VARIANTS, open_stream)
+
+    assert sum(len(batch) for batch in batches) == 1
+
+
+def test_merge_review_streams_stops_at_target():
+    pages = {"en": [list(range(0, 10)), list(range(10, 20))], "de": [list(range(20, 30))]}
+
+    batches, stats = merge(VARIANTS, stream_of(pages), batch_size=100, target_reviews=12, concurrency=1)
+
+    assert sum(len(batch) for batch in batches) == 12
+    assert stats["reviews_loaded"] == 12
+    assert stats["stop_reason"] == "target_reached"
+
+
+def test_merge_review_streams_skips_a_failing_variant():
+    pages = {"en": [[0, 1]], "de": [[2]]}
+
+    batches, stats = merge(VARIANTS, stream_of(pages, fail=True))
+
+    assert sum(len(batch) for batch in batches) == 3
+    assert stats["variants"]["de-us/newest"] == "error"
+
+
+def test_merge_review_streams_fails_if_every_variant_fails():
+    def open_stream(variant, variant_stats):
+        async def stream():
+            raise RuntimeError("blocked")
+            yield
+        return stream()
+
+    with pytest.raises(RuntimeError):
+        merge(VARIANTS, open_stream)
+
+
+def test_normalize_variants_validates_and_dedupes():
+    assert normalize_variants([{"lang": "en"}, {"lang": "en", "sort": "newest"}]) == [
+        {"lang": "en", "country": "us", "sort": "newest", "stars": None},
+    ]
+    with pytest.raises(ValueError):
+        normalize_variants([{"sort": "oldest"}])
+    with pytest.raises(ValueError):
+        normalize_variants([{"stars": 6}])
+
+
+def test_apply_review_filters_rewrites_the_page_request():
+    # A variant page rewrites the dialog's own reviews requests to its sort and star filter
+    body = urlencode(build_reviews_request("com.example.app", sort=SORT_MOST_RELEVANT, count=20))
+
+    filtered = apply_review_filters(body, sort=SORT_NEWEST, stars=4)
+
+    assert reviews_request_sort(filtered) == SORT_NEWEST
+    assert "%5Bnull%2C4%5D" in filtered  # [null,4] star filter
+    assert apply_review_filters("unreadable", sort=SORT_NEWEST) == "unreadable"
@@ -1,10 +1,18 @@
 import asyncio
 import logging
+import signal
 from arq import create_pool, Worker
 from arq.connections import RedisSettings
-from scraping_task import scrape_reviews_task  # Import your task
-from database import get_status_pool  # Database connection pool
-from datetime import datetime,timezone
+from scraping_task import JOB_TIMEOUT, scrape_reviews_task  # Import your task
+from database import close_db
+from browser_pool import BrowserPool
+from http_scraper import HttpReviewFetcher
+from rate_limit import RedisTokenBucket
+from snapshot_store import SnapshotStore
+from review_rows import create_parse_executor
+from job_cache import QUEUE_NAMES
+from metrics import BROWSER_RSS_MB
+from prometheus_client import start_http_server
 import os
 
 # Set up logging to track progress
@@ -18,59 +26,123 @@ REDIS_SETTINGS = RedisSettings(
     password=os.getenv("REDIS_PASSWORD", None)
 )
 
+# Browser pool settings
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+BROWSER_MAX_JOBS = int(os.getenv("BROWSER_MAX_JOBS", "50"))  # Relaunch a browser after this many jobs
+BROWSER_MAX_RSS_MB = int(os.getenv("BROWSER_MAX_RSS_MB", "1024"))  # ...or once it uses this much memory
+
+# HTTP backend settings
+HTTP_MAX_CONCURRENCY = int(os.getenv("HTTP_MAX_CONCURRENCY", "8"))  # Review requests in flight across all jobs
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+
+# Scheduler settings
+PLAY_STORE_RATE = float(os.getenv("PLAY_STORE_RATE", "5"))  # Play Store requests per second, across all workers
+PLAY_STORE_BURST = int(os.getenv("PLAY_STORE_BURST", "10"))
+HIGH_PRIORITY_RESERVED = int(os.getenv("HIGH_PRIORITY_RESERVED", "1"))  # Browsers only high priority jobs use
+
+# Port of this worker's Prometheus endpoint; 0 disables it
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+
+async def create_shared_resources(redis) -> dict:
+    """
+    Creates the resources shared by the high and low priority workers of this process.
+    """
+    browser_pool = BrowserPool(
+        size=BROWSER_POOL_SIZE,
+        max_jobs_per_browser=BROWSER_MAX_JOBS,
+        max_rss_mb=BROWSER_MAX_RSS_MB,
+    )
+    await browser_pool.start()
+    rate_limiter = RedisTokenBucket(redis, rate=PLAY_STORE_RATE, capacity=PLAY_STORE_BURST)
+    http_fetcher = HttpReviewFetcher(
+        max_concurrency=HTTP_MAX_CONCURRENCY,
+        max_retries=HTTP_MAX_RETRIES,
+        rate_limiter=rate_limiter,
+    )
+    return {
+        "browser_pool": browser_pool,
+        "http_fetcher": http_fetcher,
+        "rate_limiter": rate_limiter,
+        "snapshot_store": SnapshotStore.from_env(),
+        "parse_executor": create_parse_executor(),  # PARSE_EXECUTOR and PARSE_WORKERS, see review_rows
+    }
+
+async def close_shared_resources(resources: dict):
+    browser_pool = resources.get("browser_pool")
+    if browser_pool:
+        await browser_pool.close()
+    http_fetcher = resources.get("http_fetcher")
+    if http_fetcher:
+        await http_fetcher.close()
+    parse_executor = resources.get("parse_executor")
+    if parse_executor:
+        parse_executor.shutdown(wait=True, cancel_futures=True)
+    await close_db()
+
+def queue_max_jobs(capacity: int, reserved: int = HIGH_PRIORITY_RESERVED) -> dict:
+    """
+    Splits the browser pool's capacity between the priority queues: `reserved` browsers for high
+    priority jobs, the rest for low priority ones, so interactive requests never wait behind a
+    nightly crawl. The limits add up to the pool size, so no job waits for a browser while its
+    JOB_TIMEOUT runs.
+    """
+    if not 1 <= reserved < capacity:
+        raise ValueError(
+            f"HIGH_PRIORITY_RESERVED must be at least 1 and less than BROWSER_POOL_SIZE "
+            f"(got {reserved} of {capacity} browsers)"
+        )
+    return {
+        "high": reserved,
+        "low": capacity - reserved,
+    }
+
 async def startup(ctx):
     logger.info("Arq worker starting...")
 
 async def shutdown(ctx):
     logger.info("Arq worker shutting down...")
 
-async def update_job_status(job_id: str, status: str, error_message: str = None, total_reviews: int = None):
-    """
-    Updates the job status in the database. Returns a response indicating success.
-    """
-    try:
-        # Get a connection pool
-        pool = await get_status_pool()
-
-        # Acquire a connection from the pool
-        async with pool.acquire() as conn:
-            # Get the current UTC time
-            current_time = datetime.now(timezone.utc)
-
-            # Determine completion time
-            completed_at = current_time if status in ['completed', 'failed'] else None
-
-            # Update the scrape_jobs table
-            await conn.execute('''
-                UPDATE scrape_jobs 
-                SET status = $1,
-                    error_message = $2,
-                    total_reviews = COALESCE($3, total_reviews),
-                    completed_at = $4
-                WHERE job_id = $5
-            ''', status, error_message, total_reviews, completed_at, job_id)
-
-        # Explicitly return a success response
-        return {"status": "success", "message": "Job status updated successfully"}
-
-    except Exception as e:
-        # Log the error (optional) and return a failure response
-        logger.error(f"Error updating job status: {e}")
-        return {"status": "error", "message": str(e)}
-
 async def main():
+    max_jobs = queue_max_jobs(BROWSER_POOL_SIZE)  # Rejects a reservation the pool cannot hold
     redis = await create_pool(REDIS_SETTINGS)
+    resources = await create_shared_resources(redis)
+    if WORKER_METRICS_PORT:
+        # Sampled on every scrape of /metrics, from the exporter's own thread
+        BROWSER_RSS_MB.set_function(resources["browser_pool"].rss_mb)
+        start_http_server(WORKER_METRICS_PORT)
+        logger.info(f"Serving worker metrics on port {WORKER_METRICS_PORT}")
 
-    # Worker setup to listen for incoming scraping tasks
-    worker = Worker(
-        functions=[scrape_reviews_task],  # Register scrape_reviews_task function
-        on_startup=startup,
-        on_shutdown=shutdown,
-        redis_settings=REDIS_SETTINGS,
-    )
+    # One worker per priority queue, sharing the browser pool, HTTP client and rate limit
+    workers = [
+        Worker(
+            functions=[scrape_reviews_task],  # Register scrape_reviews_task function
+            on_startup=startup,
+            on_shutdown=shutdown,
+            redis_settings=REDIS_SETTINGS,
+            queue_name=QUEUE_NAMES[priority],
+            max_jobs=max_jobs[priority],
+            job_timeout=JOB_TIMEOUT,  # arq's default of 300s is shorter than a scrape's time budget
+            ctx=dict(resources),
+            handle_signals=False,  # Handled below for both workers at once
+        )
+        for priority in ("high", "low")
+    ]
 
-    # Run the worker
-    await worker.main()
+    # Run the workers until the process is asked to stop
+    runner = asyncio.gather(*(worker.main() for worker in workers))
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, runner.cancel)
+
+    try:
+        await runner
+    except asyncio.CancelledError:
+        logger.info("Stopping the workers...")
+    finally:
+        for worker in workers:
+            await worker.close()
+        await close_shared_resources(resources)
+        await redis.close()
 
 if __name__ == '__main__':
     logger.info("Starting the worker...")